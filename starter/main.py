@@ -2,43 +2,245 @@
 FastAPI application for Census Income Classification Model.
 """
 
+import asyncio
+import logging
 import os
 import sys
+import time
+from contextlib import asynccontextmanager
 
 # Add the starter directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'starter'))
 
-from fastapi import FastAPI  # noqa: E402
-from pydantic import BaseModel, Field  # noqa: E402
-import pandas as pd  # noqa: E402
+from typing import Annotated, List, Optional  # noqa: E402
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request  # noqa: E402
+from fastapi.exceptions import RequestValidationError  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+from pydantic import BaseModel, Field, ValidationError, model_validator  # noqa: E402
+
+from ml.dataset import CATEGORICAL_FEATURES, CONTINUOUS_FEATURES  # noqa: E402
+from serving.batching import MicroBatcher  # noqa: E402
+from serving.cache import PredictionCache, RedisBackend, record_key  # noqa: E402
+from serving.codecs import (  # noqa: E402
+    ARROW,
+    JSON,
+    MSGPACK,
+    FastJSONResponse,
+    UnsupportedMediaType,
+    decode_body,
+    encode_response,
+    media_type,
+    negotiate,
+)
+from serving.compression import CompressionMiddleware  # noqa: E402
+from serving.executor import ExecutorSaturated, InferenceExecutor  # noqa: E402
+from serving.metrics import (  # noqa: E402
+    CONTENT_TYPE,
+    SIZE_BUCKETS,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsMiddleware,
+    MetricsRegistry,
+    StageTimer,
+    get_timer,
+)
+from serving.predictor import Predictor  # noqa: E402
+from serving.registry import ModelLoadError, ModelRegistry  # noqa: E402
+
+# Upper bound on the number of rows accepted by /predict/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10000"))
+
+# Micro-batching of concurrent /predict requests: how long to wait for more
+# rows after the first one arrives, and how many rows to score at once
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("MICRO_BATCH_WINDOW_MS", "2"))
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", "64"))
+
+# Where inference runs: "inline" (on the event loop), "thread" (bounded thread
+# pool) or "process" (process pool with preloaded model copies). Calls beyond
+# INFERENCE_MAX_PENDING are rejected with 503.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_MAX_PENDING = int(os.environ.get("INFERENCE_MAX_PENDING", "128"))
+
+# Prediction cache: number of entries kept in process (0 disables caching),
+# entry lifetime in seconds, and an optional Redis-compatible server shared by
+# all workers
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_URL = os.environ.get("PREDICTION_CACHE_URL")
+
+# Model used for inference: "pickle" (sklearn model.pkl) or "compiled"
+# (flat-array CompiledForest in model/forest, identical predictions)
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "pickle")
+
+# Forest served: "full" (model.pkl) or "compact" (model_compact.pkl written
+# next to it by starter/compress_model.py: fewer, smaller trees). Versions
+# without an up-to-date compact model serve their full model instead
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "full")
+
+# joblib workers used by the pickled forest, which was trained with
+# n_jobs=-1: calls scoring fewer than SERVING_BATCH_MIN_ROWS rows use
+# SERVING_N_JOBS, larger ones SERVING_BATCH_N_JOBS (-1: all CPUs, capped by
+# LOKY_MAX_CPU_COUNT). The compiled forest is not affected.
+SERVING_N_JOBS = int(os.environ.get("SERVING_N_JOBS", "1"))
+SERVING_BATCH_N_JOBS = int(os.environ.get("SERVING_BATCH_N_JOBS", "-1"))
+SERVING_BATCH_MIN_ROWS = int(os.environ.get("SERVING_BATCH_MIN_ROWS", "1000"))
+
+# Hot reload: seconds between checks of model/ for a new version (0 disables),
+# number of loaded versions kept in memory for rollbacks, and the token
+# required by the /admin endpoints (unset: no token needed)
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "5"))
+MODEL_KEEP_VERSIONS = int(os.environ.get("MODEL_KEEP_VERSIONS", "2"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Compression: responses of at least COMPRESSION_MIN_SIZE bytes are gzip- or
+# zstd-compressed when the client accepts it, and compressed request bodies
+# may expand to at most MAX_REQUEST_BODY_BYTES
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+MAX_REQUEST_BODY_BYTES = int(os.environ.get("MAX_REQUEST_BODY_BYTES", str(64 * 2 ** 20)))
+
+# Record scored to validate every model version before it goes live
+SMOKE_RECORD = {
+    "age": 37,
+    "workclass": "Private",
+    "fnlgt": 178356,
+    "education": "HS-grad",
+    "education-num": 10,
+    "marital-status": "Married-civ-spouse",
+    "occupation": "Prof-specialty",
+    "relationship": "Husband",
+    "race": "White",
+    "sex": "Male",
+    "capital-gain": 0,
+    "capital-loss": 0,
+    "hours-per-week": 40,
+    "native-country": "United-States",
+}
+
+# Messages go through uvicorn's error logger so that they show up in its output
+logger = logging.getLogger("uvicorn.error").getChild("census")
+
+
+def load_predictor(path):
+    """Load one model version with the serving parallelism applied."""
+    predictor = Predictor.from_dir(path, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, MODEL_FORMAT, MODEL_VARIANT)
+    predictor.set_parallelism(SERVING_N_JOBS, SERVING_BATCH_N_JOBS, SERVING_BATCH_MIN_ROWS)
+    return predictor
+
+
+# Load the newest model version at startup; later versions are swapped in
+# by the registry without a restart
+model_dir = os.path.join(os.path.dirname(__file__), "model")
+registry = ModelRegistry(
+    model_dir,
+    load_fn=lambda path: load_predictor(path),
+    smoke_records=[SMOKE_RECORD],
+    keep=MODEL_KEEP_VERSIONS
+)
+registry.load_latest()
+executor = InferenceExecutor(
+    registry.predictor,
+    backend=INFERENCE_BACKEND,
+    max_workers=INFERENCE_WORKERS,
+    max_pending=INFERENCE_MAX_PENDING
+)
+registry.on_swap = executor.swap
+cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    # Entries are dropped as soon as another model version becomes active
+    cache = PredictionCache(
+        maxsize=PREDICTION_CACHE_SIZE,
+        ttl=PREDICTION_CACHE_TTL,
+        fingerprint_fn=lambda: registry.version,
+        backend=RedisBackend(PREDICTION_CACHE_URL) if PREDICTION_CACHE_URL else None,
+        check_interval=0.0
+    )
+
+# Metrics exposed on /metrics in the Prometheus text format
+metrics = MetricsRegistry()
+http_requests = metrics.register(Counter(
+    "census_http_requests_total", "HTTP requests by method, route and status",
+    ("method", "path", "status")
+))
+http_errors = metrics.register(Counter(
+    "census_http_errors_total", "HTTP requests answered with a 4xx or 5xx status",
+    ("method", "path", "status")
+))
+http_latency = metrics.register(Histogram(
+    "census_http_request_duration_seconds", "End-to-end request latency",
+    ("method", "path")
+))
+stage_latency = metrics.register(Histogram(
+    "census_stage_duration_seconds", "Time spent per request in each serving stage",
+    ("stage",)
+))
+batch_sizes = metrics.register(Histogram(
+    "census_inference_batch_size", "Rows per inference call, by source",
+    ("source",), buckets=SIZE_BUCKETS
+))
+scored_rows = metrics.register(Counter(
+    "census_scored_rows_total", "Rows scored by the model, by source",
+    ("source",)
+))
+metrics.register(Gauge(
+    "census_inference_pending", "Inference calls queued or running", lambda: executor.pending
+))
+
+
+# Readiness of this worker process: set once the inference pool has scored
+# the smoke record, cleared when shutting down
+worker_state = {"ready": False, "since": None}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Warm up inference and watch for new model versions while serving; release the worker pool on shutdown."""
+    watcher = None
+    if MODEL_RELOAD_INTERVAL > 0:
+        watcher = asyncio.create_task(registry.watch(MODEL_RELOAD_INTERVAL))
+    logger.info(
+        "Model %s (%s, %s): n_jobs=%d below %d rows, n_jobs=%d from %d rows; "
+        "inference backend %s with %s workers, at most %d pending calls",
+        registry.version, registry.predictor.model_variant, MODEL_FORMAT, SERVING_N_JOBS, SERVING_BATCH_MIN_ROWS,
+        SERVING_BATCH_N_JOBS, SERVING_BATCH_MIN_ROWS, INFERENCE_BACKEND, INFERENCE_WORKERS,
+        INFERENCE_MAX_PENDING
+    )
+    await executor.call("score_records", [SMOKE_RECORD])
+    worker_state.update(ready=True, since=time.time())
+    yield
+    worker_state.update(ready=False, since=time.time())
+    if watcher is not None:
+        watcher.cancel()
+    executor.shutdown()
 
-from ml.model import inference, load_model, load_encoder  # noqa: E402
-from ml.data import process_data  # noqa: E402
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Census Income Classification API",
     description="Predict whether income exceeds $50K/yr based on census data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+# Added first so that it runs inside MetricsMiddleware, which then also
+# times decompression and compression
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    zstd_level=COMPRESSION_ZSTD_LEVEL,
+    max_body_size=MAX_REQUEST_BODY_BYTES
+)
+app.add_middleware(
+    MetricsMiddleware,
+    requests=http_requests,
+    errors=http_errors,
+    latency=http_latency,
+    stage_histogram=stage_latency
 )
-
-# Load model and encoders at startup
-model_dir = os.path.join(os.path.dirname(__file__), "model")
-model = load_model(os.path.join(model_dir, "model.pkl"))
-encoder = load_encoder(os.path.join(model_dir, "encoder.pkl"))
-lb = load_encoder(os.path.join(model_dir, "lb.pkl"))
-
-# Categorical features for processing
-cat_features = [
-    "workclass",
-    "education",
-    "marital-status",
-    "occupation",
-    "relationship",
-    "race",
-    "sex",
-    "native-country",
-]
 
 
 class CensusData(BaseModel):
@@ -64,9 +266,165 @@ class CensusData(BaseModel):
     native_country: str = Field(..., alias="native-country", json_schema_extra={"example": "United-States"})
 
 
+class CensusColumns(BaseModel):
+    """
+    Columnar census payload: one list per feature, all of the same length.
+    Uses the same hyphenated aliases as CensusData.
+    """
+    model_config = {"populate_by_name": True}
+
+    age: List[int]
+    workclass: List[str]
+    fnlgt: List[int]
+    education: List[str]
+    education_num: List[int] = Field(..., alias="education-num")
+    marital_status: List[str] = Field(..., alias="marital-status")
+    occupation: List[str]
+    relationship: List[str]
+    race: List[str]
+    sex: List[str]
+    capital_gain: List[int] = Field(..., alias="capital-gain")
+    capital_loss: List[int] = Field(..., alias="capital-loss")
+    hours_per_week: List[int] = Field(..., alias="hours-per-week")
+    native_country: List[str] = Field(..., alias="native-country")
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        """All columns must describe the same number of rows."""
+        lengths = {len(values) for values in self.__dict__.values()}
+        if len(lengths) != 1:
+            raise ValueError("All columns must have the same length")
+        return self
+
+    def __len__(self):
+        return len(self.age)
+
+
+class BatchPredictionRequest(BaseModel):
+    """
+    Request model for batch predictions.
+    Exactly one of `records` (row-oriented) or `columns` (columnar) must be given.
+    """
+    records: Optional[List[CensusData]] = Field(
+        None, description="List of census records, one per row"
+    )
+    columns: Optional[CensusColumns] = Field(
+        None, description="Columnar payload with one list per feature"
+    )
+
+    @model_validator(mode="after")
+    def check_payload(self):
+        """Require exactly one non-empty payload."""
+        if (self.records is None) == (self.columns is None):
+            raise ValueError("Provide exactly one of 'records' or 'columns'")
+        if len(self.records if self.records is not None else self.columns) == 0:
+            raise ValueError("Batch must contain at least one row")
+        return self
+
+    def __len__(self):
+        return len(self.records if self.records is not None else self.columns)
+
+
 class PredictionResponse(BaseModel):
     """Response model for predictions."""
     prediction: str = Field(..., description="Predicted salary class: '>50K' or '<=50K'")
+    probability: Optional[float] = Field(
+        None, description="Probability of '>50K', only returned when return_proba=true"
+    )
+
+
+class BatchPredictionResponse(BaseModel):
+    """Response model for batch predictions."""
+    predictions: List[str] = Field(..., description="Predicted salary classes, in input order")
+    probabilities: Optional[List[float]] = Field(
+        None, description="Probabilities of '>50K', only returned when return_proba=true"
+    )
+
+
+async def score_records(rows, timer=None, source="records"):
+    """
+    Score a list of census rows with one vectorized pipeline call.
+
+    Args:
+        rows: List of validated records, keyed by the hyphenated column names
+        timer: Optional StageTimer receiving the pipeline's stage durations
+        source: Label of the batch size metrics
+
+    Returns:
+        list: (label, probability of '>50K') pairs, in input order
+    """
+    batch_sizes.observe(len(rows), source)
+    scored_rows.inc(source, amount=len(rows))
+    labels, scores = await executor.call("score_records", rows, timer=timer)
+    return [(str(label), float(score)) for label, score in zip(labels, scores)]
+
+
+async def score_micro_batch(rows):
+    """
+    Score one micro-batch of /predict rows.
+
+    Args:
+        rows: List of validated records, keyed by the hyphenated column names
+
+    Returns:
+        list: (label, probability of '>50K', stage durations of the batch) triples
+    """
+    timer = StageTimer()
+    scored = await score_records(rows, timer, source="predict")
+    return [(label, probability, timer.durations) for label, probability in scored]
+
+
+async def score_rows_cached(rows, timer=None):
+    """
+    Score census rows, computing only those missing from the prediction cache.
+
+    Args:
+        rows: List of validated records, keyed by the hyphenated column names
+        timer: Optional StageTimer receiving the cache and pipeline stage durations
+
+    Returns:
+        list: (label, probability of '>50K') pairs, in input order
+    """
+    if cache is None:
+        return await score_records(rows, timer)
+    
+    timer = timer if timer is not None else StageTimer()
+    with timer.stage("cache"):
+        keys = [record_key(row) for row in rows]
+        lookups = [cache.get(key) for key in keys]
+        results = [result for result, _ in lookups]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        scored = await score_records([rows[i] for i in missing], timer)
+        with timer.stage("cache"):
+            for i, result in zip(missing, scored):
+                results[i] = result
+                # Skipped if another model version became active meanwhile
+                cache.set(keys[i], list(result), lookups[i][1])
+    return [tuple(result) for result in results]
+
+
+batcher = MicroBatcher(
+    score_micro_batch,
+    max_batch_size=MICRO_BATCH_MAX_SIZE,
+    window_ms=MICRO_BATCH_WINDOW_MS
+)
+
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """Shed load with 503 when the inference queue is full."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Inference queue is full, retry later"},
+        headers={"Retry-After": "1"}
+    )
+
+
+async def require_admin(x_admin_token: Annotated[Optional[str], Header()] = None):
+    """Check the X-Admin-Token header when ADMIN_TOKEN is set."""
+    if ADMIN_TOKEN is not None and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
 
 
 @app.get("/")
@@ -84,51 +442,289 @@ async def welcome():
     }
 
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(data: CensusData):
+def worker_health():
+    """Identity and state of the worker process answering the request."""
+    return {
+        "worker": os.environ.get("WORKER_ID", "0"),
+        "pid": os.getpid(),
+        "ready": worker_state["ready"],
+        "since": worker_state["since"],
+        "model_version": registry.version,
+        "model_variant": registry.predictor.model_variant,
+        "inference_backend": executor.backend,
+        "pending": executor.pending,
+    }
+
+
+@app.get("/health")
+async def health():
+    """
+    Liveness check of the worker answering the request.
+    
+    Returns:
+        dict: Worker id, process id and readiness
+    """
+    return worker_health()
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """
+    Readiness check: 200 once this worker has warmed up its model, 503 before and while shutting down.
+    
+    Returns:
+        dict: Worker id, process id, readiness, active model version and pending inference calls
+    """
+    status = worker_health()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose request, latency and batch size metrics.
+    
+    Returns:
+        PlainTextResponse: Metrics in the Prometheus text exposition format
+    """
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Report prediction cache counters.
+    
+    Returns:
+        dict: Cache size, hits, misses, evictions and invalidations
+    """
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/admin/model", dependencies=[Depends(require_admin)])
+async def model_status():
+    """
+    Report the active model version.
+    
+    Returns:
+        dict: Active version, versions kept in memory, versions on disk and load failures
+    """
+    return registry.status()
+
+
+@app.post("/admin/model/reload", dependencies=[Depends(require_admin)])
+async def reload_model():
+    """
+    Load, validate and activate the newest model version now.
+    
+    Returns:
+        dict: Model status after the reload
+    """
+    try:
+        await asyncio.to_thread(registry.load_latest)
+    except ModelLoadError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return registry.status()
+
+
+@app.post("/admin/model/rollback", dependencies=[Depends(require_admin)])
+async def rollback_model(
+    version: Annotated[Optional[str], Query(
+        description="Version or version name to activate (default: the previously active one)"
+    )] = None
+):
+    """
+    Re-activate an earlier model version.
+    
+    Args:
+        version: Version to activate
+        
+    Returns:
+        dict: Model status after the rollback
+    """
+    try:
+        await asyncio.to_thread(registry.rollback, version)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=exc.args[0])
+    except ModelLoadError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return registry.status()
+
+
+# Query parameters shared by the prediction endpoints
+Threshold = Annotated[Optional[float], Query(
+    ge=0.0, le=1.0,
+    description="Predict '>50K' when its probability is at least this value "
+                "(default: the most probable class)"
+)]
+ReturnProba = Annotated[bool, Query(description="Also return the probability of '>50K'")]
+
+
+@app.post("/predict", response_model=PredictionResponse, response_model_exclude_none=True)
+async def predict(
+    data: CensusData,
+    request: Request,
+    threshold: Threshold = None,
+    return_proba: ReturnProba = False
+):
     """
     Perform model inference on provided census data.
     
     Args:
         data: Census data features
+        request: Incoming request, carrying its StageTimer
+        threshold: Optional decision threshold on the probability of '>50K'
+        return_proba: Whether to include the probability in the response
         
     Returns:
         PredictionResponse: Prediction result
     """
-    # Convert input data to DataFrame with correct column names
-    input_dict = {
-        'age': data.age,
-        'workclass': data.workclass,
-        'fnlgt': data.fnlgt,
-        'education': data.education,
-        'education-num': data.education_num,
-        'marital-status': data.marital_status,
-        'occupation': data.occupation,
-        'relationship': data.relationship,
-        'race': data.race,
-        'sex': data.sex,
-        'capital-gain': data.capital_gain,
-        'capital-loss': data.capital_loss,
-        'hours-per-week': data.hours_per_week,
-        'native-country': data.native_country
+    timer = get_timer(request)
+    timer.mark("parse")
+    row = data.model_dump(by_alias=True)
+    with timer.stage("cache"):
+        key = record_key(row) if cache is not None else None
+        cached, fingerprint = cache.get(key) if cache is not None else (None, None)
+    
+    if cached is None:
+        # Concurrent requests are grouped and scored together; the time not
+        # spent in the shared batch's stages was spent waiting for it
+        start = time.perf_counter()
+        prediction_label, probability, durations = await batcher.submit(row)
+        timer.update(durations)
+        timer.add("batch_wait", time.perf_counter() - start - sum(durations.values()))
+        if cache is not None:
+            cache.set(key, [prediction_label, probability], fingerprint)
+    else:
+        prediction_label, probability = cached
+    
+    if threshold is not None:
+        prediction_label = str(registry.predictor.apply_threshold([probability], threshold)[0])
+    
+    # Serialized directly, skipping response model validation
+    content = {"prediction": prediction_label}
+    if return_proba:
+        content["probability"] = probability
+    timer.mark()
+    return FastJSONResponse(content)
+
+
+def inline_schema(model):
+    """JSON schema of a model with its nested definitions inlined, for openapi_extra."""
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
+
+
+def parse_batch_request(body, content_type):
+    """
+    Validate a batch request body in any supported format.
+
+    JSON bodies are parsed and validated in one pass by pydantic; MessagePack
+    and Arrow bodies are decoded first.
+
+    Args:
+        body: Raw request body
+        content_type: Content-Type header of the request
+
+    Returns:
+        BatchPredictionRequest: Validated request
+    """
+    media = media_type(content_type)
+    if media is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type {content_type}")
+    try:
+        if media == JSON:
+            return BatchPredictionRequest.model_validate_json(body)
+        return BatchPredictionRequest.model_validate(decode_body(body, media))
+    except ValidationError as exc:
+        errors = [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        raise RequestValidationError(errors)
+    except UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.post(
+    "/predict/batch",
+    response_model=BatchPredictionResponse,
+    response_model_exclude_none=True,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                JSON: {"schema": inline_schema(BatchPredictionRequest)},
+                MSGPACK: {"schema": {"type": "string", "format": "binary"}},
+                ARROW: {"schema": {"type": "string", "format": "binary"}},
+            },
+        },
+        "responses": {"200": {"content": {
+            MSGPACK: {"schema": {"type": "string", "format": "binary"}},
+            ARROW: {"schema": {"type": "string", "format": "binary"}},
+        }}},
     }
+)
+async def predict_batch(
+    request: Request,
+    threshold: Threshold = None,
+    return_proba: ReturnProba = False
+):
+    """
+    Perform model inference on a batch of census records.
     
-    input_df = pd.DataFrame([input_dict])
+    The body is JSON, MessagePack (same structure) or an Arrow IPC stream
+    with one column per feature, as given by Content-Type. The response
+    format follows the Accept header.
     
-    # Process the data
-    X, _, _, _ = process_data(
-        input_df,
-        categorical_features=cat_features,
-        label=None,
-        training=False,
-        encoder=encoder,
-        lb=lb
-    )
+    Args:
+        request: Incoming request, carrying the body and its StageTimer
+        threshold: Optional decision threshold on the probability of '>50K'
+        return_proba: Whether to include probabilities in the response
+        
+    Returns:
+        BatchPredictionResponse: Predictions in input order
+    """
+    timer = get_timer(request)
+    data = parse_batch_request(await request.body(), request.headers.get("content-type"))
+    timer.mark("parse")
+    if len(data) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size {len(data)} exceeds the maximum of {MAX_BATCH_SIZE}"
+        )
     
-    # Make prediction
-    pred = inference(model, X)
+    if data.records is not None:
+        rows = [record.model_dump(by_alias=True) for record in data.records]
+        scored = await score_rows_cached(rows, timer)
+        labels = [label for label, _ in scored]
+        probabilities = [probability for _, probability in scored]
+    else:
+        batch_sizes.observe(len(data), "columns")
+        scored_rows.inc("columns", amount=len(data))
+        labels, probabilities = await executor.call(
+            "score_columns", data.columns.model_dump(by_alias=True), timer=timer
+        )
+        labels = [str(label) for label in labels]
+        probabilities = [float(probability) for probability in probabilities]
     
-    # Convert prediction back to label
-    prediction_label = lb.inverse_transform(pred)[0]
+    if threshold is not None:
+        labels = [str(label) for label in registry.predictor.apply_threshold(probabilities, threshold)]
     
-    return PredictionResponse(prediction=prediction_label)
+    content = {"predictions": labels}
+    if return_proba:
+        content["probabilities"] = probabilities
+    timer.mark()
+    return encode_response(content, negotiate(request.headers.get("accept")))
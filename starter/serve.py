@@ -0,0 +1,302 @@
+"""
+Multi-worker entry point for the FastAPI application.
+
+Usage: python serve.py [--workers N] [--host HOST] [--port PORT]
+
+The model is loaded once, in this process, before the workers are forked,
+so every worker shares the parent's copy of the artifacts copy-on-write.
+Workers default to one per available CPU, and the native thread pools used
+by numpy and joblib (and the API's inference pool) are pinned to the CPUs
+left per worker, so that workers do not oversubscribe the machine. A worker
+that exits is replaced by a fresh fork of the parent, after an exponential
+backoff; when too many restarts happen within a time window the server shuts
+down and exits with a non-zero status.
+"""
+
+import argparse
+import gc
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import time
+from collections import deque
+
+logger = logging.getLogger("serve")
+
+# Environment variables sizing the thread pools of one worker; they must be
+# set before numpy, scikit-learn and main are imported
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "LOKY_MAX_CPU_COUNT",
+    "INFERENCE_WORKERS",
+)
+
+# Default restart policy: at most this many worker restarts per window (in
+# seconds), each delayed by a backoff doubling from the base up to the maximum
+MAX_RESTARTS = 10
+RESTART_WINDOW = 60.0
+RESTART_BACKOFF = 0.5
+MAX_RESTART_BACKOFF = 30.0
+
+
+def _cgroup_cpu_limit():
+    """CPU quota of the container, or None when unlimited or unknown."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    """
+    Number of CPUs this process may use.
+
+    Takes the CPU affinity mask and any cgroup CPU quota into account, so
+    containers limited to fewer cores than the host get fewer workers.
+
+    Returns:
+        int: At least 1
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def plan_workers(cpus, workers=None):
+    """
+    Number of worker processes and threads per worker.
+
+    Args:
+        cpus: Available CPUs
+        workers: Requested number of workers (default: one per CPU)
+
+    Returns:
+        tuple: (workers, threads per worker)
+    """
+    workers = workers or cpus
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    return workers, max(1, cpus // workers)
+
+
+def pin_threads(threads, environ=os.environ):
+    """
+    Limit the native and inference thread pools of each worker.
+
+    Variables already set in the environment are left alone.
+
+    Args:
+        threads: Threads per worker
+        environ: Environment to update
+    """
+    for name in THREAD_ENV_VARS:
+        environ.setdefault(name, str(threads))
+
+
+class RestartLimiter:
+    """
+    Exponential backoff and a cap on worker restarts within a sliding window.
+
+    Args:
+        max_restarts: Restarts allowed within `window`
+        window: Length of the window, in seconds
+        backoff: Delay before a restart when none happened within the window
+        max_backoff: Upper bound on the delay
+        clock: Monotonic clock, in seconds
+    """
+
+    def __init__(self, max_restarts=MAX_RESTARTS, window=RESTART_WINDOW, backoff=RESTART_BACKOFF,
+                 max_backoff=MAX_RESTART_BACKOFF, clock=time.monotonic):
+        if max_restarts < 0 or window <= 0 or backoff < 0 or max_backoff < backoff:
+            raise ValueError("invalid restart policy")
+        self.max_restarts = max_restarts
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._restarts = deque()
+
+    def next_delay(self):
+        """
+        Record a restart and return how long to wait before it.
+
+        The delay doubles with every restart already made within the window.
+
+        Returns:
+            float: Seconds to wait, or None when the cap is reached
+        """
+        now = self.clock()
+        while self._restarts and now - self._restarts[0] >= self.window:
+            self._restarts.popleft()
+        if len(self._restarts) >= self.max_restarts:
+            return None
+        delay = min(self.max_backoff, self.backoff * 2 ** len(self._restarts))
+        self._restarts.append(now)
+        return delay
+
+
+def _run_worker(app, sock, index, log_level):
+    """Serve `app` on the shared socket until told to stop, then exit."""
+    import uvicorn
+
+    os.environ["WORKER_ID"] = str(index)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def serve(app, host, port, workers, log_level="info", limiter=None):
+    """
+    Fork `workers` processes serving `app` on one listening socket.
+
+    Returns when every worker has exited, either after SIGTERM or SIGINT or
+    because `limiter` refused a restart, in which case the remaining workers
+    are stopped.
+
+    Args:
+        app: ASGI application, already loaded in this process
+        host: Interface to bind
+        port: TCP port to bind
+        workers: Number of worker processes
+        log_level: uvicorn log level
+        limiter: RestartLimiter applied to exited workers (default: the
+            module's restart policy)
+
+    Returns:
+        int: 0 after a requested shutdown, 1 when the restart cap was hit
+    """
+    limiter = limiter or RestartLimiter()
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Keep the objects created while loading out of the collector's reach,
+    # so that collections in the workers do not write to shared pages
+    gc.freeze()
+
+    children = {}
+    stopping = False
+    exit_code = 0
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, index, log_level)
+        children[pid] = index
+        logger.info("Started worker %d (pid %d)", index, pid)
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def wait_unless_stopping(delay):
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+    handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        for index in range(workers):
+            spawn(index)
+
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = children.pop(pid, None)
+            if index is None or stopping:
+                continue
+            delay = limiter.next_delay()
+            if delay is None:
+                logger.error("Worker %d (pid %d) exited with status %d; more than %d restarts within %gs, "
+                             "shutting down", index, pid, status, limiter.max_restarts, limiter.window)
+                exit_code = 1
+                stop()
+                continue
+            logger.warning("Worker %d (pid %d) exited with status %d, restarting in %.1fs",
+                           index, pid, status, delay)
+            wait_unless_stopping(delay)
+            if not stopping:
+                spawn(index)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        sock.close()
+    return exit_code
+
+
+def main(argv=None):
+    """Main function to run the multi-worker server."""
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one loaded model.")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "0")) or None,
+                        help="Worker processes (default: $WEB_CONCURRENCY or one per available CPU)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--max-restarts", type=int, default=MAX_RESTARTS,
+                        help="Worker restarts allowed within --restart-window before the server exits "
+                             f"with status 1 (default: {MAX_RESTARTS})")
+    parser.add_argument("--restart-window", type=float, default=RESTART_WINDOW,
+                        help=f"Window for --max-restarts, in seconds (default: {RESTART_WINDOW:g})")
+    args = parser.parse_args(argv)
+    try:
+        limiter = RestartLimiter(args.max_restarts, args.restart_window)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    cpus = available_cpus()
+    workers, threads = plan_workers(cpus, args.workers)
+    pin_threads(threads)
+    logger.info("Serving with %d workers x %d threads on %d CPUs", workers, threads, cpus)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as api
+
+    if workers == 1:
+        import uvicorn
+
+        uvicorn.run(api.app, host=args.host, port=args.port, log_level=args.log_level)
+        return 0
+    return serve(api.app, args.host, args.port, workers, log_level=args.log_level, limiter=limiter)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,469 @@
+"""
+Load-testing and benchmark script for the prediction API.
+
+Usage: python starter/bench_api.py [options]
+
+Drives the FastAPI app either in-process (through httpx's ASGI transport,
+with the app's startup and shutdown run around the load), against a uvicorn
+server started for the run (--uvicorn) or against any running server (--url).
+The prediction cache is disabled for in-process and --uvicorn runs unless
+--prediction-cache is given; its hit ratio during the run is reported. Requests are drawn from census.csv according to a
+payload mix and sent by a fixed number of concurrent clients. Throughput and
+p50/p95/p99 latency are reported per payload kind and can be saved as JSON
+and compared against an earlier run to gate regressions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# Payload kinds: "predict" sends one record to /predict, "records" and
+# "columns" send --batch-size rows to /predict/batch in either layout
+PAYLOAD_KINDS = ("predict", "records", "columns")
+
+# Label column, dropped from the sampled rows
+LABEL = "salary"
+
+# Latency percentiles reported for every payload kind
+PERCENTILES = (50, 95, 99)
+
+STARTER_DIR = os.path.join(os.path.dirname(__file__), "..")
+DEFAULT_DATA_PATH = os.path.join(STARTER_DIR, "data", "census.csv")
+
+
+def load_rows(path, nrows=None):
+    """
+    Read census rows as JSON-ready records.
+
+    Args:
+        path: CSV with the census.csv schema
+        nrows: Optional number of rows to read
+
+    Returns:
+        list: Records keyed by the hyphenated column names, without the label
+    """
+    data = pd.read_csv(path, nrows=nrows, skipinitialspace=True)
+    return data.drop(columns=[LABEL], errors="ignore").to_dict(orient="records")
+
+
+def parse_mix(spec):
+    """
+    Parse a payload mix such as "predict=8,records=1,columns=1".
+
+    Args:
+        spec: Comma-separated kind=weight pairs; a bare kind has weight 1
+
+    Returns:
+        dict: Weight of each payload kind
+    """
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.strip().partition("=")
+        if kind not in PAYLOAD_KINDS:
+            raise ValueError(f"Unknown payload kind {kind!r}, expected one of {PAYLOAD_KINDS}")
+        mix[kind] = float(weight) if weight else 1.0
+        if mix[kind] < 0:
+            raise ValueError(f"Weight of {kind!r} must be non-negative")
+    if sum(mix.values()) <= 0:
+        raise ValueError("At least one payload kind needs a positive weight")
+    return mix
+
+
+def make_payload(kind, rows, rng, batch_size):
+    """
+    Build the (path, JSON body) of one request.
+
+    Args:
+        kind: Payload kind
+        rows: Records to sample from
+        rng: random.Random used for sampling
+        batch_size: Rows per batch request
+
+    Returns:
+        tuple: URL path and JSON body
+    """
+    if kind == "predict":
+        return "/predict", rng.choice(rows)
+    batch = rng.choices(rows, k=batch_size)
+    if kind == "records":
+        return "/predict/batch", {"records": batch}
+    return "/predict/batch", {"columns": {key: [row[key] for row in batch] for key in batch[0]}}
+
+
+def plan_requests(rows, mix, n_requests, batch_size=100, seed=0):
+    """
+    Draw the sequence of requests of one run.
+
+    Args:
+        rows: Records to sample from
+        mix: Weight of each payload kind
+        n_requests: Number of requests
+        batch_size: Rows per batch request
+        seed: Seed making the plan reproducible
+
+    Returns:
+        list: (kind, path, body) triples
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    plan = []
+    for kind in rng.choices(kinds, weights=weights, k=n_requests):
+        path, body = make_payload(kind, rows, rng, batch_size)
+        plan.append((kind, path, body))
+    return plan
+
+
+async def run_load(client, plan, concurrency):
+    """
+    Send the planned requests from `concurrency` concurrent clients.
+
+    Args:
+        client: httpx.AsyncClient bound to the API
+        plan: (kind, path, body) triples
+        concurrency: Number of requests in flight at once
+
+    Returns:
+        tuple: (kind, latency in seconds, succeeded, rows) samples and the elapsed time
+    """
+    samples = []
+    position = iter(plan)
+
+    async def worker():
+        for kind, path, body in position:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            rows = 1 if kind == "predict" else len(body.get("records") or body["columns"]["age"])
+            samples.append((kind, time.perf_counter() - start, ok, rows))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """
+    Aggregate latency samples per payload kind and overall.
+
+    Args:
+        samples: (kind, latency in seconds, succeeded, rows) samples
+        elapsed: Wall-clock duration of the run in seconds
+
+    Returns:
+        dict: Requests, errors, requests/sec, rows/sec and latency percentiles (ms)
+    """
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    groups["all"] = list(samples)
+
+    summary = {}
+    for kind, group in groups.items():
+        latencies = np.array([latency for _, latency, _, _ in group]) * 1000
+        stats = {
+            "requests": len(group),
+            "errors": sum(1 for _, _, ok, _ in group if not ok),
+            "requests_per_sec": len(group) / elapsed,
+            "rows_per_sec": sum(rows for _, _, _, rows in group) / elapsed,
+            "mean_ms": float(latencies.mean()),
+            "max_ms": float(latencies.max()),
+        }
+        for q, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+            stats[f"p{q}_ms"] = float(value)
+        summary[kind] = stats
+    return summary
+
+
+async def cache_counters(client):
+    """
+    Hit and miss counters of the API's prediction cache.
+
+    Args:
+        client: httpx.AsyncClient bound to the API
+
+    Returns:
+        dict: hits and misses, or None if the cache is disabled or not reported
+    """
+    try:
+        response = await client.get("/cache/stats")
+        stats = response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    if response.status_code != 200 or not stats.get("enabled"):
+        return None
+    return {"hits": stats["hits"], "misses": stats["misses"]}
+
+
+def cache_summary(before, after):
+    """
+    Prediction cache activity between two `cache_counters` readings.
+
+    With several server processes the counters come from whichever one
+    answered, so the ratio is an estimate.
+
+    Returns:
+        dict: enabled, and hits, misses and hit_ratio when enabled
+    """
+    if before is None or after is None:
+        return {"enabled": False}
+    hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+    return {
+        "enabled": True,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def _free_port():
+    """A TCP port that is currently unused on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def uvicorn_server(workers=1, timeout=60.0, env=None):
+    """
+    Run the API under uvicorn for the duration of the block.
+
+    Args:
+        workers: Number of uvicorn worker processes
+        timeout: Seconds to wait for the server to answer
+        env: Extra environment variables for the server
+
+    Yields:
+        str: Base URL of the server
+    """
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=STARTER_DIR,
+        env={**os.environ, **(env or {})}
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            try:
+                httpx.get(url + "/", timeout=1.0)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"uvicorn did not answer within {timeout:.0f}s")
+                time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def benchmark(url=None, rows=None, mix=None, n_requests=1000, concurrency=8,
+                    batch_size=100, warmup=20, seed=0, prediction_cache=False):
+    """
+    Run one benchmark against the API.
+
+    Args:
+        url: Base URL of a running server, or None to drive the app in-process
+        rows: Records to sample from (default: census.csv)
+        mix: Weight of each payload kind (default: /predict only)
+        n_requests: Number of measured requests
+        concurrency: Number of requests in flight at once
+        batch_size: Rows per batch request
+        warmup: Requests sent, and discarded, before measuring
+        seed: Seed making the request plan reproducible
+        prediction_cache: Keep the prediction cache of an in-process app on;
+            repeated payloads then mostly measure cache hits
+
+    Returns:
+        dict: Run configuration, per-kind summaries and prediction cache activity
+    """
+    rows = rows if rows is not None else load_rows(DEFAULT_DATA_PATH)
+    mix = mix or {"predict": 1.0}
+    plan = plan_requests(rows, mix, warmup + n_requests, batch_size=batch_size, seed=seed)
+
+    if url is None:
+        sys.path.insert(0, STARTER_DIR)
+        import main
+
+        transport = httpx.ASGITransport(app=main.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+        # ASGITransport does not send lifespan events, so start the app as uvicorn would
+        lifespan = main.app.router.lifespan_context(main.app)
+        saved_cache = main.cache
+        if not prediction_cache:
+            main.cache = None
+    else:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        client = httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0)
+        lifespan = nullcontext()
+
+    try:
+        async with lifespan, client:
+            await run_load(client, plan[:warmup], concurrency)
+            before = await cache_counters(client)
+            samples, elapsed = await run_load(client, plan[warmup:], concurrency)
+            after = await cache_counters(client)
+    finally:
+        if url is None:
+            main.cache = saved_cache
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": url or "in-process",
+        "config": {
+            "requests": n_requests,
+            "concurrency": concurrency,
+            "batch_size": batch_size,
+            "warmup": warmup,
+            "mix": mix,
+            "seed": seed,
+        },
+        "elapsed_sec": elapsed,
+        "results": summarize(samples, elapsed),
+        "prediction_cache": cache_summary(before, after),
+    }
+
+
+def check_regressions(report, baseline=None, max_regression=0.1, max_p99_ms=None, max_error_rate=0.0):
+    """
+    Compare a report with absolute limits and an optional baseline report.
+
+    A kind regresses when its p99 latency grows, or its throughput drops, by
+    more than `max_regression` (a fraction) relative to the baseline.
+
+    Args:
+        report: Output of `benchmark`
+        baseline: Earlier report to compare with, or None
+        max_regression: Allowed relative change against the baseline
+        max_p99_ms: Optional upper bound on every kind's p99 latency
+        max_error_rate: Allowed fraction of failed requests
+
+    Returns:
+        list: Description of every failed check (empty when the run passes)
+    """
+    failures = []
+    for kind, stats in report["results"].items():
+        error_rate = stats["errors"] / stats["requests"]
+        if error_rate > max_error_rate:
+            failures.append(f"{kind}: error rate {error_rate:.2%} exceeds {max_error_rate:.2%}")
+        if max_p99_ms is not None and stats["p99_ms"] > max_p99_ms:
+            failures.append(f"{kind}: p99 {stats['p99_ms']:.2f} ms exceeds {max_p99_ms:.2f} ms")
+
+        previous = (baseline or {}).get("results", {}).get(kind)
+        if previous is None:
+            continue
+        if stats["p99_ms"] > previous["p99_ms"] * (1 + max_regression):
+            failures.append(
+                f"{kind}: p99 {stats['p99_ms']:.2f} ms vs baseline {previous['p99_ms']:.2f} ms"
+            )
+        if stats["requests_per_sec"] < previous["requests_per_sec"] * (1 - max_regression):
+            failures.append(
+                f"{kind}: {stats['requests_per_sec']:.1f} req/s vs baseline {previous['requests_per_sec']:.1f} req/s"
+            )
+    return failures
+
+
+def format_report(report):
+    """Render a report as a fixed-width table."""
+    header = f"{'kind':<8} {'requests':>8} {'errors':>6} {'req/s':>9} {'rows/s':>10}" + "".join(
+        f" {f'p{q} ms':>9}" for q in PERCENTILES
+    )
+    lines = [f"Target: {report['target']}  elapsed: {report['elapsed_sec']:.2f}s", header]
+    for kind, stats in report["results"].items():
+        lines.append(
+            f"{kind:<8} {stats['requests']:>8} {stats['errors']:>6} {stats['requests_per_sec']:>9.1f} "
+            f"{stats['rows_per_sec']:>10.1f}" + "".join(f" {stats[f'p{q}_ms']:>9.2f}" for q in PERCENTILES)
+        )
+    cache = report.get("prediction_cache", {"enabled": False})
+    if cache["enabled"]:
+        lines.append(
+            f"Prediction cache: {cache['hit_ratio']:.1%} hits ({cache['hits']} hits, {cache['misses']} misses)"
+        )
+    else:
+        lines.append("Prediction cache: disabled")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Main function to run the benchmark script."""
+    parser = argparse.ArgumentParser(description="Benchmark the prediction API.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running server (default: drive the app in-process)")
+    target.add_argument("--uvicorn", action="store_true", help="Start a local uvicorn server for the run")
+    parser.add_argument("--uvicorn-workers", type=int, default=1, help="Worker processes with --uvicorn")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="CSV the payloads are drawn from")
+    parser.add_argument("--mix", default="predict", help="Payload mix, e.g. predict=8,records=1,columns=1")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per batch request (default: 100)")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests sent first (default: 20)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prediction-cache", action="store_true",
+                        help="Keep the prediction cache on for in-process and --uvicorn runs "
+                             "(its hit ratio is reported either way)")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Allowed relative p99/throughput change against the baseline (default: 0.1)")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="Fail if any p99 latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Allowed fraction of failed requests")
+    args = parser.parse_args(argv)
+
+    run = dict(
+        rows=load_rows(args.data),
+        mix=parse_mix(args.mix),
+        n_requests=args.requests,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        warmup=args.warmup,
+        seed=args.seed,
+    )
+    if args.uvicorn:
+        env = None if args.prediction_cache else {"PREDICTION_CACHE_SIZE": "0"}
+        with uvicorn_server(workers=args.uvicorn_workers, env=env) as url:
+            report = asyncio.run(benchmark(url=url, **run))
+    else:
+        report = asyncio.run(benchmark(url=args.url, prediction_cache=args.prediction_cache, **run))
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check_regressions(
+        report,
+        baseline,
+        max_regression=args.max_regression,
+        max_p99_ms=args.max_p99_ms,
+        max_error_rate=args.max_error_rate,
+    )
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
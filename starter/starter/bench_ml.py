@@ -0,0 +1,254 @@
+"""
+Micro-benchmarks for the machine learning library functions.
+
+Usage: python starter/bench_ml.py [--sizes 1,100,10000,100000,1000000] [options]
+
+Measures wall time and peak traced memory of `process_data`, `train_model`,
+`inference` and `compute_model_metrics` on synthetic data obtained by
+resampling census.csv to each batch size. Training mode fits a new encoder
+and model; inference mode reuses the trained artifacts in model/, scoring
+with both the pickled forest and its compiled copy. Results can be saved as
+JSON to compare runs.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ml.data import process_data
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from ml.forest import compile_forest
+from ml.model import compute_model_metrics, inference, load_encoder, load_model, train_model
+
+LABEL = "salary"
+
+MODES = ("training", "inference")
+
+STARTER_DIR = os.path.join(os.path.dirname(__file__), "..")
+DEFAULT_DATA_PATH = os.path.join(STARTER_DIR, "data", "census.csv")
+DEFAULT_MODEL_DIR = os.path.join(STARTER_DIR, "model")
+
+
+def synthesize(data, n_rows, seed=0):
+    """
+    Scale census rows up (or down) to `n_rows` by sampling with replacement.
+
+    Args:
+        data: DataFrame with the census.csv schema
+        n_rows: Number of rows to produce
+        seed: Seed making the sample reproducible
+
+    Returns:
+        pd.DataFrame: `n_rows` rows with a fresh RangeIndex
+    """
+    rng = np.random.default_rng(seed)
+    return data.iloc[rng.integers(0, len(data), size=n_rows)].reset_index(drop=True)
+
+
+def measure(fn, repeat=3, memory=True):
+    """
+    Time a function and trace its peak memory.
+
+    Timed runs are done without tracing, which slows allocation-heavy Python
+    code; peak memory comes from one extra run under tracemalloc, which sees
+    NumPy's buffers as well as Python objects.
+
+    Args:
+        fn: Function called without arguments
+        repeat: Number of timed calls
+        memory: Also measure peak memory
+
+    Returns:
+        dict: Best and mean seconds, peak MiB (None if not measured) and the last result
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    peak_mib = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mib = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return {"seconds": min(times), "mean_seconds": sum(times) / len(times), "peak_mib": peak_mib, "result": result}
+
+
+def load_artifacts(model_dir):
+    """
+    Load the trained encoders and both model formats.
+
+    Args:
+        model_dir: Directory with model.pkl, encoder.pkl and lb.pkl
+
+    Returns:
+        dict: `encoder`, `lb`, `pickle` (sklearn forest) and `compiled` (CompiledForest)
+    """
+    model = load_model(os.path.join(model_dir, "model.pkl"))
+    forest_dir = os.path.join(model_dir, "forest")
+    return {
+        "encoder": load_encoder(os.path.join(model_dir, "encoder.pkl")),
+        "lb": load_encoder(os.path.join(model_dir, "lb.pkl")),
+        "pickle": model,
+        "compiled": load_model(forest_dir) if os.path.isdir(forest_dir) else compile_forest(model),
+    }
+
+
+def benchmark_size(data, n_rows, artifacts=None, modes=MODES, repeat=3, memory=True,
+                   train_max_rows=100000, seed=0):
+    """
+    Benchmark every library function at one batch size.
+
+    Args:
+        data: DataFrame with the census.csv schema
+        n_rows: Batch size
+        artifacts: Output of `load_artifacts`, required for inference mode
+        modes: Subset of ("training", "inference")
+        repeat: Timed calls per measurement
+        memory: Also measure peak memory
+        train_max_rows: Largest batch `train_model` is run on
+        seed: Seed of the synthetic sample
+
+    Returns:
+        list: One result dict per function and variant
+    """
+    sample = synthesize(data, n_rows, seed=seed)
+    results = []
+
+    def record(function, mode, variant, fn):
+        stats = measure(fn, repeat=repeat, memory=memory)
+        results.append({
+            "function": function,
+            "mode": mode,
+            "variant": variant,
+            "rows": n_rows,
+            "seconds": stats["seconds"],
+            "mean_seconds": stats["mean_seconds"],
+            "rows_per_sec": n_rows / stats["seconds"] if stats["seconds"] > 0 else float("inf"),
+            "peak_mib": stats["peak_mib"],
+        })
+        return stats["result"]
+
+    def encode(sparse, **kwargs):
+        return process_data(sample, categorical_features=CATEGORICAL_FEATURES, label=LABEL, sparse=sparse, **kwargs)
+
+    if "training" in modes:
+        X_train, y_train, _, _ = record("process_data", "training", "dense", lambda: encode(False, training=True))
+        record("process_data", "training", "sparse", lambda: encode(True, training=True))
+        if n_rows <= train_max_rows:
+            record("train_model", "training", "dense", lambda: train_model(X_train, y_train))
+
+    if "inference" in modes:
+        fitted = {"training": False, "encoder": artifacts["encoder"], "lb": artifacts["lb"]}
+        X, y, _, _ = record("process_data", "inference", "dense", lambda: encode(False, **fitted))
+        record("process_data", "inference", "sparse", lambda: encode(True, **fitted))
+        for variant in ("pickle", "compiled"):
+            preds = record("inference", "inference", variant, lambda: inference(artifacts[variant], X))
+        record("compute_model_metrics", "inference", "-", lambda: compute_model_metrics(y, preds))
+
+    return results
+
+
+def run_benchmarks(sizes, data_path=DEFAULT_DATA_PATH, model_dir=DEFAULT_MODEL_DIR, modes=MODES,
+                   repeat=3, memory=True, train_max_rows=100000, seed=0, progress=None):
+    """
+    Benchmark every library function at every batch size.
+
+    Args:
+        sizes: Batch sizes, in rows
+        data_path: CSV the synthetic data is resampled from
+        model_dir: Directory with the trained artifacts, used in inference mode
+        modes: Subset of ("training", "inference")
+        repeat: Timed calls per measurement
+        memory: Also measure peak memory
+        train_max_rows: Largest batch `train_model` is run on
+        seed: Seed of the synthetic samples
+        progress: Stream receiving one line per result, or None
+
+    Returns:
+        dict: Run configuration and the list of results
+    """
+    data = read_census(data_path)
+    artifacts = load_artifacts(model_dir) if "inference" in modes else None
+    results = []
+    for n_rows in sizes:
+        for result in benchmark_size(data, n_rows, artifacts, modes=modes, repeat=repeat, memory=memory,
+                                     train_max_rows=train_max_rows, seed=seed):
+            results.append(result)
+            if progress is not None:
+                progress.write(format_result(result) + "\n")
+                progress.flush()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "sizes": list(sizes),
+            "modes": list(modes),
+            "repeat": repeat,
+            "train_max_rows": train_max_rows,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def format_result(result):
+    """Render one result as a fixed-width table row."""
+    peak = f"{result['peak_mib']:.1f}" if result["peak_mib"] is not None else "-"
+    return (
+        f"{result['function']:<22} {result['mode']:<9} {result['variant']:<8} {result['rows']:>8} "
+        f"{1000 * result['seconds']:>11.3f} {result['rows_per_sec']:>12.0f} {peak:>9}"
+    )
+
+
+def main(argv=None):
+    """Main function to run the benchmark script."""
+    parser = argparse.ArgumentParser(description="Benchmark the ml library functions.")
+    parser.add_argument("--sizes", default="1,100,10000,100000,1000000",
+                        help="Comma-separated batch sizes in rows (default: 1,100,10000,100000,1000000)")
+    parser.add_argument("--modes", default="training,inference", help="Comma-separated subset of training,inference")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="CSV the synthetic data is resampled from")
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR, help="Directory with the trained artifacts")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls per measurement (default: 3)")
+    parser.add_argument("--train-max-rows", type=int, default=100000,
+                        help="Largest batch train_model is run on (default: 100000)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    modes = tuple(mode.strip() for mode in args.modes.split(","))
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes {sorted(unknown)}, expected a subset of {MODES}")
+
+    print(f"{'function':<22} {'mode':<9} {'variant':<8} {'rows':>8} {'ms':>11} {'rows/s':>12} {'peak MiB':>9}")
+    report = run_benchmarks(
+        [int(size) for size in args.sizes.split(",")],
+        data_path=args.data,
+        model_dir=args.model_dir,
+        modes=modes,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        train_max_rows=args.train_max_rows,
+        seed=args.seed,
+        progress=sys.stdout,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Script to compress the trained forest for faster serving.
+
+Usage: python starter/compress_model.py [--version V] [--trees 30] [--max-depth D] [--merge-tolerance 0.05] [options]
+
+Keeps the trees that best reproduce the forest's probabilities, optionally
+caps their depth and merges sibling leaves with near-identical class
+distributions, then checks the F1 and per-slice F1 of the compact forest
+against the original on the test split. When the drift is within bounds the
+compact model is written next to model.pkl as model_compact.pkl (and
+forest_compact/ for MODEL_FORMAT=compiled), served with MODEL_VARIANT=compact,
+together with model_compact.json naming the model.pkl it was made from. Run it
+again after every retraining, with --version for a published version: a
+compact model made from another model.pkl is ignored and the full one served.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from sklearn.model_selection import train_test_split
+
+from ml.compress import compare_models, compress_forest
+from ml.data import process_data
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from ml.forest import compile_forest, save_compiled_forest
+from ml.model import load_encoder, load_model, save_model
+from ml.search import LATENCY_FORMATS
+from ml.slices import parse_slice_specs
+from serving.predictor import variant_source_path, write_variant_source
+
+STARTER_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+def format_report(report):
+    """Render the comparison as a short table plus the drift."""
+    original, compact = report["original"], report["compact"]
+    lines = [f"{'':<18} {'original':>12} {'compact':>12} {'change':>9}"]
+    for name, label in (
+        ("n_trees", "trees"),
+        ("n_nodes", "nodes"),
+        ("pickle_bytes", "pickle bytes"),
+        ("compiled_bytes", "compiled bytes"),
+        ("single_us_per_row", "1 row us/row"),
+        ("batch_us_per_row", "batch us/row"),
+    ):
+        change = compact[name] / original[name] - 1 if original[name] else 0.0
+        lines.append(f"{label:<18} {original[name]:>12.6g} {compact[name]:>12.6g} {change:>+9.1%}")
+    lines.append(f"{'F1':<18} {original['fbeta']:>12.4f} {compact['fbeta']:>12.4f} {report['fbeta_drift']:>+9.4f}")
+    lines.append(f"Largest slice F1 drift: {report['max_slice_drift']:.4f}")
+    for row in report["slices"][:3]:
+        lines.append(
+            f"  {row['feature']}={row['value']} ({row['n_samples']} rows): "
+            f"{row['fbeta_original']:.4f} -> {row['fbeta_compact']:.4f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Main function to run the compression script."""
+    parser = argparse.ArgumentParser(description="Compress the trained forest and check its accuracy drift.")
+    parser.add_argument("--model-dir", default=os.path.join(STARTER_DIR, "model"),
+                        help="Directory with model.pkl; the compact model is written there too")
+    parser.add_argument("--version",
+                        help="Compress the model version published as model-dir/versions/VERSION instead")
+    parser.add_argument("--data", default=os.path.join(STARTER_DIR, "data", "census.csv"),
+                        help="CSV the model was trained on; its test split is used for the checks")
+    parser.add_argument("--trees", type=int, default=30, help="Trees kept (default: 30)")
+    parser.add_argument("--max-depth", type=int, help="Depth cap of the kept trees (default: none)")
+    parser.add_argument("--merge-tolerance", type=float, default=0.05,
+                        help="Merge sibling leaves whose class probabilities differ by at most this "
+                             "(default: 0.05, negative to disable)")
+    parser.add_argument("--selection-rows", type=int, default=5000,
+                        help="Training rows the kept trees are chosen on (default: 5000)")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest allowed test F1 loss (default: 0.01)")
+    parser.add_argument("--max-slice-drift", type=float, default=0.15,
+                        help="Largest allowed absolute change of any slice's F1 (default: 0.15)")
+    parser.add_argument("--min-support", type=int, default=100,
+                        help="Slices with fewer test rows are not checked (default: 100)")
+    parser.add_argument("--latency-format", choices=LATENCY_FORMATS, default="pickle",
+                        help="Model format the latency is measured with (default: pickle)")
+    parser.add_argument("--report", help="Write the comparison as JSON to this file")
+    parser.add_argument("--force", action="store_true", help="Write the compact model even if the checks fail")
+    args = parser.parse_args(argv)
+    if args.version is not None:
+        args.model_dir = os.path.join(args.model_dir, "versions", args.version)
+
+    # Encode with the directory's own encoders: after an incremental update
+    # they know more categories than an encoder fitted on the data file
+    encoder = load_encoder(os.path.join(args.model_dir, "encoder.pkl"))
+    lb = load_encoder(os.path.join(args.model_dir, "lb.pkl"))
+    train, test = train_test_split(read_census(args.data), test_size=0.20, random_state=42)
+    X_selection, _, _, _ = process_data(
+        train.iloc[:args.selection_rows], CATEGORICAL_FEATURES, label="salary", training=False,
+        encoder=encoder, lb=lb
+    )
+    X_test, y_test, _, _ = process_data(
+        test, CATEGORICAL_FEATURES, label="salary", training=False, encoder=encoder, lb=lb
+    )
+    original = load_model(os.path.join(args.model_dir, "model.pkl"))
+    compact = compress_forest(
+        original,
+        X_selection,
+        n_trees=args.trees,
+        max_depth=args.max_depth,
+        merge_tolerance=args.merge_tolerance if args.merge_tolerance >= 0 else None,
+    )
+    report = compare_models(
+        original, compact, X_test, y_test, test, parse_slice_specs(CATEGORICAL_FEATURES),
+        min_support=args.min_support, latency_format=args.latency_format
+    )
+    print(format_report(report))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if -report["fbeta_drift"] > args.max_f1_drop:
+        failures.append(f"F1 dropped by {-report['fbeta_drift']:.4f} (allowed {args.max_f1_drop})")
+    if report["max_slice_drift"] > args.max_slice_drift:
+        failures.append(f"a slice F1 moved by {report['max_slice_drift']:.4f} (allowed {args.max_slice_drift})")
+    for failure in failures:
+        print(f"CHECK FAILED: {failure}", file=sys.stderr)
+    if failures and not args.force:
+        print("Compact model not written", file=sys.stderr)
+        sys.exit(1)
+
+    # The manifest goes last: until it names the current model.pkl, the API
+    # keeps serving the full model from this directory
+    manifest = variant_source_path(args.model_dir, "compact")
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    save_model(compact, os.path.join(args.model_dir, "model_compact.pkl"))
+    save_compiled_forest(compile_forest(compact), os.path.join(args.model_dir, "forest_compact"))
+    write_variant_source(args.model_dir, "compact")
+    print(f"Compact model saved to {os.path.join(args.model_dir, 'model_compact.pkl')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Script to evaluate the model on data slices of a large labeled CSV file.
+
+Usage: python starter/evaluate_slices.py INPUT.csv --output REPORT.txt [--slices "race,sex,race x sex"] [options]
+
+The input is streamed in fixed-size chunks, optionally scored in parallel
+across processes, and reduced to confusion counts per slice; the counts are
+added up so the metrics are exactly those of scoring the whole file at once.
+Slices can be single features or crossed features, and slices with fewer
+samples than --min-support are left out. The metrics are written as the text
+report produced by train_model.py and, with --table, as CSV or JSON.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from ml.slices import evaluate_slices, parse_slice_specs, slice_name, write_slice_report, write_slice_table
+from serving.predictor import MODEL_FORMATS, Predictor
+
+LABEL = "salary"
+
+
+def evaluate_file(input_path, model_dir, slices, chunksize=10000, workers=1, min_support=1,
+                  model_format="pickle"):
+    """
+    Slice metrics of the trained model over a labeled CSV file.
+
+    Args:
+        input_path: CSV file with the census.csv schema, including the label
+        model_dir: Directory with the trained artifacts
+        slices: Slice specifications, e.g. ["race", "race x sex"]
+        chunksize: Rows per chunk
+        workers: Scoring processes
+        min_support: Smallest number of samples a reported slice has
+        model_format: "pickle" or "compiled"
+
+    Returns:
+        pd.DataFrame: One row per slice with counts, precision, recall and fbeta
+    """
+    predictor = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, model_format=model_format)
+    chunks = read_census(input_path, chunksize=chunksize)
+    return evaluate_slices(
+        chunks,
+        predictor.model,
+        predictor.encoder,
+        predictor.lb,
+        CATEGORICAL_FEATURES,
+        slices,
+        label=LABEL,
+        min_support=min_support,
+        workers=workers,
+    )
+
+
+def main(argv=None):
+    """Main function to run the slice evaluation script."""
+    starter_dir = os.path.join(os.path.dirname(__file__), "..")
+
+    parser = argparse.ArgumentParser(description="Evaluate the model on slices of a labeled census CSV file.")
+    parser.add_argument("input", help="CSV file with the census.csv schema, including the salary column")
+    parser.add_argument("--slices", default=",".join(CATEGORICAL_FEATURES),
+                        help="Comma-separated slices; cross features with ' x ' or '*' "
+                             "(default: every categorical feature)")
+    parser.add_argument("--min-support", type=int, default=1,
+                        help="Leave out slices with fewer samples (default: 1)")
+    parser.add_argument("--model-dir", default=os.path.join(starter_dir, "model"),
+                        help="Directory with the trained artifacts")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows per chunk (default: 10000)")
+    parser.add_argument("--workers", type=int, default=1, help="Scoring processes (default: 1)")
+    parser.add_argument("--model-format", choices=MODEL_FORMATS, default="pickle")
+    parser.add_argument("--output", required=True,
+                        help="Text report to write; train_model.py owns slice_output.txt")
+    parser.add_argument("--table", help="Also write the metrics as CSV, or JSON for a .json path")
+    args = parser.parse_args(argv)
+
+    try:
+        specs = parse_slice_specs(args.slices.split(","))
+    except ValueError as exc:
+        parser.error(str(exc))
+    unknown = {feature for spec in specs for feature in spec} - set(CATEGORICAL_FEATURES)
+    if unknown:
+        parser.error(f"Unknown slice features {sorted(unknown)}, expected categorical features {CATEGORICAL_FEATURES}")
+
+    start = time.perf_counter()
+    metrics = evaluate_file(
+        args.input,
+        args.model_dir,
+        specs,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        min_support=args.min_support,
+        model_format=args.model_format,
+    )
+    write_slice_report(metrics, [slice_name(spec) for spec in specs], args.output)
+    if args.table:
+        write_slice_table(metrics, args.table)
+    elapsed = time.perf_counter() - start
+    print(f"Evaluated {len(metrics)} slices in {elapsed:.2f}s -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Post-training compression of the forest: fewer trees, shallower trees, merged leaves.
+"""
+
+import copy
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .forest import compile_forest
+from .model import compute_model_metrics, inference, with_n_jobs
+from .search import measure_latency, results_to_records
+from .slices import compute_crossed_slice_counts, slice_metrics_from_counts
+
+
+def select_trees(model, X, n_trees):
+    """
+    Trees whose average best reproduces the probabilities of the whole forest.
+
+    Trees are added greedily, each time picking the one that most reduces
+    the mean squared difference between the subset's and the forest's
+    positive-class probability on `X`, so the selection distills the forest
+    rather than keeping arbitrary trees.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model.
+    X : np.ndarray
+        Encoded rows the forest's outputs are matched on.
+    n_trees : int
+        Number of trees to keep.
+    Returns
+    -------
+    indices : np.ndarray
+        Indices of the kept trees in `model.estimators_`, ascending.
+    """
+    n_trees = min(n_trees, len(model.estimators_))
+    if n_trees < 1:
+        raise ValueError("n_trees must be at least 1")
+    X = np.asarray(X, dtype=np.float32)
+    per_tree = np.stack([estimator.predict_proba(X)[:, -1] for estimator in model.estimators_])
+    target = per_tree.mean(axis=0)
+
+    chosen = []
+    total = np.zeros_like(target)
+    remaining = np.ones(len(per_tree), dtype=bool)
+    for size in range(1, n_trees + 1):
+        errors = (((total + per_tree) / size - target) ** 2).mean(axis=1)
+        errors[~remaining] = np.inf
+        best = int(np.argmin(errors))
+        chosen.append(best)
+        remaining[best] = False
+        total += per_tree[best]
+    return np.sort(np.asarray(chosen))
+
+
+def prune_tree(tree, max_depth=None, merge_tolerance=None):
+    """
+    Copy of a fitted sklearn Tree with its depth capped and redundant leaves merged.
+
+    Nodes at `max_depth` become leaves predicting the class distribution of
+    the training samples that reached them. Then, bottom-up, a node whose two
+    children are leaves whose class distributions differ by at most
+    `merge_tolerance` becomes a leaf itself.
+
+    Inputs
+    ------
+    tree : sklearn.tree._tree.Tree
+        Fitted tree, left unchanged.
+    max_depth : int
+        Depth cap, or None to keep every level.
+    merge_tolerance : float
+        Largest difference in any class probability between merged sibling
+        leaves, or None to merge nothing.
+    Returns
+    -------
+    tree : sklearn.tree._tree.Tree
+    """
+    cls, args, state = tree.__reduce__()
+    nodes, values = state["nodes"], state["values"]
+    left, right = nodes["left_child"], nodes["right_child"]
+    totals = values[:, 0, :].sum(axis=1, keepdims=True)
+    distributions = values[:, 0, :] / np.where(totals == 0, 1, totals)
+
+    # Which nodes end up as leaves, deciding children before their parents
+    is_leaf = left == -1
+    depth = np.zeros(len(nodes), dtype=np.intp)
+    order = [0]
+    for node in order:
+        if not is_leaf[node]:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+            order.extend((left[node], right[node]))
+    becomes_leaf = is_leaf.copy()
+    for node in reversed(order):
+        if becomes_leaf[node]:
+            continue
+        if max_depth is not None and depth[node] >= max_depth:
+            becomes_leaf[node] = True
+        elif merge_tolerance is not None and becomes_leaf[left[node]] and becomes_leaf[right[node]]:
+            difference = np.abs(distributions[left[node]] - distributions[right[node]]).max()
+            becomes_leaf[node] = difference <= merge_tolerance
+
+    # Renumber the nodes still reachable, in depth-first order like sklearn
+    kept = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        kept.append(node)
+        if not becomes_leaf[node]:
+            stack.extend((right[node], left[node]))
+    kept = np.asarray(kept, dtype=np.intp)
+    new_index = np.full(len(nodes), -1, dtype=np.intp)
+    new_index[kept] = np.arange(len(kept))
+
+    new_nodes = nodes[kept].copy()
+    leaves = becomes_leaf[kept]
+    new_nodes["left_child"] = np.where(leaves, -1, new_index[left[kept]])
+    new_nodes["right_child"] = np.where(leaves, -1, new_index[right[kept]])
+    new_nodes["feature"][leaves] = -2
+    new_nodes["threshold"][leaves] = -2.0
+    if "missing_go_to_left" in new_nodes.dtype.names:
+        new_nodes["missing_go_to_left"][leaves] = 0
+
+    pruned = cls(*args)
+    pruned.__setstate__({
+        **state,
+        "max_depth": int(depth[kept].max()),
+        "node_count": len(kept),
+        "nodes": np.ascontiguousarray(new_nodes),
+        "values": np.ascontiguousarray(values[kept]),
+    })
+    return pruned
+
+
+def compress_forest(model, X, n_trees=None, max_depth=None, merge_tolerance=None):
+    """
+    Smaller copy of a forest, still a RandomForestClassifier.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model, left unchanged.
+    X : np.ndarray
+        Encoded rows used to select the trees, e.g. a sample of the training set.
+    n_trees : int
+        Number of trees to keep (see `select_trees`), or None for all.
+    max_depth : int
+        Depth cap (see `prune_tree`), or None.
+    merge_tolerance : float
+        Tolerance for merging sibling leaves (see `prune_tree`), or None.
+    Returns
+    -------
+    model : RandomForestClassifier
+        Pickles, compiles and serves like the original.
+    """
+    indices = np.arange(len(model.estimators_)) if n_trees is None else select_trees(model, X, n_trees)
+    estimators = []
+    for index in indices:
+        estimator = copy.copy(model.estimators_[index])
+        if max_depth is not None or merge_tolerance is not None:
+            estimator.tree_ = prune_tree(estimator.tree_, max_depth, merge_tolerance)
+            if max_depth is not None:
+                estimator.max_depth = max_depth
+        estimators.append(estimator)
+
+    compact = copy.copy(model)
+    compact.estimators_ = estimators
+    compact.n_estimators = len(estimators)
+    if max_depth is not None:
+        compact.max_depth = max_depth if model.max_depth is None else min(model.max_depth, max_depth)
+    return compact
+
+
+def model_size(model):
+    """
+    Size of a forest in nodes and bytes.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model.
+    Returns
+    -------
+    size : dict
+        n_trees, n_nodes, pickle_bytes and compiled_bytes (CompiledForest arrays).
+    """
+    return {
+        "n_trees": len(model.estimators_),
+        "n_nodes": int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+        "pickle_bytes": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+        "compiled_bytes": int(compile_forest(model).nbytes),
+    }
+
+
+def compare_models(original, compact, X_test, y_test, test, slice_specs, min_support=1,
+                   latency_format="pickle"):
+    """
+    Accuracy drift and size and latency reductions of a compressed forest.
+
+    Inputs
+    ------
+    original : RandomForestClassifier
+        Trained machine learning model.
+    compact : RandomForestClassifier
+        Output of `compress_forest`.
+    X_test, y_test : np.ndarray
+        Encoded held-out data and labels.
+    test : pd.DataFrame
+        Raw held-out rows, for the slices.
+    slice_specs : list[tuple[str]]
+        Slices whose F1 drift is reported, see `ml.slices.parse_slice_specs`.
+    min_support : int
+        Slices with fewer held-out rows are ignored.
+    latency_format : str
+        "pickle" to time the scikit-learn forests single-threaded, "compiled"
+        their CompiledForest copies.
+    Returns
+    -------
+    report : dict
+        `original` and `compact` entries with precision, recall, fbeta,
+        size (see `model_size`) and single-row and batch microseconds per
+        row; `fbeta_drift` (compact minus original), `max_slice_drift` (largest
+        absolute slice F1 change) and `slices` (per-slice F1 of both, worst
+        drift first).
+    """
+    report = {}
+    slice_metrics = {}
+    for name, model in (("original", original), ("compact", compact)):
+        preds = inference(model, X_test)
+        precision, recall, fbeta = compute_model_metrics(y_test, preds)
+        served = compile_forest(model) if latency_format == "compiled" else with_n_jobs(model, 1)
+        report[name] = {
+            "precision": float(precision),
+            "recall": float(recall),
+            "fbeta": float(fbeta),
+            **model_size(model),
+            "single_us_per_row": 1e6 * measure_latency(served, X_test, batch_size=1, max_rows=200),
+            "batch_us_per_row": 1e6 * measure_latency(served, X_test, batch_size=1000),
+        }
+        slice_metrics[name] = slice_metrics_from_counts(
+            compute_crossed_slice_counts(test, y_test, preds, slice_specs), min_support=min_support
+        )
+
+    slices = pd.merge(
+        slice_metrics["original"][["feature", "value", "n_samples", "fbeta"]],
+        slice_metrics["compact"][["feature", "value", "fbeta"]],
+        on=["feature", "value"], suffixes=("_original", "_compact"),
+    )
+    slices["drift"] = slices["fbeta_compact"] - slices["fbeta_original"]
+    slices = slices.reindex(slices["drift"].abs().sort_values(ascending=False).index)
+    report["fbeta_drift"] = report["compact"]["fbeta"] - report["original"]["fbeta"]
+    report["max_slice_drift"] = float(slices["drift"].abs().max()) if len(slices) else 0.0
+    report["slices"] = results_to_records(slices)
+    return report
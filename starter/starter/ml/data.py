@@ -1,9 +1,11 @@
 import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 from sklearn.preprocessing import LabelBinarizer, OneHotEncoder
 
 
 def process_data(
-    X, categorical_features=[], label=None, training=True, encoder=None, lb=None
+    X, categorical_features=[], label=None, training=True, encoder=None, lb=None, sparse=False
 ):
     """ Process the data used in the machine learning pipeline.
 
@@ -14,6 +16,10 @@ def process_data(
     Note: depending on the type of model used, you may want to add in functionality that
     scales the continuous data.
 
+    Categorical features (and the label) of pandas `category` dtype, as loaded by
+    `ml.dataset.read_census`, are encoded from their integer codes without object
+    arrays; the result is the same as for the same values stored as strings.
+
     Inputs
     ------
     X : pd.DataFrame
@@ -29,10 +35,14 @@ def process_data(
         Trained sklearn OneHotEncoder, only used if training=False.
     lb : sklearn.preprocessing._label.LabelBinarizer
         Trained sklearn LabelBinarizer, only used if training=False.
+    sparse : bool
+        If True, keep the one-hot block sparse and return X as a CSR matrix
+        instead of densifying it (default=False). The column layout is the same
+        in both modes.
 
     Returns
     -------
-    X : np.array
+    X : np.array or scipy.sparse.csr_matrix
         Processed data.
     y : np.array
         Processed labels if labeled=True, otherwise empty np.array.
@@ -50,21 +60,276 @@ def process_data(
     else:
         y = np.array([])
 
-    X_categorical = X[categorical_features].values
     X_continuous = X.drop(categorical_features, axis=1)
+    typed = all(_is_categorical(X[feature]) for feature in categorical_features)
 
     if training is True:
-        encoder = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
+        encoder = OneHotEncoder(sparse_output=sparse, handle_unknown="ignore")
         lb = LabelBinarizer()
-        X_categorical = encoder.fit_transform(X_categorical)
-        y = lb.fit_transform(y.values).ravel()
+        if typed:
+            encoder.fit(_observed_categories(X, categorical_features))
+            X_categorical = _one_hot_from_codes(X, categorical_features, encoder)
+        else:
+            X_categorical = encoder.fit_transform(X[categorical_features].values)
+        if _is_categorical(y):
+            lb.fit(_observed_categories(y.to_frame(), [label])[:, 0])
+            y = _binarize_from_codes(y, lb)
+        else:
+            y = lb.fit_transform(y.values).ravel()
+    else:
+        if typed and _supports_codes(encoder):
+            X_categorical = _one_hot_from_codes(X, categorical_features, encoder)
+            if not sparse:
+                X_categorical = X_categorical.toarray()
+        else:
+            X_categorical = encoder.transform(X[categorical_features].values)
+        if _is_categorical(y) and lb is not None:
+            y = _binarize_from_codes(y, lb)
+        else:
+            try:
+                y = lb.transform(y.values).ravel()
+            # Catch the case where y is None because we're doing inference.
+            except AttributeError:
+                pass
+
+    if sparse:
+        X = sp.hstack(
+            [sp.csr_matrix(np.asarray(X_continuous, dtype=np.float64)), sp.csr_matrix(X_categorical)],
+            format="csr"
+        )
     else:
-        X_categorical = encoder.transform(X_categorical)
-        try:
-            y = lb.transform(y.values).ravel()
-        # Catch the case where y is None because we're doing inference.
-        except AttributeError:
-            pass
-
-    X = np.concatenate([X_continuous, X_categorical], axis=1)
+        if sp.issparse(X_categorical):
+            X_categorical = X_categorical.toarray()
+        X = np.concatenate([X_continuous, X_categorical], axis=1)
     return X, y, encoder, lb
+
+
+def _is_categorical(column):
+    """Whether a column has the pandas category dtype."""
+    return isinstance(getattr(column, "dtype", None), pd.CategoricalDtype)
+
+
+def _supports_codes(encoder):
+    """Whether `_one_hot_from_codes` reproduces `encoder.transform`."""
+    return getattr(encoder, "drop_idx_", None) is None and not getattr(encoder, "_infrequent_enabled", False)
+
+
+def _category_positions(column, categories):
+    """ Position of each value of a category column in `categories`, from its codes.
+
+    Only the column's distinct categories are looked up; rows are mapped with
+    one take. Values absent from `categories` get -1, missing values the
+    position of NaN in `categories` if it has one.
+    """
+    categories = pd.Index(categories)
+    lookup = categories.get_indexer(column.cat.categories)
+    missing = categories.get_indexer([np.nan])[0] if categories.hasnans else -1
+    return np.append(lookup, missing).take(column.cat.codes.to_numpy())
+
+
+def _observed_categories(X, features):
+    """ Rows covering exactly the values of each category column, to fit an encoder on.
+
+    Equivalent to fitting on the full columns: every observed value (and NaN,
+    if any is missing) appears, padded with repeats of the first one.
+    """
+    observed = []
+    for feature in features:
+        column = X[feature]
+        codes = np.unique(column.cat.codes.to_numpy())
+        values = list(column.cat.categories.take(codes[codes >= 0]))
+        if len(codes) and codes[0] < 0:
+            values.append(np.nan)
+        observed.append(values)
+    n_rows = max(1, max((len(values) for values in observed), default=1))
+    rows = np.empty((n_rows, len(features)), dtype=object)
+    for i, values in enumerate(observed):
+        values = values or [np.nan]
+        rows[:, i] = values + values[:1] * (n_rows - len(values))
+    return rows
+
+
+def _one_hot_from_codes(X, categorical_features, encoder):
+    """ One-hot CSR matrix of category columns, identical to `encoder.transform`.
+
+    Built from the columns' integer codes, without object arrays.
+    """
+    n_rows = len(X)
+    rows = np.arange(n_rows)
+    row_index, col_index = [], []
+    offset = 0
+    for feature, categories in zip(categorical_features, encoder.categories_):
+        positions = _category_positions(X[feature], categories)
+        known = positions >= 0
+        if encoder.handle_unknown == "error" and not known.all():
+            raise ValueError(f"Found unknown categories in column {feature!r} during transform")
+        row_index.append(rows[known])
+        col_index.append(offset + positions[known])
+        offset += len(categories)
+    row_index = np.concatenate(row_index) if row_index else np.empty(0, dtype=np.intp)
+    col_index = np.concatenate(col_index) if col_index else np.empty(0, dtype=np.intp)
+    return sp.csr_matrix(
+        (np.ones(len(row_index), dtype=encoder.dtype), (row_index, col_index)), shape=(n_rows, offset)
+    )
+
+
+def _binarize_from_codes(y, lb):
+    """ Binarize a category label column like `lb.transform(...).ravel()`, from its codes."""
+    if len(lb.classes_) != 2 or lb.neg_label != 0 or lb.pos_label != 1 or lb.sparse_output:
+        return lb.transform(np.asarray(y, dtype=object)).ravel()
+    positions = _category_positions(y, lb.classes_)
+    if (positions < 0).any():
+        raise ValueError("y contains previously unseen labels")
+    return (positions == 1).astype(np.int64)
+
+
+class CompiledEncoder:
+    """ Pandas-free encoder equivalent to `process_data` in inference mode.
+
+    Built once from a fitted OneHotEncoder, it holds one dict per categorical
+    feature mapping each category to its output column, and writes records
+    straight into a preallocated float array. The output is bit-for-bit
+    identical to `process_data(..., training=False)` on a DataFrame whose
+    columns are `continuous_features` and `categorical_features`.
+
+    Inputs
+    ------
+    encoder : sklearn.preprocessing._encoders.OneHotEncoder
+        Trained sklearn OneHotEncoder.
+    categorical_features : list[str]
+        Names of the categorical features, in the order the encoder was fit on.
+    continuous_features : list[str]
+        Names of the continuous features, in the order they appear in the
+        DataFrames passed to `process_data`.
+    """
+
+    def __init__(self, encoder, categorical_features, continuous_features):
+        if getattr(encoder, "drop_idx_", None) is not None:
+            raise ValueError("CompiledEncoder does not support OneHotEncoder(drop=...)")
+        if len(categorical_features) != len(encoder.categories_):
+            raise ValueError(
+                f"Encoder was fit on {len(encoder.categories_)} features, "
+                f"got {len(categorical_features)} categorical feature names"
+            )
+        self.categorical_features = list(categorical_features)
+        self.continuous_features = list(continuous_features)
+        self.features = self.continuous_features + self.categorical_features
+        self.handle_unknown = encoder.handle_unknown
+
+        offset = len(self.continuous_features)
+        self._lookups = []
+        for feature, categories in zip(self.categorical_features, encoder.categories_):
+            lookup = {category: offset + i for i, category in enumerate(categories.tolist())}
+            self._lookups.append((feature, lookup))
+            offset += len(categories)
+        self.n_features = offset
+
+    def transform_columns(self, columns):
+        """ Encode a columnar batch.
+
+        Inputs
+        ------
+        columns : dict[str, Sequence]
+            One sequence of values per feature, all of the same length.
+        Returns
+        -------
+        X : np.array
+            Processed data, identical to `process_data`'s output.
+        """
+        n_rows = len(columns[self.features[0]])
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+
+        for i, feature in enumerate(self.continuous_features):
+            X[:, i] = columns[feature]
+
+        rows = np.arange(n_rows)
+        for feature, lookup in self._lookups:
+            cols = np.fromiter(
+                (lookup.get(value, -1) for value in columns[feature]), dtype=np.intp, count=n_rows
+            )
+            known = cols >= 0
+            if self.handle_unknown == "error" and not known.all():
+                unknown = columns[feature][int(np.argmin(known))]
+                raise ValueError(f"Found unknown category {unknown!r} in feature {feature!r}")
+            X[rows[known], cols[known]] = 1.0
+        return X
+
+    def transform(self, records):
+        """ Encode a list of records.
+
+        Inputs
+        ------
+        records : list[dict]
+            Records keyed by feature name.
+        Returns
+        -------
+        X : np.array
+            Processed data, identical to `process_data`'s output.
+        """
+        return self.transform_columns({f: [record[f] for record in records] for f in self.features})
+
+
+def encoder_to_manifest(encoder):
+    """ JSON-serializable description of a fitted encoder.
+
+    Inputs
+    ------
+    encoder : OneHotEncoder or LabelBinarizer
+        Trained encoder, as returned by `process_data`.
+    Returns
+    -------
+    manifest : dict
+        Type, constructor parameters and fitted categories or classes.
+    """
+    if isinstance(encoder, OneHotEncoder):
+        if encoder.drop is not None or encoder.min_frequency is not None or encoder.max_categories is not None:
+            raise ValueError("Only OneHotEncoders without drop or infrequent categories can be exported")
+        return {
+            "type": "OneHotEncoder",
+            "categories": [categories.tolist() for categories in encoder.categories_],
+            "handle_unknown": encoder.handle_unknown,
+            "sparse_output": encoder.sparse_output,
+            "dtype": np.dtype(encoder.dtype).name,
+        }
+    if isinstance(encoder, LabelBinarizer):
+        return {
+            "type": "LabelBinarizer",
+            "classes": encoder.classes_.tolist(),
+            "neg_label": encoder.neg_label,
+            "pos_label": encoder.pos_label,
+            "sparse_output": encoder.sparse_output,
+        }
+    raise TypeError(f"Cannot export encoder of type {type(encoder).__name__}")
+
+
+def encoder_from_manifest(manifest):
+    """ Rebuild a fitted encoder from `encoder_to_manifest` output.
+
+    The encoder is refit on its own categories, so it transforms exactly like
+    the original without unpickling any sklearn internals.
+
+    Inputs
+    ------
+    manifest : dict
+        Output of `encoder_to_manifest`.
+    Returns
+    -------
+    encoder : OneHotEncoder or LabelBinarizer
+    """
+    if manifest["type"] == "OneHotEncoder":
+        categories = [np.array(values, dtype=object) for values in manifest["categories"]]
+        encoder = OneHotEncoder(
+            categories=categories,
+            handle_unknown=manifest["handle_unknown"],
+            sparse_output=manifest["sparse_output"],
+            dtype=np.dtype(manifest["dtype"]),
+        )
+        return encoder.fit(np.array([[values[0] for values in categories]], dtype=object))
+    if manifest["type"] == "LabelBinarizer":
+        lb = LabelBinarizer(
+            neg_label=manifest["neg_label"],
+            pos_label=manifest["pos_label"],
+            sparse_output=manifest["sparse_output"],
+        )
+        return lb.fit(np.array(manifest["classes"]))
+    raise ValueError(f"Unknown encoder type {manifest['type']!r}")
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sklearn
+from sklearn.model_selection import train_test_split
+
+from .data import process_data
+from .dataset import read_census
+
+# Bump when the cached layout or the preprocessing changes
+CACHE_VERSION = 2
+
+# Encoded train/test matrices, fitted encoders, raw test rows, and whether
+# they came from the cache
+EncodedSplit = namedtuple(
+    "EncodedSplit",
+    ["X_train", "y_train", "X_test", "y_test", "encoder", "lb", "test", "key", "hit"],
+)
+
+ARRAY_NAMES = ("X_train", "y_train", "X_test", "y_test")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ SHA-256 of a file's contents.
+
+    Inputs
+    ------
+    path : str
+        File to hash.
+    chunk_size : int
+        Bytes read at a time.
+    Returns
+    -------
+    digest : str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_cache_key(data_path, categorical_features, label, test_size, random_state, sparse=False):
+    """ Cache key for an encoded train/test split.
+
+    Depends on the data file's contents, the preprocessing parameters and the
+    scikit-learn version the encoders are pickled with.
+
+    Inputs
+    ------
+    data_path : str
+        CSV file the split is built from.
+    categorical_features : list[str]
+        Names of the categorical features.
+    label : str
+        Name of the label column.
+    test_size : float
+        Fraction of rows held out for testing.
+    random_state : int
+        Seed of the train/test split.
+    sparse : bool
+        Whether the feature matrices are sparse.
+    Returns
+    -------
+    key : str
+    """
+    params = {
+        "version": CACHE_VERSION,
+        "data": file_digest(data_path),
+        "categorical_features": list(categorical_features),
+        "label": label,
+        "test_size": test_size,
+        "random_state": random_state,
+        "sparse": bool(sparse),
+        "sklearn": sklearn.__version__,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def build_encoded_split(data, categorical_features, label="salary", test_size=0.20, random_state=42,
+                        sparse=False):
+    """ Split a DataFrame and encode both halves.
+
+    Inputs
+    ------
+    data : pd.DataFrame
+        Raw data, including the label column.
+    categorical_features : list[str]
+        Names of the categorical features.
+    label : str
+        Name of the label column.
+    test_size : float
+        Fraction of rows held out for testing.
+    random_state : int
+        Seed of the train/test split.
+    sparse : bool
+        Produce CSR feature matrices (see `process_data`).
+    Returns
+    -------
+    arrays : dict
+        X_train, y_train, X_test, y_test, encoder, lb and the raw test rows.
+    """
+    train, test = train_test_split(data, test_size=test_size, random_state=random_state)
+    X_train, y_train, encoder, lb = process_data(
+        train, categorical_features=categorical_features, label=label, training=True, sparse=sparse
+    )
+    X_test, y_test, _, _ = process_data(
+        test,
+        categorical_features=categorical_features,
+        label=label,
+        training=False,
+        encoder=encoder,
+        lb=lb,
+        sparse=sparse
+    )
+    return {
+        "X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test,
+        "encoder": encoder, "lb": lb, "test": test,
+    }
+
+
+def _write_entry(entry_dir, arrays):
+    """Write a cache entry into a fresh directory, then move it into place."""
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name in ARRAY_NAMES:
+            if sp.issparse(arrays[name]):
+                sp.save_npz(os.path.join(tmp_dir, f"{name}.npz"), arrays[name], compressed=False)
+            else:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name], allow_pickle=False)
+        for name in ("encoder", "lb"):
+            with open(os.path.join(tmp_dir, f"{name}.pkl"), "wb") as f:
+                pickle.dump(arrays[name], f)
+        arrays["test"].to_pickle(os.path.join(tmp_dir, "test.pkl"))
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another process may have written the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(entry_dir):
+            raise
+
+
+def _read_entry(entry_dir, mmap):
+    """Load a cache entry, memory-mapping the dense arrays if requested."""
+    arrays = {}
+    for name in ARRAY_NAMES:
+        path = os.path.join(entry_dir, f"{name}.npy")
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode="r" if mmap else None)
+        else:
+            arrays[name] = sp.load_npz(os.path.join(entry_dir, f"{name}.npz"))
+    for name in ("encoder", "lb"):
+        with open(os.path.join(entry_dir, f"{name}.pkl"), "rb") as f:
+            arrays[name] = pickle.load(f)
+    arrays["test"] = pd.read_pickle(os.path.join(entry_dir, "test.pkl"))
+    return arrays
+
+
+def load_encoded_split(data_path, categorical_features, label="salary", test_size=0.20,
+                       random_state=42, cache_dir=None, mmap=True, sparse=False):
+    """ Load an encoded train/test split, from the on-disk cache when possible.
+
+    On a miss the CSV is parsed, split and encoded, and the result is stored
+    under `cache_dir/<key>/` as .npy arrays (.npz for sparse matrices) plus
+    the pickled encoders and raw test rows. On a hit none of that work is
+    repeated; dense arrays are memory-mapped read-only unless `mmap` is False.
+
+    Inputs
+    ------
+    data_path : str
+        CSV file with the census.csv schema.
+    categorical_features : list[str]
+        Names of the categorical features.
+    label : str
+        Name of the label column.
+    test_size : float
+        Fraction of rows held out for testing.
+    random_state : int
+        Seed of the train/test split.
+    cache_dir : str
+        Cache location. If None, nothing is cached.
+    mmap : bool
+        Memory-map cached arrays instead of reading them into memory.
+    sparse : bool
+        Produce CSR feature matrices (see `process_data`).
+    Returns
+    -------
+    split : EncodedSplit
+    """
+    key = feature_cache_key(data_path, categorical_features, label, test_size, random_state, sparse)
+    entry_dir = os.path.join(cache_dir, key) if cache_dir is not None else None
+
+    if entry_dir is not None and os.path.isdir(entry_dir):
+        return EncodedSplit(key=key, hit=True, **_read_entry(entry_dir, mmap))
+
+    arrays = build_encoded_split(
+        read_census(data_path), categorical_features, label, test_size, random_state, sparse
+    )
+    if entry_dir is not None:
+        _write_entry(entry_dir, arrays)
+    return EncodedSplit(key=key, hit=False, **arrays)
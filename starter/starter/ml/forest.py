@@ -0,0 +1,303 @@
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.sparse as sp
+
+# Version of the on-disk layout written by save_compiled_forest
+FORMAT_VERSION = 2
+
+# Arrays stored by save_compiled_forest, one .npy file each
+ARRAY_NAMES = (
+    "feature", "threshold", "left", "right", "missing_left", "value", "roots", "classes", "children"
+)
+
+
+class CompiledForest:
+    """ Flat, array-based copy of a fitted RandomForestClassifier.
+
+    The nodes of every tree are concatenated into contiguous arrays. Leaves
+    point to themselves, so all rows and all trees can be advanced one level
+    at a time with vectorized NumPy operations. `predict_proba` reproduces
+    sklearn's arithmetic: features are compared as float32 against float64
+    thresholds, each leaf holds its normalized class distribution, and trees
+    are accumulated in order before dividing by the number of trees.
+
+    Inputs
+    ------
+    feature : np.ndarray
+        Feature index tested at each node (0 for leaves), as intp.
+    threshold : np.ndarray
+        Split threshold at each node (+inf for leaves).
+    left, right : np.ndarray
+        Global index of the left/right child of each node (itself for leaves).
+    missing_left : np.ndarray
+        Whether missing values go to the left child at each node.
+    value : np.ndarray
+        Normalized class distribution at each node, shape (n_nodes, n_classes).
+    roots : np.ndarray
+        Global index of the root node of each tree.
+    classes : np.ndarray
+        Class labels, as in `RandomForestClassifier.classes_`.
+    n_features : int
+        Number of input features.
+    max_depth : int
+        Depth of the deepest tree.
+    children : np.ndarray
+        Interleaved (left, right) children, indexed by 2 * node + go_right.
+        Derived from `left` and `right` if not given.
+
+    All arrays are used as given, so read-only memory-mapped arrays work and
+    their pages are shared between processes that map the same files.
+    """
+
+    # Upper bound on rows x trees evaluated at once, to bound memory
+    chunk_cells = 1 << 17
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, classes,
+                 n_features, max_depth, children=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        self.max_depth = max_depth
+        if children is None:
+            # intp, so the level-by-level walk indexes without conversions
+            children = np.stack([left, right], axis=1).ravel().astype(np.intp)
+        self.children = children
+
+    @property
+    def n_estimators(self):
+        """Number of trees."""
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        """Total number of nodes over all trees."""
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        """Memory used by the node arrays."""
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES if name != "classes") \
+            + self.classes_.nbytes
+
+    def _chunks(self, X):
+        """Validate X and yield dense float32 row chunks with their offsets."""
+        if sp.issparse(X):
+            X = X.tocsr().astype(np.float32)
+        else:
+            X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but CompiledForest is expecting "
+                f"{self.n_features_in_} features as input"
+            )
+        step = max(1, self.chunk_cells // max(1, self.n_estimators))
+        for start in range(0, X.shape[0], step):
+            chunk = X[start:start + step]
+            if sp.issparse(chunk):
+                chunk = chunk.toarray()
+            yield start, np.ascontiguousarray(chunk)
+
+    def _apply_dense(self, X):
+        """Walk a dense float32 chunk down every tree, one level at a time."""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, np.newaxis]
+        nodes = np.repeat(self.roots.astype(np.intp)[np.newaxis, :], n_rows, axis=0)
+        has_missing = bool(np.isnan(flat).any())
+        for _ in range(self.max_depth):
+            x = flat.take(row_offsets + self.feature.take(nodes))
+            go_right = ~(x <= self.threshold.take(nodes))
+            if has_missing:
+                missing = np.isnan(x)
+                go_right[missing] = ~self.missing_left.take(nodes[missing])
+            nodes = self.children.take(2 * nodes + go_right)
+        return nodes
+
+    def apply(self, X):
+        """ Leaf reached by every row in every tree.
+
+        Inputs
+        ------
+        X : np.ndarray or scipy.sparse matrix
+            Data used for prediction.
+        Returns
+        -------
+        leaves : np.ndarray
+            Global leaf index, shape (n_rows, n_trees).
+        """
+        leaves = np.empty((X.shape[0], self.n_estimators), dtype=np.intp)
+        for start, chunk in self._chunks(X):
+            leaves[start:start + len(chunk)] = self._apply_dense(chunk)
+        return leaves
+
+    def predict_proba(self, X):
+        """ Class probabilities, identical to `RandomForestClassifier.predict_proba`.
+
+        Inputs
+        ------
+        X : np.ndarray or scipy.sparse matrix
+            Data used for prediction.
+        Returns
+        -------
+        proba : np.ndarray
+            Shape (n_rows, n_classes).
+        """
+        proba = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start, chunk in self._chunks(X):
+            leaves = self._apply_dense(chunk)
+            # cumsum adds the trees strictly in order, like sklearn's accumulation
+            proba[start:start + len(chunk)] = np.cumsum(self.value[leaves], axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        """ Predicted classes, identical to `RandomForestClassifier.predict`.
+
+        Inputs
+        ------
+        X : np.ndarray or scipy.sparse matrix
+            Data used for prediction.
+        Returns
+        -------
+        preds : np.ndarray
+            Predictions from the model.
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def compile_forest(model):
+    """ Export a fitted RandomForestClassifier into a CompiledForest.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained single-output classifier.
+    Returns
+    -------
+    forest : CompiledForest
+    """
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        ids = np.arange(offset, offset + n_nodes)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, ids, tree.children_left + offset))
+        rights.append(np.where(is_leaf, ids, tree.children_right + offset))
+        missing.append(
+            getattr(tree, "missing_go_to_left", np.zeros(n_nodes, dtype=np.uint8)).astype(bool)
+        )
+
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        missing_left=np.concatenate(missing),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.int32),
+        classes=np.asarray(model.classes_),
+        n_features=int(model.n_features_in_),
+        max_depth=int(max_depth),
+    )
+
+
+def save_compiled_forest(forest, path):
+    """ Save a CompiledForest as a directory of .npy arrays plus `forest.json`.
+
+    Each file is written under a temporary name and renamed into place, with
+    `forest.json` last, so a forest already loaded from `path` with `mmap=True`
+    keeps reading the old files instead of seeing them rewritten.
+
+    Inputs
+    ------
+    forest : CompiledForest
+        Compiled model.
+    path : str
+        Directory to write.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAY_NAMES:
+        array = forest.classes_ if name == "classes" else getattr(forest, name)
+        with _replacing(os.path.join(path, f"{name}.npy"), "wb") as f:
+            np.save(f, array, allow_pickle=False)
+    with _replacing(os.path.join(path, "forest.json"), "w") as f:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "n_features": forest.n_features_in_,
+            "n_estimators": forest.n_estimators,
+            "n_nodes": forest.n_nodes,
+            "max_depth": forest.max_depth,
+        }, f, indent=2)
+
+
+@contextmanager
+def _replacing(path, mode):
+    """Write a file under a temporary name next to `path`, then rename it onto `path`."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_compiled_forest(path, mmap=False):
+    """ Load a CompiledForest written by `save_compiled_forest`.
+
+    Inputs
+    ------
+    path : str
+        Directory containing the arrays and `forest.json`.
+    mmap : bool
+        Memory-map the arrays read-only instead of reading them into memory.
+        Loading is then nearly free and the pages are only read on first use.
+    Returns
+    -------
+    forest : CompiledForest
+    """
+    with open(os.path.join(path, "forest.json")) as f:
+        meta = json.load(f)
+    if meta["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported compiled forest format {meta['format_version']}; "
+            f"re-run save_compiled_forest to write format {FORMAT_VERSION}"
+        )
+    # np.asarray drops the np.memmap subclass, whose per-operation overhead
+    # dominates small predictions, while keeping the mapped buffer
+    arrays = {
+        name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None,
+                                 allow_pickle=False))
+        for name in ARRAY_NAMES
+    }
+    return CompiledForest(n_features=meta["n_features"], max_depth=meta["max_depth"], **arrays)
@@ -0,0 +1,313 @@
+"""
+Incremental retraining: trees fitted on new data batches are added to an existing forest.
+"""
+
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from .data import encoder_from_manifest, encoder_to_manifest, process_data
+from .model import compute_model_metrics, inference
+
+# File next to model.pkl listing the data every group of trees was fitted on
+PROVENANCE_FILE = "provenance.json"
+
+
+def find_new_categories(encoder, data, categorical_features):
+    """
+    Categorical values of a data batch that the encoder has never seen.
+
+    Inputs
+    ------
+    encoder : OneHotEncoder
+        Trained encoder.
+    data : pd.DataFrame
+        Raw data holding the categorical columns.
+    categorical_features : list[str]
+        Names of the categorical features, in the encoder's order.
+    Returns
+    -------
+    new_categories : dict
+        Feature name to the list of unseen values, in order of first
+        appearance; features without unseen values are left out.
+    """
+    found = {}
+    for feature, known in zip(categorical_features, encoder.categories_):
+        known = set(known.tolist())
+        unseen = [value for value in pd.unique(data[feature].dropna()) if value not in known]
+        if unseen:
+            found[feature] = unseen
+    return found
+
+
+def extend_encoder(encoder, categorical_features, new_categories):
+    """
+    Copy of an encoder with extra categories appended to some features.
+
+    Known categories keep their relative order, so every existing one-hot
+    column has a counterpart in the extended encoding (see `feature_index_map`).
+
+    Inputs
+    ------
+    encoder : OneHotEncoder
+        Trained encoder, left unchanged.
+    categorical_features : list[str]
+        Names of the categorical features, in the encoder's order.
+    new_categories : dict
+        Output of `find_new_categories`.
+    Returns
+    -------
+    encoder : OneHotEncoder
+    """
+    manifest = encoder_to_manifest(encoder)
+    for feature, categories in zip(categorical_features, manifest["categories"]):
+        categories.extend(new_categories.get(feature, []))
+    return encoder_from_manifest(manifest)
+
+
+def feature_index_map(old_encoder, new_encoder, n_continuous):
+    """
+    Column of the new encoding holding each column of the old one.
+
+    Inputs
+    ------
+    old_encoder : OneHotEncoder
+        Encoder the model was trained with.
+    new_encoder : OneHotEncoder
+        Output of `extend_encoder`.
+    n_continuous : int
+        Number of continuous columns ahead of the one-hot block.
+    Returns
+    -------
+    index_map : np.ndarray
+        `index_map[j]` is the new position of old column `j`.
+    """
+    index_map = list(range(n_continuous))
+    offset = n_continuous
+    for old, new in zip(old_encoder.categories_, new_encoder.categories_):
+        position = {value: i for i, value in enumerate(new.tolist())}
+        index_map.extend(offset + position[value] for value in old.tolist())
+        offset += len(new)
+    return np.asarray(index_map, dtype=np.intp)
+
+
+def remap_features(model, index_map, n_features):
+    """
+    Copy of a forest reading its inputs from the columns of a wider encoding.
+
+    Every split on old column `j` becomes a split on column `index_map[j]`;
+    the thresholds and leaves are unchanged, so the copy predicts on the new
+    encoding exactly what `model` predicts on the old one. New columns are
+    never read by the existing trees.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model, left unchanged.
+    index_map : np.ndarray
+        Output of `feature_index_map`.
+    n_features : int
+        Width of the new encoding.
+    Returns
+    -------
+    model : RandomForestClassifier
+    """
+    estimators = []
+    for estimator in model.estimators_:
+        cls, args, state = estimator.tree_.__reduce__()
+        nodes = state["nodes"].copy()
+        split = nodes["feature"] >= 0
+        nodes["feature"][split] = index_map[nodes["feature"][split]]
+        tree = cls(n_features, *args[1:])
+        tree.__setstate__({**state, "nodes": nodes})
+
+        estimator = copy.copy(estimator)
+        estimator.tree_ = tree
+        estimator.n_features_in_ = n_features
+        estimators.append(estimator)
+
+    model = copy.copy(model)
+    model.estimators_ = estimators
+    model.n_features_in_ = n_features
+    return model
+
+
+def add_trees(model, X, y, n_estimators=10, n_jobs=None):
+    """
+    Copy of a forest with `n_estimators` more trees, fitted on one batch only.
+
+    Uses scikit-learn's `warm_start`, so the existing trees are kept as they
+    are and fitting time depends on the batch, not on the data seen before.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model, left unchanged.
+    X : np.ndarray or scipy.sparse.csr_matrix
+        Encoded batch, in the model's encoding.
+    y : np.ndarray
+        Labels of the batch.
+    n_estimators : int
+        Number of trees to add.
+    n_jobs : int
+        joblib workers used to fit the new trees, or None for the model's own
+        setting.
+    Returns
+    -------
+    model : RandomForestClassifier
+    """
+    if n_estimators < 1:
+        raise ValueError("n_estimators must be at least 1")
+    if not np.array_equal(np.unique(y), model.classes_):
+        raise ValueError(f"The batch must contain every class the model was trained on {model.classes_.tolist()}")
+    model = copy.copy(model)
+    model.estimators_ = list(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_estimators)
+    if n_jobs is not None:
+        model.set_params(n_jobs=n_jobs)
+    model.fit(X, y)
+    model.set_params(warm_start=False)
+    return model
+
+
+def train_increment(model, encoder, lb, batch, categorical_features, label="salary", n_estimators=10,
+                    n_jobs=None, sparse=False):
+    """
+    Add trees fitted on a new data batch to an existing model.
+
+    Categories not seen before are appended to a copy of the encoder and the
+    existing trees are remapped to the wider encoding; the batch is then
+    scored by the current model (test-then-train, giving an honest estimate
+    of how the model does on the new data) before new trees are fitted on it.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model.
+    encoder : OneHotEncoder
+        Encoder the model was trained with.
+    lb : LabelBinarizer
+        Trained label binarizer.
+    batch : pd.DataFrame
+        New raw data, including the label column.
+    categorical_features : list[str]
+        Names of the categorical features.
+    label : str
+        Name of the label column.
+    n_estimators : int
+        Number of trees fitted on the batch.
+    n_jobs : int
+        joblib workers used to fit the new trees.
+    sparse : bool
+        Encode the batch as a sparse CSR matrix.
+    Returns
+    -------
+    model : RandomForestClassifier
+        Updated copy of the model.
+    encoder : OneHotEncoder
+        Encoder to use with it, extended if the batch had new categories.
+    record : dict
+        Provenance of the batch: rows, trees added, new categories, metrics of
+        the previous model on the batch and fitting time.
+    """
+    start = time.perf_counter()
+    new_categories = find_new_categories(encoder, batch, categorical_features)
+    if new_categories:
+        extended = extend_encoder(encoder, categorical_features, new_categories)
+        n_continuous = model.n_features_in_ - sum(len(categories) for categories in encoder.categories_)
+        n_features = n_continuous + sum(len(categories) for categories in extended.categories_)
+        model = remap_features(model, feature_index_map(encoder, extended, n_continuous), n_features)
+        encoder = extended
+
+    X, y, _, _ = process_data(
+        batch, categorical_features=categorical_features, label=label, training=False,
+        encoder=encoder, lb=lb, sparse=sparse
+    )
+    precision, recall, fbeta = compute_model_metrics(y, inference(model, X))
+
+    first_tree = len(model.estimators_)
+    model = add_trees(model, X, y, n_estimators=n_estimators, n_jobs=n_jobs)
+    record = {
+        "kind": "increment",
+        "rows": int(X.shape[0]),
+        "trees": [first_tree, len(model.estimators_)],
+        "new_categories": {feature: [str(value) for value in values] for feature, values in new_categories.items()},
+        "prior_metrics": {"precision": float(precision), "recall": float(recall), "fbeta": float(fbeta)},
+        "seconds": time.perf_counter() - start,
+    }
+    return model, encoder, record
+
+
+def provenance_record(kind, rows, trees, source=None, digest=None, **extra):
+    """
+    Stamp a provenance record with its data source and the training environment.
+
+    Inputs
+    ------
+    kind : str
+        "full" for a model trained from scratch, "increment" for added trees.
+    rows : int
+        Number of training rows.
+    trees : list[int]
+        Range [first, last) of the trees fitted on this data.
+    source : str
+        Path of the data file.
+    digest : str
+        SHA-256 of the data file.
+    **extra
+        Additional fields, e.g. the rest of a `train_increment` record.
+    Returns
+    -------
+    record : dict
+    """
+    return {
+        **extra,
+        "kind": kind,
+        "rows": int(rows),
+        "trees": list(trees),
+        "source": source,
+        "digest": digest,
+        "sklearn_version": sklearn.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def load_provenance(artifact_dir):
+    """
+    Provenance records of the model in a directory.
+
+    Inputs
+    ------
+    artifact_dir : str
+        Directory with model.pkl.
+    Returns
+    -------
+    records : list[dict]
+        Oldest first; empty when the model has no provenance file.
+    """
+    path = os.path.join(artifact_dir, PROVENANCE_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)["batches"]
+
+
+def save_provenance(records, artifact_dir):
+    """
+    Write provenance records next to a model.
+
+    Inputs
+    ------
+    records : list[dict]
+        Oldest first.
+    artifact_dir : str
+        Directory with model.pkl.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    with open(os.path.join(artifact_dir, PROVENANCE_FILE), "w") as f:
+        json.dump({"batches": records}, f, indent=2)
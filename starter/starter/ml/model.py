@@ -1,10 +1,22 @@
 from sklearn.metrics import fbeta_score, precision_score, recall_score
 from sklearn.ensemble import RandomForestClassifier
+import numpy as np
+import copy
+import json
 import pickle
 import os
 
+from .forest import load_compiled_forest
 
-def train_model(X_train, y_train):
+
+# Forest hyperparameters used unless train_model is given others
+DEFAULT_PARAMS = {
+    "n_estimators": 100,
+    "max_depth": 10,
+}
+
+
+def train_model(X_train, y_train, n_jobs=-1, **params):
     """
     Trains a machine learning model and returns it.
 
@@ -14,21 +26,54 @@ def train_model(X_train, y_train):
         Training data.
     y_train : np.ndarray
         Labels.
+    n_jobs : int
+        Number of joblib workers used to fit the trees (-1 for all CPUs).
+        The fitted model keeps this setting for prediction unless it is
+        overridden with `with_n_jobs`.
+    **params
+        RandomForestClassifier hyperparameters overriding `DEFAULT_PARAMS`,
+        e.g. the ones picked by `ml.search`.
     Returns
     -------
     model : RandomForestClassifier
         Trained machine learning model.
     """
     model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
+        **{**DEFAULT_PARAMS, **params},
         random_state=42,
-        n_jobs=-1
+        n_jobs=n_jobs
     )
     model.fit(X_train, y_train)
     return model
 
 
+def with_n_jobs(model, n_jobs):
+    """
+    Copy of a model that predicts with a different number of joblib workers.
+
+    The copy is shallow, so the fitted trees are shared with `model` and both
+    can be used concurrently.
+
+    Inputs
+    ------
+    model : RandomForestClassifier or CompiledForest
+        Trained machine learning model.
+    n_jobs : int
+        Number of joblib workers (-1 for all CPUs), or None to keep the
+        model's own setting.
+    Returns
+    -------
+    model : RandomForestClassifier or CompiledForest
+        `model` itself when there is nothing to change, including models
+        without an `n_jobs` parameter such as CompiledForest.
+    """
+    if n_jobs is None or not hasattr(model, "n_jobs") or model.n_jobs == n_jobs:
+        return model
+    model = copy.copy(model)
+    model.n_jobs = n_jobs
+    return model
+
+
 def compute_model_metrics(y, preds):
     """
     Validates the trained machine learning model using precision, recall, and F1.
@@ -51,21 +96,45 @@ def compute_model_metrics(y, preds):
     return precision, recall, fbeta
 
 
-def inference(model, X):
+def inference(model, X, threshold=None, return_proba=False):
     """ Run model inferences and return the predictions.
 
+    When a threshold or probabilities are requested, labels and scores come
+    from the same `predict_proba` pass, so the forest is evaluated once.
+
     Inputs
     ------
     model : RandomForestClassifier
         Trained machine learning model.
     X : np.ndarray
         Data used for prediction.
+    threshold : float
+        Decision threshold on the positive-class probability. Rows scoring at
+        or above it are predicted positive. If None, the class with the
+        highest probability is predicted, exactly as `model.predict` does.
+    return_proba : bool
+        Also return the probabilities of the positive class (label 1).
     Returns
     -------
     preds : np.ndarray
         Predictions from the model.
+    scores : np.ndarray
+        Positive-class probabilities, only returned if return_proba is True.
     """
-    preds = model.predict(X)
+    if threshold is None and not return_proba:
+        return model.predict(X)
+
+    proba = model.predict_proba(X)
+    # Models fit on a single class have no positive column
+    positive = np.flatnonzero(model.classes_ == 1)
+    scores = proba[:, positive[0]] if len(positive) else np.zeros(proba.shape[0])
+    if threshold is None:
+        preds = model.classes_.take(np.argmax(proba, axis=1), axis=0)
+    else:
+        preds = (scores >= threshold).astype(model.classes_.dtype)
+
+    if return_proba:
+        return preds, scores
     return preds
 
 
@@ -85,20 +154,27 @@ def save_model(model, path):
         pickle.dump(model, f)
 
 
-def load_model(path):
+def load_model(path, mmap=True):
     """
     Load a trained model from disk.
 
+    A directory is read as a CompiledForest written by `save_compiled_forest`,
+    memory-mapped unless `mmap` is False; anything else is unpickled.
+
     Inputs
     ------
     path : str
         Path to the saved model.
+    mmap : bool
+        Memory-map the arrays of a CompiledForest directory.
     
     Returns
     -------
-    model : RandomForestClassifier
+    model : RandomForestClassifier or CompiledForest
         Loaded machine learning model.
     """
+    if os.path.isdir(path):
+        return load_compiled_forest(path, mmap=mmap)
     with open(path, 'rb') as f:
         model = pickle.load(f)
     return model
@@ -108,6 +184,9 @@ def save_encoder(encoder, path):
     """
     Save an encoder to disk.
 
+    Paths ending in `.json` get a JSON manifest of the fitted categories
+    (see `encoder_to_manifest`), anything else a pickle.
+
     Inputs
     ------
     encoder : OneHotEncoder or LabelBinarizer
@@ -115,7 +194,13 @@ def save_encoder(encoder, path):
     path : str
         Path to save the encoder.
     """
+    from .data import encoder_to_manifest
+
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".json"):
+        with open(path, 'w') as f:
+            json.dump(encoder_to_manifest(encoder), f, indent=2)
+        return
     with open(path, 'wb') as f:
         pickle.dump(encoder, f)
 
@@ -134,15 +219,57 @@ def load_encoder(path):
     encoder : OneHotEncoder or LabelBinarizer
         Loaded encoder.
     """
+    from .data import encoder_from_manifest
+
+    if path.endswith(".json"):
+        with open(path) as f:
+            return encoder_from_manifest(json.load(f))
     with open(path, 'rb') as f:
         encoder = pickle.load(f)
     return encoder
 
 
+def compute_metrics_from_counts(tp, fp, fn):
+    """
+    Precision, recall, and F1 from confusion counts.
+
+    Vectorized equivalent of `compute_model_metrics`: the same arithmetic as
+    sklearn's scorers, with a score of 1 whenever its denominator is zero.
+
+    Inputs
+    ------
+    tp, fp, fn : np.ndarray
+        True positive, false positive and false negative counts.
+    Returns
+    -------
+    precision : np.ndarray
+    recall : np.ndarray
+    fbeta : np.ndarray
+    """
+    tp = np.asarray(tp, dtype=np.int64)
+    pred_sum = tp + np.asarray(fp, dtype=np.int64)
+    true_sum = tp + np.asarray(fn, dtype=np.int64)
+
+    def divide(numerator, denominator):
+        mask = denominator == 0
+        denominator = np.where(mask, 1, denominator).astype(np.float64)
+        result = np.asarray(numerator, dtype=np.float64) / denominator
+        result[mask] = 1.0
+        return result
+
+    precision = divide(tp, pred_sum)
+    recall = divide(tp, true_sum)
+    fbeta = divide(2.0 * tp, true_sum + pred_sum)
+    return precision, recall, fbeta
+
+
 def compute_model_metrics_on_slices(model, X, y, feature_slice, categorical_features, encoder):
     """
     Compute model metrics on data slices.
 
+    The data is encoded and scored once, then metrics are computed per slice
+    from grouped confusion counts.
+
     Inputs
     ------
     model : RandomForestClassifier
@@ -164,40 +291,28 @@ def compute_model_metrics_on_slices(model, X, y, feature_slice, categorical_feat
         Dictionary containing metrics for each slice.
     """
     from .data import process_data
+    from .slices import compute_crossed_slice_counts, slice_metrics_from_counts
     
-    slice_metrics = {}
-    unique_values = X[feature_slice].unique()
+    X_processed, _, _, _ = process_data(
+        X,
+        categorical_features=categorical_features,
+        label=None,
+        training=False,
+        encoder=encoder,
+        lb=None
+    )
+    preds = inference(model, X_processed)
     
-    for value in unique_values:
-        # Get slice of data
-        slice_idx = X[feature_slice] == value
-        X_slice = X[slice_idx]
-        y_slice = y[slice_idx]
-        
-        if len(X_slice) == 0:
-            continue
-        
-        # Process the slice
-        X_processed, y_processed, _, _ = process_data(
-            X_slice.copy(),
-            categorical_features=categorical_features,
-            label=None,
-            training=False,
-            encoder=encoder,
-            lb=None
-        )
-        
-        # Make predictions
-        preds = inference(model, X_processed)
-        
-        # Compute metrics
-        precision, recall, fbeta = compute_model_metrics(y_slice.values, preds)
-        
-        slice_metrics[value] = {
-            'precision': precision,
-            'recall': recall,
-            'fbeta': fbeta,
-            'n_samples': len(X_slice)
-        }
+    metrics = slice_metrics_from_counts(
+        compute_crossed_slice_counts(X, np.asarray(y), preds, [(feature_slice,)])
+    )
     
-    return slice_metrics
+    return {
+        row.value: {
+            'precision': row.precision,
+            'recall': row.recall,
+            'fbeta': row.fbeta,
+            'n_samples': row.n_samples
+        }
+        for row in metrics.itertuples(index=False)
+    }
@@ -0,0 +1,290 @@
+"""
+Hyperparameter search for the forest, trading F1 against inference latency.
+
+Candidates are cross-validated in parallel with successive halving: every
+round fits the surviving configurations on more rows and keeps the best
+1/factor of them, so unpromising configurations are dropped after being fit
+on a small sample only.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV, HalvingRandomSearchCV
+
+from .forest import compile_forest
+from .model import DEFAULT_PARAMS, compute_model_metrics, inference, train_model, with_n_jobs
+
+# Searched when no space is given
+DEFAULT_SPACE = {
+    "n_estimators": [50, 100, 200],
+    "max_depth": [8, 10, 14, None],
+    "min_samples_leaf": [1, 5],
+    "max_features": ["sqrt", 0.3],
+}
+
+LATENCY_FORMATS = ("pickle", "compiled")
+
+
+def _parse_value(text):
+    """Hyperparameter value from its text: int, float, None, bool or string."""
+    text = text.strip()
+    if text in ("None", "none", "null"):
+        return None
+    if text in ("True", "true", "False", "false"):
+        return text.lower() == "true"
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_search_space(spec):
+    """
+    Search space from its command-line form.
+
+    Inputs
+    ------
+    spec : str
+        Semicolon-separated `name=value,value` pairs, e.g.
+        "n_estimators=50,100;max_depth=8,None;max_features=sqrt,0.3".
+    Returns
+    -------
+    space : dict
+        Hyperparameter name to the list of candidate values.
+    """
+    space = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        name, sep, values = entry.partition("=")
+        if not sep or not name.strip() or not values.strip():
+            raise ValueError(f"Invalid search space entry {entry!r}, expected name=value,value")
+        space[name.strip()] = [_parse_value(value) for value in values.split(",")]
+    if not space:
+        raise ValueError("The search space is empty")
+    unknown = set(space) - (set(RandomForestClassifier().get_params()) - {"n_jobs", "random_state", "warm_start"})
+    if unknown:
+        raise ValueError(f"Parameters {sorted(unknown)} cannot be searched")
+    return space
+
+
+def search_forest(X, y, space=None, n_candidates=None, cv=3, factor=3, n_jobs=-1, random_state=42):
+    """
+    Successive-halving search over forest hyperparameters.
+
+    Inputs
+    ------
+    X : np.ndarray or scipy.sparse.csr_matrix
+        Encoded training data.
+    y : np.ndarray
+        Labels.
+    space : dict
+        Hyperparameter name to candidate values (default: `DEFAULT_SPACE`).
+        Parameters left out keep the values of `DEFAULT_PARAMS`.
+    n_candidates : int
+        Sample this many random configurations from the space instead of
+        trying the full grid.
+    cv : int
+        Cross-validation folds.
+    factor : int
+        Each round keeps 1/factor of the candidates on factor times the rows.
+    n_jobs : int
+        Folds and candidates fitted in parallel (-1 for all CPUs); each forest
+        is fitted single-threaded.
+    random_state : int
+        Seed of the forests, the folds and the random sample of candidates.
+    Returns
+    -------
+    search : HalvingGridSearchCV or HalvingRandomSearchCV
+        Fitted search; nothing is refit on the full data.
+    """
+    space = DEFAULT_SPACE if space is None else space
+    estimator = RandomForestClassifier(**DEFAULT_PARAMS, random_state=random_state, n_jobs=1)
+    options = dict(
+        factor=factor, resource="n_samples", cv=cv, scoring="f1", refit=False,
+        n_jobs=n_jobs, random_state=random_state, error_score="raise",
+    )
+    if n_candidates is None:
+        search = HalvingGridSearchCV(estimator, space, **options)
+    else:
+        search = HalvingRandomSearchCV(estimator, space, n_candidates=n_candidates, **options)
+    return search.fit(X, y)
+
+
+def search_results(search):
+    """
+    One row per candidate with its last round, CV F1 and CV scoring latency.
+
+    Inputs
+    ------
+    search : HalvingGridSearchCV or HalvingRandomSearchCV
+        Output of `search_forest`.
+    Returns
+    -------
+    results : pd.DataFrame
+        Columns params, rounds (how many rounds the candidate survived),
+        n_resources (training rows in its last round), f1 and f1_std (CV F1
+        in that round) and cv_us_per_row (scoring time per validation row),
+        best first.
+    """
+    cv_results = pd.DataFrame(search.cv_results_)
+    cv_results["key"] = cv_results["params"].map(lambda params: repr(sorted(params.items())))
+    last = cv_results.sort_values("iter").groupby("key", sort=False).tail(1)
+    # n_resources rows are split into n_splits folds, one of them validating
+    validation_rows = last["n_resources"] / search.n_splits_
+    results = pd.DataFrame({
+        "params": last["params"],
+        "rounds": last["iter"] + 1,
+        "n_resources": last["n_resources"],
+        "f1": last["mean_test_score"],
+        "f1_std": last["std_test_score"],
+        "cv_us_per_row": 1e6 * last["mean_score_time"] / validation_rows,
+    })
+    return results.sort_values(["rounds", "f1"], ascending=False).reset_index(drop=True)
+
+
+def measure_latency(model, X, batch_size=1, repeat=3, max_rows=2000):
+    """
+    Inference time per row of a fitted model.
+
+    Inputs
+    ------
+    model : RandomForestClassifier or CompiledForest
+        Trained machine learning model.
+    X : np.ndarray or scipy.sparse.csr_matrix
+        Encoded rows to score.
+    batch_size : int
+        Rows per inference call.
+    repeat : int
+        Timed passes; the fastest is kept.
+    max_rows : int
+        Rows scored per pass.
+    Returns
+    -------
+    seconds : float
+        Seconds per row.
+    """
+    X = X[:max_rows]
+    n_rows = X.shape[0]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for offset in range(0, n_rows, batch_size):
+            inference(model, X[offset:offset + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return best / n_rows
+
+
+def evaluate_finalists(results, X_train, y_train, X_test, y_test, top_k=5, n_jobs=-1,
+                       latency_format="pickle", batch_size=1000):
+    """
+    Refit the best candidates of the last round on all training rows and measure F1 and latency.
+
+    Only candidates that reached the last round are refit: their CV F1 was
+    measured on the same number of rows, so it can be compared.
+
+    Inputs
+    ------
+    results : pd.DataFrame
+        Output of `search_results`.
+    X_train, y_train : np.ndarray
+        Training data and labels.
+    X_test, y_test : np.ndarray
+        Held-out data and labels.
+    top_k : int
+        Number of last-round candidates to refit, best first.
+    n_jobs : int
+        joblib workers used to fit each forest. Latency is measured
+        single-threaded, as the API serves single rows.
+    latency_format : str
+        "pickle" to time the scikit-learn forest, "compiled" its CompiledForest.
+    batch_size : int
+        Rows per call for the batch latency.
+    Returns
+    -------
+    finalists : pd.DataFrame
+        The top last-round rows of `results` plus test precision, recall and
+        F1, single-row and batch microseconds per row, and n_nodes.
+    """
+    finalists = last_round(results).head(top_k).copy()
+    rows = []
+    for params in finalists["params"]:
+        model = train_model(X_train, y_train, n_jobs=n_jobs, **params)
+        precision, recall, fbeta = compute_model_metrics(y_test, inference(model, X_test))
+        served = compile_forest(model) if latency_format == "compiled" else with_n_jobs(model, 1)
+        rows.append({
+            "test_precision": precision,
+            "test_recall": recall,
+            "test_f1": fbeta,
+            "single_us_per_row": 1e6 * measure_latency(served, X_test, batch_size=1, max_rows=200),
+            "batch_us_per_row": 1e6 * measure_latency(served, X_test, batch_size=batch_size),
+            "n_nodes": int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+        })
+    return pd.concat([finalists.reset_index(drop=True), pd.DataFrame(rows)], axis=1)
+
+
+def last_round(results):
+    """Rows of `search_results` (or of finalists) for the candidates that reached the last round."""
+    return results[results["rounds"] == results["rounds"].max()]
+
+
+def choose_params(finalists, max_us_per_row=None, latency_column="single_us_per_row"):
+    """
+    Hyperparameters of the finalist with the best CV F1 within a latency budget.
+
+    Only finalists from the last round are eligible, as candidates dropped
+    earlier were scored on fewer rows. The test F1 is only reported, so that
+    the held-out rows do not take part in the choice.
+
+    Inputs
+    ------
+    finalists : pd.DataFrame
+        Output of `evaluate_finalists`.
+    max_us_per_row : float
+        Latency budget in microseconds per row, or None for no budget.
+    latency_column : str
+        Latency the budget applies to.
+    Returns
+    -------
+    params : dict
+    """
+    eligible = last_round(finalists)
+    if max_us_per_row is not None:
+        fastest = eligible[latency_column].min()
+        eligible = eligible[eligible[latency_column] <= max_us_per_row]
+        if eligible.empty:
+            raise ValueError(
+                f"No last-round candidate meets the budget of {max_us_per_row} us/row; "
+                f"the fastest takes {fastest:.1f}"
+            )
+    return dict(eligible.loc[eligible["f1"].idxmax(), "params"])
+
+
+def format_results(finalists):
+    """Render the finalists as a fixed-width table, best CV F1 first."""
+    lines = [
+        f"{'CV F1':>7} {'test F1':>8} {'rounds':>6} {'1 row us':>9} {'batch us':>9} {'nodes':>9}  params"
+    ]
+    for row in finalists.sort_values("f1", ascending=False).itertuples(index=False):
+        params = ", ".join(f"{name}={value}" for name, value in sorted(row.params.items()))
+        lines.append(
+            f"{row.f1:>7.4f} {row.test_f1:>8.4f} {row.rounds:>6} {row.single_us_per_row:>9.1f} "
+            f"{row.batch_us_per_row:>9.2f} {row.n_nodes:>9}  {params}"
+        )
+    return "\n".join(lines)
+
+
+def results_to_records(results):
+    """JSON-serializable list of result rows."""
+    records = []
+    for row in results.to_dict(orient="records"):
+        records.append({
+            name: (value.item() if isinstance(value, np.generic) else value) for name, value in row.items()
+        })
+    return records
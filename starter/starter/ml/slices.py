@@ -0,0 +1,275 @@
+"""
+Slice metrics over single or crossed features, computed in chunks and in parallel.
+"""
+
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .data import process_data
+from .model import compute_metrics_from_counts, inference
+
+# Separator between the features of a crossed slice, and between their values
+CROSS = " x "
+
+# Separators accepted between crossed features in a specification
+CROSS_PATTERN = re.compile(r"\s+x\s+|\*")
+
+# Additive columns of a slice count table
+COUNT_COLUMNS = ["n_samples", "tp", "fp", "fn"]
+
+# Model state loaded once per process by the pool initializer
+_worker_state = None
+
+
+def parse_slice_specs(specs):
+    """
+    Normalize slice specifications.
+
+    Inputs
+    ------
+    specs : list[str or tuple[str]]
+        Feature names ("race"), crossed features written with " x " or "*"
+        ("race x sex", "race*sex"), or tuples of feature names.
+    Returns
+    -------
+    specs : list[tuple[str]]
+        One tuple of feature names per slice specification.
+    """
+    parsed = []
+    for spec in specs:
+        if isinstance(spec, str):
+            spec = CROSS_PATTERN.split(spec)
+        spec = tuple(feature.strip() for feature in spec)
+        if not spec or not all(spec):
+            raise ValueError(f"Invalid slice specification {spec!r}")
+        parsed.append(spec)
+    return parsed
+
+
+def slice_name(spec):
+    """Name of a slice specification, e.g. "race x sex"."""
+    return CROSS.join(spec)
+
+
+def compute_crossed_slice_counts(slice_data, y, preds, specs):
+    """
+    Confusion counts for every observed combination of values of each spec.
+
+    Inputs
+    ------
+    slice_data : pd.DataFrame
+        Raw (unencoded) data holding the sliced columns.
+    y : np.ndarray
+        Known labels, binarized.
+    preds : np.ndarray
+        Predicted labels, binarized.
+    specs : list[tuple[str]]
+        Slice specifications from `parse_slice_specs`.
+    Returns
+    -------
+    counts : pd.DataFrame
+        One row per (spec, value combination) with columns feature (the spec
+        name), value (the values joined with " x "), n_samples, tp, fp and fn.
+        Rows with a missing value in any sliced column are left out.
+    """
+    y = np.asarray(y) == 1
+    preds = np.asarray(preds) == 1
+    outcomes = np.stack([y & preds, ~y & preds, y & ~preds], axis=1).astype(np.int64)
+
+    frames = []
+    for spec in specs:
+        # Mixed-radix code of each row's value combination
+        factorized = [pd.factorize(slice_data[feature], sort=False) for feature in spec]
+        present = np.logical_and.reduce([codes >= 0 for codes, _ in factorized])
+        combined = np.zeros(len(slice_data), dtype=np.int64)
+        for codes, values in factorized:
+            combined = combined * len(values) + codes
+        combos, inverse = np.unique(combined[present], return_inverse=True)
+        spec_outcomes = outcomes[present]
+
+        # Decode each combination back into one value per feature
+        labels = [[] for _ in combos]
+        remainder = combos
+        for codes, values in reversed(factorized):
+            remainder, index = np.divmod(remainder, len(values))
+            for label, i in zip(labels, index):
+                label.insert(0, str(values[i]))
+
+        frames.append(pd.DataFrame({
+            "feature": slice_name(spec),
+            "value": np.array([CROSS.join(label) for label in labels], dtype=object),
+            "n_samples": np.bincount(inverse, minlength=len(combos)),
+            **{
+                name: np.bincount(inverse, weights=spec_outcomes[:, i], minlength=len(combos)).astype(np.int64)
+                for i, name in enumerate(("tp", "fp", "fn"))
+            },
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_slice_counts(counts):
+    """
+    Add up count tables computed on disjoint chunks of data.
+
+    Inputs
+    ------
+    counts : list[pd.DataFrame]
+        Tables from `compute_crossed_slice_counts`.
+    Returns
+    -------
+    counts : pd.DataFrame
+        One row per (feature, value), in order of first appearance.
+    """
+    merged = pd.concat(counts, ignore_index=True)
+    return merged.groupby(["feature", "value"], sort=False)[COUNT_COLUMNS].sum().reset_index()
+
+
+def slice_metrics_from_counts(counts, min_support=1):
+    """
+    Precision, recall, and F1 of every slice with enough samples.
+
+    Inputs
+    ------
+    counts : pd.DataFrame
+        Merged count table.
+    min_support : int
+        Slices with fewer samples are dropped.
+    Returns
+    -------
+    metrics : pd.DataFrame
+        The counts plus precision, recall and fbeta columns.
+    """
+    metrics = counts[counts["n_samples"] >= min_support].reset_index(drop=True)
+    metrics["precision"], metrics["recall"], metrics["fbeta"] = compute_metrics_from_counts(
+        metrics["tp"], metrics["fp"], metrics["fn"]
+    )
+    return metrics
+
+
+def _chunk_counts(chunk, model, encoder, lb, categorical_features, label, specs):
+    """Score one chunk and count its outcomes per slice."""
+    X, y, _, _ = process_data(
+        chunk, categorical_features=categorical_features, label=label, training=False, encoder=encoder, lb=lb
+    )
+    return compute_crossed_slice_counts(chunk, y, inference(model, X), specs)
+
+
+def _init_worker(*state):
+    """Keep the model and encoders in the pool process."""
+    global _worker_state
+    _worker_state = state
+
+
+def _chunk_counts_in_worker(chunk):
+    """Count one chunk with the pool process' own model."""
+    return _chunk_counts(chunk, *_worker_state)
+
+
+def evaluate_slices(chunks, model, encoder, lb, categorical_features, specs, label="salary",
+                    min_support=1, workers=1):
+    """
+    Slice metrics of a model over data too large to score at once.
+
+    Every chunk is encoded, scored and reduced to per-slice confusion counts,
+    optionally in a pool of `workers` processes that each receive the model
+    once. Counts are additive, so merging them gives exactly the metrics of
+    scoring all the data together. At most `2 * workers` chunks are in flight.
+
+    Inputs
+    ------
+    chunks : iterable of pd.DataFrame
+        Raw data including the label column, e.g. `pd.read_csv(..., chunksize=...)`.
+    model : RandomForestClassifier or CompiledForest
+        Trained machine learning model.
+    encoder : OneHotEncoder
+        Trained encoder.
+    lb : LabelBinarizer
+        Trained label binarizer.
+    categorical_features : list[str]
+        Names of the categorical features.
+    specs : list[str or tuple[str]]
+        Slice specifications, see `parse_slice_specs`.
+    label : str
+        Name of the label column.
+    min_support : int
+        Slices with fewer samples are left out of the result.
+    workers : int
+        Number of scoring processes (1 scores in this process).
+    Returns
+    -------
+    metrics : pd.DataFrame
+        Columns feature, value, n_samples, tp, fp, fn, precision, recall and fbeta.
+    """
+    specs = parse_slice_specs(specs)
+    state = (model, encoder, lb, list(categorical_features), label, specs)
+    counts = []
+    if workers <= 1:
+        for chunk in chunks:
+            counts.append(_chunk_counts(chunk, *state))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=state) as pool:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(pool.submit(_chunk_counts_in_worker, chunk))
+                if len(in_flight) >= 2 * workers:
+                    counts.append(in_flight.popleft().result())
+            counts.extend(future.result() for future in in_flight)
+    if not counts:
+        raise ValueError("No data to evaluate")
+    return slice_metrics_from_counts(merge_slice_counts(counts), min_support=min_support)
+
+
+def write_slice_report(slice_metrics, features, output_file):
+    """
+    Write per-slice metrics as a human-readable report.
+
+    Inputs
+    ------
+    slice_metrics : pd.DataFrame
+        Output of `slice_metrics_from_counts` or `evaluate_slices`.
+    features : list[str]
+        Features or slice names to report, in order.
+    output_file : str
+        Path of the text report.
+    """
+    with open(output_file, 'w') as f:
+        f.write("Model Performance on Data Slices\n")
+        f.write("=" * 80 + "\n\n")
+
+        for feature in features:
+            f.write(f"\nSlice Performance for Feature: {feature}\n")
+            f.write("-" * 80 + "\n")
+
+            rows = slice_metrics[slice_metrics["feature"] == feature]
+            for row in sorted(rows.itertuples(index=False), key=lambda r: r.value):
+                f.write(f"  {feature}={row.value}\n")
+                f.write(f"    Samples: {row.n_samples}\n")
+                f.write(f"    Precision: {row.precision:.4f}\n")
+                f.write(f"    Recall: {row.recall:.4f}\n")
+                f.write(f"    F1 Score: {row.fbeta:.4f}\n")
+                f.write("\n")
+
+
+def write_slice_table(slice_metrics, output_file):
+    """
+    Write per-slice metrics as CSV, or as a JSON list of records for `.json` paths.
+
+    Inputs
+    ------
+    slice_metrics : pd.DataFrame
+        Output of `slice_metrics_from_counts` or `evaluate_slices`.
+    output_file : str
+        Destination path.
+    """
+    if os.path.splitext(output_file)[1].lower() == ".json":
+        records = json.loads(slice_metrics.to_json(orient="records"))
+        with open(output_file, 'w') as f:
+            json.dump(records, f, indent=2)
+    else:
+        slice_metrics.to_csv(output_file, index=False)
@@ -0,0 +1,200 @@
+"""
+Script to score large census-style CSV files in bounded memory.
+
+Usage: python starter/score.py INPUT.csv OUTPUT.{csv,parquet} [options]
+
+The input is streamed in fixed-size chunks; each chunk is encoded with
+process_data and scored with one inference call, optionally in parallel
+across processes, and predictions are appended to the output as soon as
+they are ready.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from serving.predictor import MODEL_FORMATS, Predictor
+
+# Label column, dropped from the input if present
+LABEL = "salary"
+
+# Predictor loaded once per process when scoring in parallel
+_worker_predictor = None
+
+
+def _init_worker(model_dir, model_format):
+    """Load the artifacts once in each pool process."""
+    global _worker_predictor
+    _worker_predictor = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, model_format=model_format)
+
+
+def _score_in_worker(chunk, threshold):
+    """Score a chunk with the pool process' own predictor."""
+    return score_chunk(_worker_predictor, chunk, threshold)
+
+
+def score_chunk(predictor, chunk, threshold=None):
+    """
+    Score one chunk of census rows.
+
+    Args:
+        predictor: Loaded Predictor
+        chunk: DataFrame with the census columns (label column optional)
+        threshold: Optional decision threshold on the probability of '>50K'
+
+    Returns:
+        pd.DataFrame: `prediction` and `probability` columns, indexed like `chunk`
+    """
+    features = chunk.drop(columns=[LABEL], errors="ignore")
+    labels, scores = predictor.score_frame(features)
+    if threshold is not None:
+        labels = predictor.apply_threshold(scores, threshold)
+    return pd.DataFrame({"prediction": labels, "probability": scores}, index=chunk.index)
+
+
+class CsvWriter:
+    """Append scored chunks to a CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index_label="row")
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """Append scored chunks to a Parquet file, one row group per chunk."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError as exc:
+            raise ImportError("Writing Parquet output requires the 'pyarrow' package") from exc
+        self.path = path
+        self.writer = None
+
+    def write(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame.rename_axis("row").reset_index(), preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, output_format=None):
+    """Pick the output writer from the explicit format or the file extension."""
+    output_format = output_format or ("parquet" if path.endswith(".parquet") else "csv")
+    if output_format == "parquet":
+        return ParquetWriter(path)
+    return CsvWriter(path)
+
+
+def score_file(input_path, output_path, model_dir, chunksize=10000, workers=1,
+               threshold=None, model_format="pickle", output_format=None, progress=sys.stderr):
+    """
+    Stream a CSV through the model and write predictions incrementally.
+
+    At most `2 * workers` chunks are held in memory at once, regardless of the
+    input size. Output rows keep the input order and carry their 0-based input
+    row number in a `row` column.
+
+    Args:
+        input_path: CSV with the census.csv schema
+        output_path: Destination .csv or .parquet file
+        model_dir: Directory with model.pkl, encoder.pkl and lb.pkl
+        chunksize: Rows read and scored at a time
+        workers: Number of scoring processes (1 scores in this process)
+        threshold: Optional decision threshold on the probability of '>50K'
+        model_format: "pickle" or "compiled"
+        output_format: "csv" or "parquet" (default: from the file extension)
+        progress: Stream for progress lines, or None to stay quiet
+
+    Returns:
+        int: Number of rows scored
+    """
+    writer = open_writer(output_path, output_format)
+    reader = read_census(input_path, chunksize=chunksize)
+    start = time.perf_counter()
+    n_rows = 0
+
+    def report(frame):
+        nonlocal n_rows
+        writer.write(frame)
+        n_rows += len(frame)
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            progress.write(f"Scored {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/sec)\n")
+
+    try:
+        if workers <= 1:
+            predictor = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, model_format=model_format)
+            for chunk in reader:
+                report(score_chunk(predictor, chunk, threshold))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(model_dir, model_format)
+            ) as pool:
+                in_flight = deque()
+                for chunk in reader:
+                    in_flight.append(pool.submit(_score_in_worker, chunk, threshold))
+                    if len(in_flight) >= 2 * workers:
+                        report(in_flight.popleft().result())
+                while in_flight:
+                    report(in_flight.popleft().result())
+    finally:
+        writer.close()
+    return n_rows
+
+
+def main(argv=None):
+    """Main function to run the scoring script."""
+    default_model_dir = os.path.join(os.path.dirname(__file__), "..", "model")
+
+    parser = argparse.ArgumentParser(description="Score a census CSV file in fixed-size chunks.")
+    parser.add_argument("input", help="CSV file with the census.csv schema")
+    parser.add_argument("output", help="Output file (.csv or .parquet)")
+    parser.add_argument("--model-dir", default=default_model_dir, help="Directory with the trained artifacts")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows per chunk (default: 10000)")
+    parser.add_argument("--workers", type=int, default=1, help="Scoring processes (default: 1)")
+    parser.add_argument("--threshold", type=float, default=None, help="Decision threshold on P(>50K)")
+    parser.add_argument("--model-format", choices=MODEL_FORMATS, default="pickle")
+    parser.add_argument("--format", dest="output_format", choices=("csv", "parquet"), default=None)
+    parser.add_argument("--quiet", action="store_true", help="Do not report progress")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    n_rows = score_file(
+        args.input,
+        args.output,
+        args.model_dir,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        threshold=args.threshold,
+        model_format=args.model_format,
+        output_format=args.output_format,
+        progress=None if args.quiet else sys.stderr,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"Scored {n_rows} rows in {elapsed:.2f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/sec) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Server-side micro-batching for single-row prediction requests.
+"""
+
+import asyncio
+import inspect
+
+
+class MicroBatcher:
+    """
+    Collect concurrent single-item requests and process them as one batch.
+
+    The first queued item opens a collection window of `window_ms`
+    milliseconds; the batch is dispatched as soon as the window closes or
+    `max_batch_size` items have been collected, whichever comes first. The
+    extra latency added to any request is therefore bounded by the window
+    plus the time needed to process one batch.
+
+    Inputs
+    ------
+    batch_fn : callable
+        Function taking a list of items and returning a sequence of results
+        of the same length, in the same order. May be a coroutine function,
+        in which case batches are dispatched as concurrent tasks.
+    max_batch_size : int
+        Maximum number of items processed in one call to `batch_fn`.
+    window_ms : float
+        Maximum time to wait for more items after the first one arrives.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=64, window_ms=2.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if window_ms < 0:
+            raise ValueError("window_ms must be non-negative")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        """
+        Queue an item and wait for its result.
+
+        Inputs
+        ------
+        item : Any
+            Item passed to `batch_fn` as part of a batch.
+        Returns
+        -------
+        result : Any
+            The entry of `batch_fn`'s output corresponding to `item`.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+        future = loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    def _ensure_worker(self, loop):
+        """Start the collecting task, once per event loop."""
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._collect(self._queue))
+
+    async def _collect(self, queue):
+        """Group queued items into batches and dispatch them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    while len(batch) < self.max_batch_size and not queue.empty():
+                        batch.append(queue.get_nowait())
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            pending = [(item, future) for item, future in batch if not future.done()]
+            if not pending:
+                continue
+            try:
+                results = self.batch_fn([item for item, _ in pending])
+            except Exception as exc:
+                self._resolve(pending, exc=exc)
+                continue
+            if inspect.isawaitable(results):
+                task = loop.create_task(self._await_batch(pending, results))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                self._resolve(pending, results)
+
+    async def _await_batch(self, pending, awaitable):
+        """Wait for an asynchronous batch and resolve its callers."""
+        try:
+            results = await awaitable
+        except Exception as exc:
+            self._resolve(pending, exc=exc)
+        else:
+            self._resolve(pending, results)
+
+    @staticmethod
+    def _resolve(pending, results=None, exc=None):
+        """Resolve each caller's future with its result or the batch error."""
+        for i, (_, future) in enumerate(pending):
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(results[i])
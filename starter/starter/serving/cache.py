@@ -0,0 +1,271 @@
+"""
+Prediction cache keyed on the canonical form of validated input records.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .predictor import MODEL_VARIANTS, variant_source_path
+
+logger = logging.getLogger(__name__)
+
+# Files whose changes make a new model version: the encoders and every variant's model
+ARTIFACT_NAMES = ("encoder.pkl", "lb.pkl", "encoder.json", "lb.json") + tuple(
+    name
+    for variant, (model_file, forest_dir) in MODEL_VARIANTS.items()
+    for name in (model_file, os.path.join(forest_dir, "forest.json"), variant_source_path("", variant))
+)
+
+
+def record_key(record):
+    """
+    Canonical hash of a record.
+
+    Inputs
+    ------
+    record : dict
+        Validated record, keyed by feature name.
+    Returns
+    -------
+    key : str
+        Hex digest that is identical for records with equal fields,
+        regardless of key order.
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def artifact_fingerprint(model_dir, names=ARTIFACT_NAMES):
+    """
+    Fingerprint of the model artifacts in a directory.
+
+    Changes whenever one of the files is replaced, resized or touched.
+
+    Inputs
+    ------
+    model_dir : str
+        Directory containing the artifacts.
+    names : tuple[str]
+        Artifact file names to include.
+    Returns
+    -------
+    fingerprint : str
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(model_dir, name))
+        except FileNotFoundError:
+            digest.update(f"{name}:missing;".encode())
+            continue
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+class RedisBackend:
+    """
+    Shared cache backend for any server speaking the Redis protocol.
+
+    Lets several uvicorn workers share hits. Errors talking to the server are
+    logged and treated as misses so the API keeps serving without it.
+
+    Inputs
+    ------
+    url : str
+        Connection URL, e.g. "redis://localhost:6379/0".
+    prefix : str
+        Prefix for every key written by this backend.
+    """
+
+    def __init__(self, url, prefix="census:prediction"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImportError("The shared prediction cache requires the 'redis' package") from exc
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        """Return the cached value for `key`, or None."""
+        try:
+            raw = self.client.get(f"{self.prefix}:{key}")
+        except Exception as exc:
+            logger.warning("Shared prediction cache unavailable: %s", exc)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        """Store `value` under `key` for `ttl` seconds."""
+        try:
+            self.client.set(f"{self.prefix}:{key}", json.dumps(value), ex=max(1, int(ttl)))
+        except Exception as exc:
+            logger.warning("Shared prediction cache unavailable: %s", exc)
+
+
+class PredictionCache:
+    """
+    In-process LRU cache with a per-entry time to live.
+
+    Entries are dropped automatically when the fingerprint returned by
+    `fingerprint_fn` changes (checked at most every `check_interval` seconds),
+    so retrained artifacts never serve stale predictions. An optional shared
+    backend is consulted on local misses and written on every set; its keys
+    include the fingerprint, so invalidation is automatic there too.
+
+    Inputs
+    ------
+    maxsize : int
+        Maximum number of entries kept in process.
+    ttl : float
+        Seconds an entry stays valid.
+    fingerprint_fn : callable
+        Returns a string identifying the current model artifacts.
+    backend : RedisBackend
+        Optional shared backend.
+    check_interval : float
+        Minimum seconds between two fingerprint checks.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600.0, fingerprint_fn=None, backend=None, check_interval=1.0):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.fingerprint_fn = fingerprint_fn
+        self.backend = backend
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = fingerprint_fn() if fingerprint_fn else ""
+        self._next_check = time.monotonic() + check_interval
+
+    @property
+    def fingerprint(self):
+        """Fingerprint of the artifacts the cached values were computed with."""
+        return self._fingerprint
+
+    def _check_fingerprint(self, now):
+        """Clear the cache when the artifacts changed. Caller holds the lock."""
+        if self.fingerprint_fn is None or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        fingerprint = self.fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Inputs
+        ------
+        key : str
+            Key returned by `record_key`.
+        Returns
+        -------
+        value : Any
+            The cached value, or None on a miss.
+        fingerprint : str
+            Fingerprint the lookup was made under; pass it to `set` when
+            storing the value computed after a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._check_fingerprint(now)
+            fingerprint = self._fingerprint
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, fingerprint
+                del self._entries[key]
+
+        if self.backend is not None:
+            value = self.backend.get(f"{fingerprint}:{key}")
+            if value is not None:
+                self._store(key, value, now, fingerprint)
+                with self._lock:
+                    self.hits += 1
+                return value, fingerprint
+
+        with self._lock:
+            self.misses += 1
+        return None, fingerprint
+
+    def set(self, key, value, fingerprint=None):
+        """
+        Store a value.
+
+        Inputs
+        ------
+        key : str
+            Key returned by `record_key`.
+        value : Any
+            JSON-serializable value to cache.
+        fingerprint : str
+            Fingerprint returned by the `get` that missed. If the artifacts
+            changed since, the value may come from the previous model and is
+            not stored.
+        Returns
+        -------
+        stored : bool
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._check_fingerprint(now)
+            fingerprint = self._fingerprint if fingerprint is None else fingerprint
+        if not self._store(key, value, now, fingerprint):
+            return False
+        if self.backend is not None:
+            self.backend.set(f"{fingerprint}:{key}", value, self.ttl)
+        return True
+
+    def _store(self, key, value, now, fingerprint):
+        """Insert into the local LRU, evicting the oldest entries, unless the fingerprint is outdated."""
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                return False
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """Drop every local entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Cache counters.
+
+        Returns
+        -------
+        stats : dict
+            Size, capacity, hits, misses, evictions and invalidations.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "shared": self.backend is not None,
+            }
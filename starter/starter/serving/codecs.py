@@ -0,0 +1,173 @@
+"""
+Request and response body formats for the prediction endpoints.
+
+JSON is always available and is serialized with `orjson` when it is
+installed. MessagePack (requires `msgpack`) and Arrow IPC streams (requires
+`pyarrow`) are compact alternatives for batch payloads, selected by the
+Content-Type and Accept headers.
+"""
+
+import json
+
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Media types accepted in Content-Type and Accept headers, and the format
+# each one selects
+MEDIA_TYPES = {
+    "application/json": JSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/vnd.apache.arrow.stream": ARROW,
+}
+
+
+class UnsupportedMediaType(Exception):
+    """Raised for a body format that is unknown or whose package is not installed."""
+
+
+def media_type(header):
+    """
+    Body format named by a Content-Type header.
+
+    Inputs
+    ------
+    header : str
+        Header value, parameters such as `charset` are ignored. Empty or
+        missing headers and `+json` types select JSON.
+    Returns
+    -------
+    media : str or None
+        One of JSON, MSGPACK or ARROW, or None for an unknown type.
+    """
+    value = (header or "").split(";")[0].strip().lower()
+    if not value or value.endswith("+json"):
+        return JSON
+    return MEDIA_TYPES.get(value)
+
+
+def negotiate(accept):
+    """
+    Response format preferred by an Accept header.
+
+    Inputs
+    ------
+    accept : str
+        Header value; the known type with the highest q-value wins, ties go
+        to the first listed. Missing headers and wildcards select JSON.
+    Returns
+    -------
+    media : str
+        One of JSON, MSGPACK or ARROW.
+    """
+    best, best_q = JSON, 0.0
+    for entry in (accept or "").split(","):
+        value, *params = [part.strip() for part in entry.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        media = JSON if value in ("*/*", "application/*") else MEDIA_TYPES.get(value.lower())
+        if media is not None and q > best_q:
+            best, best_q = media, q
+    return best
+
+
+def _require(package, media):
+    """Import the optional package needed for a body format."""
+    try:
+        return __import__(package)
+    except ImportError as exc:
+        raise UnsupportedMediaType(f"{media} bodies require the '{package}' package") from exc
+
+
+def dumps_json(content):
+    """Serialize to compact JSON bytes, with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by `dumps_json`."""
+
+    def render(self, content):
+        return dumps_json(content)
+
+
+def decode_body(body, media):
+    """
+    Decode a MessagePack or Arrow request body.
+
+    Inputs
+    ------
+    body : bytes
+        Raw request body.
+    media : str
+        MSGPACK or ARROW. A MessagePack body holds the same map as the JSON
+        payload; an Arrow IPC stream holds one column per feature.
+    Returns
+    -------
+    payload : dict
+        Python objects ready for model validation.
+    """
+    if media == MSGPACK:
+        msgpack = _require("msgpack", media)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as exc:
+            raise ValueError(f"Could not decode the MessagePack body: {exc}") from exc
+    if media == ARROW:
+        pa = _require("pyarrow", media)
+        try:
+            table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        except Exception as exc:
+            raise ValueError(f"Could not decode the Arrow IPC body: {exc}") from exc
+        return {"columns": table.to_pydict()}
+    raise UnsupportedMediaType(f"Unsupported request body type {media}")
+
+
+def encode_response(content, media, status_code=200, headers=None):
+    """
+    Render a response body in the negotiated format.
+
+    Inputs
+    ------
+    content : dict
+        Response payload. For ARROW it must map column names to equal-length
+        lists; None values are left out.
+    media : str
+        JSON, MSGPACK or ARROW.
+    status_code : int
+        HTTP status.
+    headers : dict
+        Extra response headers.
+    Returns
+    -------
+    response : starlette.responses.Response
+    """
+    if media == MSGPACK:
+        body = _require("msgpack", media).packb(content)
+    elif media == ARROW:
+        pa = _require("pyarrow", media)
+        table = pa.table({name: values for name, values in content.items() if values is not None})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+    else:
+        return FastJSONResponse(content, status_code=status_code, headers=headers)
+    return Response(body, status_code=status_code, headers=headers, media_type=media)
@@ -0,0 +1,290 @@
+"""
+Compressed request bodies and negotiated response compression.
+"""
+
+import io
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Errors meaning a request body is not validly compressed
+DECOMPRESSION_ERRORS = (zlib.error, EOFError, ValueError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def response_encodings():
+    """Response encodings this process can produce, most preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def request_encodings():
+    """Content-Encoding values accepted on request bodies."""
+    return response_encodings() + ("deflate",)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Response encoding negotiated from an Accept-Encoding header.
+
+    Inputs
+    ------
+    accept_encoding : str
+        Header value. The supported encoding with the highest q-value wins;
+        ties go to zstd over gzip. `*` matches any supported encoding.
+    Returns
+    -------
+    encoding : str or None
+        "zstd", "gzip", or None to send the body uncompressed.
+    """
+    weights = {}
+    for entry in (accept_encoding or "").split(","):
+        name, *params = [part.strip() for part in entry.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name.lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in response_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressor(encoding, gzip_level, zstd_level):
+    """Streaming compressor with `compress` and `flush` methods."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=zstd_level).compressobj()
+    return zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+
+def _decompressor(encoding):
+    """zlib decompressor for a gzip or deflate body."""
+    if encoding == "gzip":
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    return zlib.decompressobj()
+
+
+# Largest output of one zstd read, so that memory use stays bounded
+ZSTD_READ_SIZE = 2 ** 20
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body decompresses to more than the allowed size."""
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware decompressing request bodies and compressing responses.
+
+    Request bodies sent with `Content-Encoding: gzip`, `deflate` or `zstd` are
+    decompressed before the application reads them; other encodings are
+    rejected with 415, corrupt bodies with 400 and bodies that expand beyond
+    `max_body_size` with 413. Responses are compressed with the encoding
+    negotiated from Accept-Encoding unless they already carry a
+    Content-Encoding or fit in a single body message smaller than
+    `minimum_size` bytes, so small `/predict` answers are sent as is.
+
+    zstd requires the `zstandard` package; without it only gzip (and deflate
+    request bodies) are supported.
+
+    Inputs
+    ------
+    app : ASGI application
+        Wrapped application.
+    minimum_size : int
+        Smallest response body, in bytes, that is compressed.
+    gzip_level : int
+        zlib compression level, 1 (fastest) to 9.
+    zstd_level : int
+        zstd compression level.
+    max_body_size : int
+        Largest decompressed request body accepted, in bytes.
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, zstd_level=3, max_body_size=64 * 2 ** 20):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding != "identity":
+            if content_encoding not in request_encodings():
+                response = JSONResponse(
+                    {"detail": f"Unsupported Content-Encoding {content_encoding}"}, status_code=415
+                )
+                await response(scope, receive, send)
+                return
+            try:
+                body = await self._read_decompressed(receive, content_encoding)
+            except BodyTooLarge:
+                response = JSONResponse(
+                    {"detail": f"Decompressed body exceeds {self.max_body_size} bytes"}, status_code=413
+                )
+                await response(scope, receive, send)
+                return
+            except DECOMPRESSION_ERRORS as exc:
+                response = JSONResponse({"detail": f"Could not decompress the body: {exc}"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            scope, receive = self._replace_body(scope, receive, body)
+
+        encoding = choose_encoding(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, self._compressing_sender(send, encoding))
+
+    async def _read_decompressed(self, receive, encoding):
+        """
+        Read the whole request body and decompress it.
+
+        Every decompression step is capped at one byte more than the room left
+        under `max_body_size`, so a small body that expands enormously is
+        rejected after producing at most that many bytes.
+        """
+        if encoding == "zstd":
+            return self._unzstd(await self._read_body(receive))
+        decompressor = _decompressor(encoding)
+        chunks = []
+        size = 0
+        async for data in self._iter_body(receive):
+            while True:
+                chunk = decompressor.decompress(data, self.max_body_size - size + 1)
+                size += len(chunk)
+                if size > self.max_body_size:
+                    raise BodyTooLarge()
+                chunks.append(chunk)
+                data = decompressor.unconsumed_tail
+                if not data and not chunk:
+                    break
+        if not decompressor.eof:
+            raise ValueError("truncated body")
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _iter_body(receive):
+        """Yield the raw chunks of the request body."""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            yield message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+    async def _read_body(self, receive):
+        """Raw request body, at most `max_body_size` bytes."""
+        chunks = []
+        size = 0
+        async for data in self._iter_body(receive):
+            size += len(data)
+            if size > self.max_body_size:
+                raise BodyTooLarge()
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def _unzstd(self, data):
+        """Decompress the first zstd frame of `data` in bounded reads."""
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+        chunks = []
+        size = 0
+        while True:
+            chunk = reader.read(min(self.max_body_size - size + 1, ZSTD_READ_SIZE))
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_body_size:
+                raise BodyTooLarge()
+            chunks.append(chunk)
+        # The reader stops silently at the end of the input; frames that declare
+        # their size show whether it was cut short
+        if zstandard.frame_content_size(data) not in (-1, size):
+            raise ValueError("truncated body")
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replace_body(scope, receive, body):
+        """Scope and receive channel presenting `body` as an uncompressed request."""
+        headers = MutableHeaders(raw=[
+            (name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")
+        ])
+        headers["content-length"] = str(len(body))
+        sent = False
+
+        async def receive_body():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return {**scope, "headers": headers.raw}, receive_body
+
+    def _compressing_sender(self, send, encoding):
+        """Wrap `send` so that eligible response bodies are compressed."""
+        start = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                if "content-encoding" in headers or (not more_body and len(body) < self.minimum_size):
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                compressor = _compressor(encoding, self.gzip_level, self.zstd_level)
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                body = compressor.compress(body)
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body += compressor.flush()
+                    headers["content-length"] = str(len(body))
+                await send({**start, "headers": headers.raw})
+                start = None
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if compressor is None:
+                await send(message)
+                return
+            body = compressor.compress(body)
+            if not more_body:
+                body += compressor.flush()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        return send_wrapper
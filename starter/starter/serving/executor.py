@@ -0,0 +1,209 @@
+"""
+Execution backends for CPU-bound inference.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .metrics import StageTimer
+from .predictor import Predictor
+
+BACKENDS = ("inline", "thread", "process")
+
+# Predictor loaded once per process by the process-pool initializer
+_worker_predictor = None
+
+
+class ExecutorSaturated(Exception):
+    """Raised when too many inference calls are already queued."""
+
+
+def _init_process_worker(model_dir, categorical_features, continuous_features, model_format, parallelism=None,
+                         variant="full"):
+    """Load a private copy of the artifacts in a pool process."""
+    global _worker_predictor
+    _worker_predictor = Predictor.from_dir(
+        model_dir, categorical_features, continuous_features, model_format, variant
+    )
+    if parallelism is not None:
+        _worker_predictor.set_parallelism(*parallelism)
+
+
+def _call_process_worker(method, *args):
+    """Call a Predictor method on the pool process' own copy."""
+    return getattr(_worker_predictor, method)(*args)
+
+
+def _call_process_worker_timed(method, *args):
+    """Like `_call_process_worker`, also returning the worker's stage durations."""
+    timer = StageTimer()
+    result = getattr(_worker_predictor, method)(*args, timer=timer)
+    return result, timer.durations
+
+
+def _ping_process_worker():
+    """No-op used to start pool processes ahead of traffic."""
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """
+    Run Predictor methods inline, in a thread pool or in a process pool.
+
+    The "inline" backend runs on the calling (event loop) thread. The "thread"
+    backend runs in a bounded thread pool, which keeps the event loop free
+    while sklearn and numpy do the work. The "process" backend runs in a pool
+    of processes that each load their own copy of the artifacts from
+    `predictor.model_dir` at start-up.
+
+    At most `max_pending` calls may be queued or running at once; further
+    calls raise ExecutorSaturated instead of waiting.
+
+    Inputs
+    ------
+    predictor : Predictor
+        Artifacts used by the inline and thread backends.
+    backend : str
+        One of "inline", "thread" or "process".
+    max_workers : int
+        Size of the thread or process pool.
+    max_pending : int
+        Maximum number of calls queued or running at once.
+    """
+
+    def __init__(self, predictor, backend="thread", max_workers=None, max_pending=128):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}; expected one of {BACKENDS}")
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        if backend == "process" and predictor.model_dir is None:
+            raise ValueError("The process backend needs a predictor loaded from a model_dir")
+        self.predictor = predictor
+        self.backend = backend
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def pending(self):
+        """Number of calls currently queued or running."""
+        return self._pending
+
+    def _make_pool(self, predictor):
+        """Start a worker pool for the configured backend."""
+        if self.backend == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_process_worker,
+            initargs=(
+                predictor.model_dir,
+                predictor.categorical_features,
+                predictor.continuous_features,
+                predictor.model_format,
+                predictor.parallelism,
+                predictor.model_variant,
+            ),
+        )
+
+    def _get_pool(self):
+        """Create the worker pool on first use."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._make_pool(self.predictor)
+            return self._pool
+
+    def swap(self, predictor):
+        """
+        Route subsequent calls to another predictor.
+
+        The inline and thread backends switch immediately. The process backend
+        first starts a new pool loading `predictor.model_dir` and waits for its
+        workers to be up; calls already submitted to the old pool finish there
+        before its processes exit.
+
+        Inputs
+        ------
+        predictor : Predictor
+            Artifacts to use from now on.
+        """
+        if self.backend != "process":
+            self.predictor = predictor
+            return
+        if predictor.model_dir is None:
+            raise ValueError("The process backend needs a predictor loaded from a model_dir")
+
+        pool = self._make_pool(predictor)
+        n_workers = self.max_workers or os.cpu_count() or 1
+        for future in [pool.submit(_ping_process_worker) for _ in range(n_workers)]:
+            future.result()
+        with self._lock:
+            old_pool, self._pool = self._pool, pool
+            self.predictor = predictor
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    async def call(self, method, *args, timer=None):
+        """
+        Run `Predictor.<method>(*args)` on the configured backend.
+
+        Inputs
+        ------
+        method : str
+            Name of the Predictor method to call.
+        *args
+            Positional arguments for the method.
+        timer : StageTimer
+            If given, passed to the method as `timer=`; the pool's queueing
+            and transfer time is added to it as the "queue" stage.
+        Returns
+        -------
+        result : Any
+            The method's return value.
+        """
+        if self.backend == "inline":
+            if timer is None:
+                return getattr(self.predictor, method)(*args)
+            return getattr(self.predictor, method)(*args, timer=timer)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorSaturated(
+                    f"{self._pending} inference calls already pending (limit {self.max_pending})"
+                )
+            self._pending += 1
+        try:
+            if self.backend == "thread":
+                fn = functools.partial(getattr(self.predictor, method), *args)
+                if timer is not None:
+                    fn = functools.partial(fn, timer=timer)
+            elif timer is None:
+                fn = functools.partial(_call_process_worker, method, *args)
+            else:
+                fn = functools.partial(_call_process_worker_timed, method, *args)
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            measured = timer.total() if timer is not None else 0.0
+            result = await loop.run_in_executor(self._get_pool(), fn)
+            if timer is not None:
+                if self.backend == "process":
+                    result, durations = result
+                    timer.update(durations)
+                timer.add("queue", time.perf_counter() - start - (timer.total() - measured))
+            return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        """Stop the worker pool, if one was started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
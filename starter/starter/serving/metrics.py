@@ -0,0 +1,330 @@
+"""
+Request, stage latency and batch size metrics in the Prometheus text format.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from 100µs to 10s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Batch size buckets, powers of two up to 16384 rows
+SIZE_BUCKETS = tuple(float(2 ** i) for i in range(15))
+
+# Request header that asks for a Server-Timing breakdown in the response
+TIMING_HEADER = b"x-server-timing"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    """Escape a label value for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    """Render `{name="value",...}`, or nothing without labels."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+
+    Inputs
+    ------
+    name : str
+        Metric name.
+    documentation : str
+        Help text.
+    labelnames : tuple[str]
+        Label names; `inc` then takes one value per label.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1.0):
+        """Add `amount` to the series identified by `labelvalues`."""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues):
+        """Current value of one series."""
+        return self._values.get(labelvalues, 0.0)
+
+    def samples(self):
+        """Exposition lines for every series."""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, optionally split by labels.
+
+    Inputs
+    ------
+    name : str
+        Metric name.
+    documentation : str
+        Help text.
+    labelnames : tuple[str]
+        Label names; `observe` then takes one value per label.
+    buckets : tuple[float]
+        Increasing upper bounds; +Inf is added automatically.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        if list(buckets) != sorted(buckets):
+            raise ValueError("Histogram buckets must be increasing")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        """Record one observation in the series identified by `labelvalues`."""
+        # Index of the first bucket holding the value, len(buckets) for +Inf
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labelvalues):
+        """Number of observations in one series."""
+        series = self._series.get(labelvalues)
+        return sum(series[0]) if series is not None else 0
+
+    def samples(self):
+        """Exposition lines for every series: buckets, sum and count."""
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from a callback whenever metrics are rendered.
+
+    Inputs
+    ------
+    name : str
+        Metric name.
+    documentation : str
+        Help text.
+    fn : callable
+        Returns the current value.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def samples(self):
+        """Exposition line for the current value."""
+        return [f"{self.name} {_format_value(self.fn())}"]
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by `render`."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """Add a metric and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        text : str
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Named stage durations of one request or batch, in seconds.
+
+    Durations of a stage measured several times are added up. `mark` measures
+    the time since the previous mark (or creation), for stages delimited by
+    checkpoints rather than a `with` block.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._last = time.perf_counter()
+        self.marked = False
+
+    def add(self, name, seconds):
+        """Add `seconds` to a stage."""
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def update(self, durations):
+        """Add the durations of another timer's stages."""
+        for name, seconds in durations.items():
+            self.add(name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a `with` block as stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def mark(self, name=None):
+        """Record the time since the previous mark as stage `name` (if given)."""
+        now = time.perf_counter()
+        if name is not None:
+            self.add(name, now - self._last)
+        self._last = now
+        self.marked = True
+
+    def total(self):
+        """Sum of all stage durations."""
+        return sum(self.durations.values())
+
+    def server_timing(self):
+        """
+        Stage durations as a Server-Timing header value, in milliseconds.
+
+        Returns
+        -------
+        header : str
+        """
+        return ", ".join(f"{name};dur={1000 * seconds:.3f}" for name, seconds in self.durations.items())
+
+
+def get_timer(request):
+    """StageTimer attached to a request by MetricsMiddleware, or a throwaway one."""
+    return getattr(request.state, "timer", None) or StageTimer()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests and timing them end to end.
+
+    Every request gets a StageTimer in `request.state.timer`. Handlers call
+    `timer.mark("parse")` when they start, which captures body parsing and
+    validation, and `timer.mark()` when they return, so that serializing the
+    response is reported as the "respond" stage. Stage durations are added
+    to `stage_histogram`. When the client sends `X-Server-Timing: 1`, the
+    response carries them in a `Server-Timing` header.
+
+    Requests are labelled with the route's path template, so path
+    parameters do not create new series.
+
+    Inputs
+    ------
+    app : ASGI application
+        Wrapped application.
+    requests : Counter
+        Labelled by method, path and status.
+    errors : Counter
+        Labelled by method, path and status; counts 4xx, 5xx and exceptions.
+    latency : Histogram
+        Labelled by method and path.
+    stage_histogram : Histogram
+        Labelled by stage.
+    """
+
+    def __init__(self, app, requests, errors, latency, stage_histogram):
+        self.app = app
+        self.requests = requests
+        self.errors = errors
+        self.latency = latency
+        self.stage_histogram = stage_histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timer = StageTimer()
+        scope.setdefault("state", {})["timer"] = timer
+        wants_timing = any(
+            name == TIMING_HEADER and value not in (b"", b"0", b"false") for name, value in scope["headers"]
+        )
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timer.marked:
+                    timer.mark("respond")
+                if wants_timing:
+                    timing = timer.server_timing()
+                    total = f"total;dur={1000 * (time.perf_counter() - start):.3f}"
+                    header = f"{timing}, {total}" if timing else total
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            self.requests.inc(method, path, str(status))
+            if status >= 400:
+                self.errors.inc(method, path, str(status))
+            self.latency.observe(time.perf_counter() - start, method, path)
+            for name, seconds in timer.durations.items():
+                self.stage_histogram.observe(seconds, name)
@@ -0,0 +1,338 @@
+"""
+Bundle of fitted artifacts used to score census rows.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from ml.data import CompiledEncoder, process_data
+from ml.feature_cache import file_digest
+from ml.forest import compile_forest
+from ml.model import inference, load_encoder, load_model, with_n_jobs
+
+from .metrics import StageTimer
+
+logger = logging.getLogger(__name__)
+
+MODEL_FORMATS = ("pickle", "compiled")
+
+# Model files of each variant: the trained forest, or the smaller forest
+# written next to it by compress_model.py
+MODEL_VARIANTS = {
+    "full": ("model.pkl", "forest"),
+    "compact": ("model_compact.pkl", "forest_compact"),
+}
+
+
+def variant_source_path(model_dir, variant):
+    """Manifest next to a derived variant naming the model.pkl it was made from."""
+    model_file, _ = MODEL_VARIANTS[variant]
+    return os.path.join(model_dir, os.path.splitext(model_file)[0] + ".json")
+
+
+def write_variant_source(model_dir, variant):
+    """
+    Record that a variant was derived from the current model.pkl of a directory.
+
+    Inputs
+    ------
+    model_dir : str
+        Directory holding model.pkl and the variant's files.
+    variant : str
+        Name of the derived variant, e.g. "compact".
+    """
+    with open(variant_source_path(model_dir, variant), "w") as f:
+        json.dump({"source": "model.pkl", "source_digest": file_digest(os.path.join(model_dir, "model.pkl"))}, f)
+
+
+def stale_variant(model_dir, variant):
+    """
+    Why a variant of a directory cannot be served, or None if it can.
+
+    A derived variant is only valid next to the model.pkl it was made from,
+    as recorded by `write_variant_source`; retraining replaces model.pkl and
+    possibly the encoder, which makes it stale.
+
+    Inputs
+    ------
+    model_dir : str
+        Artifact directory.
+    variant : str
+        Variant name.
+    Returns
+    -------
+    reason : str or None
+    """
+    if variant == "full":
+        return None
+    manifest = variant_source_path(model_dir, variant)
+    if not os.path.exists(os.path.join(model_dir, MODEL_VARIANTS[variant][0])) or not os.path.exists(manifest):
+        return f"no {variant} model (run starter/compress_model.py --model-dir {model_dir})"
+    with open(manifest) as f:
+        source_digest = json.load(f).get("source_digest")
+    if source_digest != file_digest(os.path.join(model_dir, "model.pkl")):
+        return f"the {variant} model was made from a different model.pkl"
+    return None
+
+
+class Predictor:
+    """
+    Fitted model, encoder and label binarizer, applied together.
+
+    Inputs
+    ------
+    model : RandomForestClassifier
+        Trained machine learning model.
+    encoder : OneHotEncoder
+        Trained encoder for the categorical features.
+    lb : LabelBinarizer
+        Trained label binarizer.
+    categorical_features : list[str]
+        Names of the categorical features.
+    continuous_features : list[str]
+        Names of the continuous features, in training column order. When
+        given, records are encoded with a CompiledEncoder instead of pandas.
+    model_dir : str
+        Directory the artifacts were loaded from, if any.
+    """
+
+    def __init__(self, model, encoder, lb, categorical_features, continuous_features=None, model_dir=None):
+        self.model = model
+        self.encoder = encoder
+        self.lb = lb
+        self.categorical_features = list(categorical_features)
+        self.continuous_features = None if continuous_features is None else list(continuous_features)
+        self.model_dir = model_dir
+        self.model_format = "pickle"
+        self.model_variant = "full"
+        self.parallelism = None
+        self._small_model = self._large_model = model
+        self._batch_min_rows = 0
+        self.compiled_encoder = None
+        if continuous_features is not None:
+            self.compiled_encoder = CompiledEncoder(encoder, categorical_features, continuous_features)
+            n_expected = getattr(model, "n_features_in_", self.compiled_encoder.n_features)
+            if self.compiled_encoder.n_features != n_expected:
+                raise ValueError(
+                    f"Encoded width {self.compiled_encoder.n_features} does not match "
+                    f"the model's {n_expected} input features"
+                )
+
+    @classmethod
+    def from_dir(cls, model_dir, categorical_features, continuous_features=None, model_format="pickle",
+                 variant="full"):
+        """
+        Load `model.pkl`, `encoder.pkl` and `lb.pkl` from a directory.
+
+        With model_format="compiled" the model is the CompiledForest stored in
+        `forest/`, memory-mapped so that startup does not read the trees and
+        processes loading the same directory share one copy through the page
+        cache; it is compiled on the fly from `model.pkl` if `forest/` is
+        missing. The encoders are then read from the `encoder.json` and
+        `lb.json` manifests when present. With variant="compact" the model is
+        read from `model_compact.pkl` and `forest_compact/` instead, provided
+        they were made from this directory's `model.pkl` (see `stale_variant`);
+        otherwise the full model is loaded and a warning logged.
+
+        Inputs
+        ------
+        model_dir : str
+            Directory containing the artifacts written by train_model.py.
+        categorical_features : list[str]
+            Names of the categorical features.
+        continuous_features : list[str]
+            Names of the continuous features, in training column order.
+        model_format : str
+            "pickle" for the sklearn model, "compiled" for the CompiledForest.
+        variant : str
+            "full" for the trained forest, "compact" for its compressed copy.
+            The variant actually loaded is `predictor.model_variant`.
+        Returns
+        -------
+        predictor : Predictor
+        """
+        if model_format not in MODEL_FORMATS:
+            raise ValueError(f"Unknown model format {model_format!r}; expected one of {MODEL_FORMATS}")
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant {variant!r}; expected one of {tuple(MODEL_VARIANTS)}")
+        problem = stale_variant(model_dir, variant)
+        if problem is not None:
+            logger.warning("Serving the full model from %s: %s", model_dir, problem)
+            variant = "full"
+        model_file, forest_name = MODEL_VARIANTS[variant]
+        forest_dir = os.path.join(model_dir, forest_name)
+        if model_format == "compiled" and os.path.isdir(forest_dir):
+            model = load_model(forest_dir, mmap=True)
+        else:
+            model = load_model(os.path.join(model_dir, model_file))
+            if model_format == "compiled":
+                model = compile_forest(model)
+
+        def artifact(name):
+            manifest = os.path.join(model_dir, f"{name}.json")
+            if model_format == "compiled" and os.path.exists(manifest):
+                return manifest
+            return os.path.join(model_dir, f"{name}.pkl")
+
+        predictor = cls(
+            model,
+            load_encoder(artifact("encoder")),
+            load_encoder(artifact("lb")),
+            categorical_features,
+            continuous_features=continuous_features,
+            model_dir=model_dir,
+        )
+        predictor.model_format = model_format
+        predictor.model_variant = variant
+        return predictor
+
+    def set_parallelism(self, n_jobs=None, batch_n_jobs=None, batch_min_rows=1000):
+        """
+        Override the joblib parallelism the model was pickled with.
+
+        Calls scoring fewer than `batch_min_rows` rows predict with `n_jobs`
+        workers, larger ones with `batch_n_jobs`, so that single rows are not
+        spread over every core while big batches still are. Models without
+        an `n_jobs` parameter (CompiledForest) are unaffected.
+
+        Inputs
+        ------
+        n_jobs : int
+            joblib workers for small calls, or None to keep the model's setting.
+        batch_n_jobs : int
+            joblib workers for calls of at least `batch_min_rows` rows, or None
+            to keep the model's setting.
+        batch_min_rows : int
+            Smallest call, in rows, scored with `batch_n_jobs`.
+        """
+        self.parallelism = (n_jobs, batch_n_jobs, batch_min_rows)
+        self._small_model = with_n_jobs(self.model, n_jobs)
+        self._large_model = with_n_jobs(self.model, batch_n_jobs)
+        self._batch_min_rows = batch_min_rows
+
+    def model_for(self, n_rows):
+        """Model configured for scoring `n_rows` rows at once."""
+        return self._large_model if n_rows >= self._batch_min_rows else self._small_model
+
+    def score_frame(self, frame, timer=None):
+        """
+        Score a DataFrame of census rows.
+
+        The whole frame is encoded with a single encoder.transform and scored
+        with a single model.predict_proba call.
+
+        Inputs
+        ------
+        frame : pd.DataFrame
+            Census feature columns, with the original (hyphenated) names.
+        timer : StageTimer
+            Receives the "encode", "model" and "decode" stage durations.
+        Returns
+        -------
+        labels : np.ndarray
+            Predicted salary labels, in input order.
+        scores : np.ndarray
+            Probability of the positive ('>50K') class for each row.
+        """
+        timer = timer if timer is not None else StageTimer()
+        with timer.stage("encode"):
+            X, _, _, _ = process_data(
+                frame,
+                categorical_features=self.categorical_features,
+                label=None,
+                training=False,
+                encoder=self.encoder,
+                lb=self.lb
+            )
+        return self._score_encoded(X, timer)
+
+    def score_records(self, records, timer=None):
+        """
+        Score a list of census records.
+
+        Inputs
+        ------
+        records : list[dict]
+            Records keyed by the original (hyphenated) column names.
+        timer : StageTimer
+            Receives the "frame" (DataFrame construction, pickle path only),
+            "encode", "model" and "decode" stage durations.
+        Returns
+        -------
+        labels : np.ndarray
+            Predicted salary labels, in input order.
+        scores : np.ndarray
+            Probability of the positive ('>50K') class for each row.
+        """
+        timer = timer if timer is not None else StageTimer()
+        if self.compiled_encoder is None:
+            with timer.stage("frame"):
+                frame = pd.DataFrame(records)
+            return self.score_frame(frame, timer)
+        with timer.stage("encode"):
+            X = self.compiled_encoder.transform(records)
+        return self._score_encoded(X, timer)
+
+    def score_columns(self, columns, timer=None):
+        """
+        Score a columnar batch of census rows.
+
+        Inputs
+        ------
+        columns : dict[str, list]
+            One list per feature, keyed by the original (hyphenated) names.
+        timer : StageTimer
+            Receives the same stage durations as `score_records`.
+        Returns
+        -------
+        labels : np.ndarray
+            Predicted salary labels, in input order.
+        scores : np.ndarray
+            Probability of the positive ('>50K') class for each row.
+        """
+        timer = timer if timer is not None else StageTimer()
+        if self.compiled_encoder is None:
+            with timer.stage("frame"):
+                frame = pd.DataFrame(columns)
+            return self.score_frame(frame, timer)
+        with timer.stage("encode"):
+            X = self.compiled_encoder.transform_columns(columns)
+        return self._score_encoded(X, timer)
+
+    def predict_frame(self, frame):
+        """Predicted salary labels for a DataFrame of census rows."""
+        return self.score_frame(frame)[0]
+
+    def predict_records(self, records):
+        """Predicted salary labels for a list of census records."""
+        return self.score_records(records)[0]
+
+    def apply_threshold(self, scores, threshold):
+        """
+        Turn positive-class probabilities into salary labels.
+
+        Inputs
+        ------
+        scores : array-like
+            Probability of the positive class for each row.
+        threshold : float
+            Rows scoring at or above the threshold get the positive label.
+        Returns
+        -------
+        labels : np.ndarray
+            Salary labels.
+        """
+        negative, positive = self.lb.classes_
+        return np.where(np.asarray(scores) >= threshold, positive, negative)
+
+    def _score_encoded(self, X, timer):
+        """Labels and positive-class scores from one probability pass."""
+        with timer.stage("model"):
+            preds, scores = inference(self.model_for(X.shape[0]), X, return_proba=True)
+        with timer.stage("decode"):
+            labels = self.lb.inverse_transform(preds)
+        return labels, scores
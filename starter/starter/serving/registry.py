@@ -0,0 +1,292 @@
+"""
+Versioned model artifacts, loaded in the background and swapped atomically.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from .cache import artifact_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Subdirectory holding one artifact set per version, e.g. model/versions/20240101T120000
+VERSIONS_DIR = "versions"
+
+# A loaded, validated artifact set
+ModelVersion = namedtuple("ModelVersion", ["version", "name", "path", "fingerprint", "predictor", "loaded_at"])
+
+
+class ModelLoadError(Exception):
+    """Raised when an artifact set cannot be loaded or fails its smoke prediction."""
+
+
+def list_versions(model_dir):
+    """
+    Artifact sets available under a model directory, oldest first.
+
+    Every non-hidden subdirectory of `model_dir/versions/` is a version, and
+    versions sort by name. Without any, `model_dir` itself is the only
+    version, named "default".
+
+    Inputs
+    ------
+    model_dir : str
+        Root model directory.
+    Returns
+    -------
+    versions : list[tuple[str, str]]
+        (name, path) pairs.
+    """
+    versions_dir = os.path.join(model_dir, VERSIONS_DIR)
+    if os.path.isdir(versions_dir):
+        names = sorted(
+            name for name in os.listdir(versions_dir)
+            if not name.startswith(".") and os.path.isdir(os.path.join(versions_dir, name))
+        )
+        if names:
+            return [(name, os.path.join(versions_dir, name)) for name in names]
+    return [("default", model_dir)]
+
+
+class ModelRegistry:
+    """
+    Keep track of the active artifact set and replace it without downtime.
+
+    A candidate is loaded with `load_fn(path)`, then validated by scoring
+    `smoke_records`: it must return one label from `lb.classes_` and one
+    finite probability in [0, 1] per record. Only then is it made active, by
+    calling `on_swap(predictor)` and replacing a single attribute, so requests
+    either see the old or the new version, never a mix. Each version is
+    identified as "<name>@<fingerprint>", so rewriting the files of a version
+    in place also counts as a new version.
+
+    `refresh` activates the newest version once its files have been seen
+    unchanged on two consecutive calls, which skips half-written artifacts.
+    Versions that were activated or failed before are never retried
+    automatically, so a rollback sticks until a newer version appears. The
+    last `keep` loaded versions stay in memory for instant rollbacks.
+
+    Inputs
+    ------
+    model_dir : str
+        Root model directory (see `list_versions`).
+    load_fn : callable
+        Builds a Predictor from an artifact directory.
+    smoke_records : list[dict]
+        Records scored to validate a candidate.
+    on_swap : callable
+        Called with the new Predictor right before it becomes active.
+    keep : int
+        Number of loaded versions kept in memory, including the active one.
+    """
+
+    def __init__(self, model_dir, load_fn, smoke_records, on_swap=None, keep=2):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.model_dir = model_dir
+        self.load_fn = load_fn
+        self.smoke_records = list(smoke_records)
+        self.on_swap = on_swap
+        self.keep = keep
+        self.active = None
+        self.failed = {}
+        self._loaded = OrderedDict()
+        self._seen = set()
+        self._last_candidate = None
+        # Serializes loads and swaps; readers only ever read `active`
+        self._lock = threading.RLock()
+
+    @property
+    def version(self):
+        """Identifier of the active version."""
+        return self.active.version
+
+    @property
+    def predictor(self):
+        """Predictor of the active version."""
+        return self.active.predictor
+
+    def _candidate(self, name, path):
+        """Version identifier of an artifact directory in its current state."""
+        fingerprint = artifact_fingerprint(path)
+        return f"{name}@{fingerprint[:8]}", fingerprint
+
+    def load(self, name, path):
+        """
+        Load and validate an artifact set without activating it.
+
+        Inputs
+        ------
+        name : str
+            Version name.
+        path : str
+            Artifact directory.
+        Returns
+        -------
+        entry : ModelVersion
+        """
+        version, fingerprint = self._candidate(name, path)
+        self._seen.add(version)
+        start = time.perf_counter()
+        try:
+            predictor = self.load_fn(path)
+            labels, scores = predictor.score_records(self.smoke_records)
+        except Exception as exc:
+            self.failed[version] = str(exc)
+            raise ModelLoadError(f"Could not load model version {version}: {exc}") from exc
+
+        classes = set(predictor.lb.classes_.tolist())
+        problems = []
+        if len(labels) != len(self.smoke_records) or len(scores) != len(self.smoke_records):
+            problems.append("wrong number of predictions")
+        if not all(label in classes for label in labels.tolist()):
+            problems.append("labels outside lb.classes_")
+        if not all(math.isfinite(score) and 0.0 <= score <= 1.0 for score in scores.tolist()):
+            problems.append("probabilities outside [0, 1]")
+        if problems:
+            self.failed[version] = "; ".join(problems)
+            raise ModelLoadError(f"Model version {version} failed its smoke prediction: {self.failed[version]}")
+
+        logger.info("Loaded model version %s in %.1f ms", version, 1000 * (time.perf_counter() - start))
+        return ModelVersion(version, name, path, fingerprint, predictor, time.time())
+
+    def activate(self, entry):
+        """
+        Make a loaded version the active one.
+
+        Inputs
+        ------
+        entry : ModelVersion
+            Output of `load`.
+        """
+        with self._lock:
+            if self.on_swap is not None:
+                self.on_swap(entry.predictor)
+            previous, self.active = self.active, entry
+            self._loaded[entry.version] = entry
+            self._loaded.move_to_end(entry.version)
+            while len(self._loaded) > self.keep:
+                self._loaded.popitem(last=False)
+        logger.info(
+            "Activated model version %s (previous: %s)",
+            entry.version, previous.version if previous is not None else None
+        )
+
+    def load_latest(self):
+        """
+        Load and activate the newest version unconditionally, e.g. at start-up.
+
+        Returns
+        -------
+        entry : ModelVersion
+        """
+        with self._lock:
+            name, path = list_versions(self.model_dir)[-1]
+            entry = self.load(name, path)
+            self.activate(entry)
+            return entry
+
+    def refresh(self):
+        """
+        Activate the newest version if it is new and its files are stable.
+
+        Load failures are logged and recorded in `failed`; the active version
+        stays in place.
+
+        Returns
+        -------
+        swapped : bool
+            Whether a new version was activated.
+        """
+        with self._lock:
+            name, path = list_versions(self.model_dir)[-1]
+            version, _ = self._candidate(name, path)
+            stable = version == self._last_candidate
+            self._last_candidate = version
+            if not stable or version in self._seen:
+                return False
+            try:
+                self.activate(self.load(name, path))
+            except ModelLoadError:
+                logger.exception("Keeping model version %s", self.version)
+                return False
+            return True
+
+    def rollback(self, version=None):
+        """
+        Re-activate an earlier version.
+
+        Versions still in memory are swapped in immediately; others are
+        loaded from disk first.
+
+        Inputs
+        ------
+        version : str
+            Version identifier or name to activate. Defaults to the version
+            that was active before the current one.
+        Returns
+        -------
+        entry : ModelVersion
+        """
+        with self._lock:
+            if version is None:
+                previous = [v for v in self._loaded if v != self.active.version]
+                if not previous:
+                    raise KeyError("No previous model version is loaded")
+                version = previous[-1]
+
+            entry = self._loaded.get(version)
+            if entry is None:
+                entry = next((e for e in self._loaded.values() if e.name == version), None)
+            if entry is None:
+                paths = dict(list_versions(self.model_dir))
+                name = version.split("@", 1)[0]
+                if name not in paths:
+                    raise KeyError(f"Unknown model version {version!r}")
+                entry = self.load(name, paths[name])
+            self.activate(entry)
+            return entry
+
+    def status(self):
+        """
+        Describe the active, loaded, available and failed versions.
+
+        Returns
+        -------
+        status : dict
+        """
+        # No lock: a background load must not hold up status requests
+        active = self.active
+        return {
+            "active": active.version,
+            "name": active.name,
+            "path": active.path,
+            "loaded_at": active.loaded_at,
+            "loaded": list(self._loaded),
+            "available": [name for name, _ in list_versions(self.model_dir)],
+            "failed": dict(self.failed),
+        }
+
+    async def watch(self, interval):
+        """
+        Poll for new versions every `interval` seconds until cancelled.
+
+        Loading and validation run in a worker thread, so the event loop keeps
+        serving requests with the active version meanwhile.
+
+        Inputs
+        ------
+        interval : float
+            Seconds between two polls.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Model refresh failed")
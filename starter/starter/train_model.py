@@ -2,61 +2,295 @@
 Script to train machine learning model and evaluate performance on data slices.
 """
 
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import argparse
+import json
 import os
+import shutil
 
 # Import the necessary functions from the starter code
-from ml.data import process_data
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from ml.feature_cache import file_digest, load_encoded_split
+from ml.forest import compile_forest, save_compiled_forest
+from ml.incremental import load_provenance, provenance_record, save_provenance, train_increment
 from ml.model import (
+    DEFAULT_PARAMS,
     train_model,
     compute_model_metrics,
     inference,
+    load_encoder,
+    load_model,
     save_model,
     save_encoder
 )
+from ml.search import (
+    last_round,
+    LATENCY_FORMATS,
+    choose_params,
+    evaluate_finalists,
+    format_results,
+    parse_search_space,
+    results_to_records,
+    search_forest,
+    search_results
+)
+from ml.slices import (
+    compute_crossed_slice_counts,
+    parse_slice_specs,
+    slice_metrics_from_counts,
+    slice_name,
+    write_slice_report,
+    write_slice_table
+)
 
 
-def main():
-    """Main function to train and evaluate the model."""
+def save_artifacts(model, encoder, lb, artifact_dir, provenance=None):
+    """
+    Write the model and encoders in every format the API can serve.
+
+    Args:
+        model: Trained RandomForestClassifier
+        encoder: Fitted OneHotEncoder
+        lb: Fitted LabelBinarizer
+        artifact_dir: Destination directory
+        provenance: Records of the data the trees were fitted on, oldest first
+    """
+    save_model(model, os.path.join(artifact_dir, "model.pkl"))
+    save_encoder(encoder, os.path.join(artifact_dir, "encoder.pkl"))
+    save_encoder(lb, os.path.join(artifact_dir, "lb.pkl"))
+    if provenance is not None:
+        save_provenance(provenance, artifact_dir)
     
-    # Load the data
-    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "census.csv")
-    data = pd.read_csv(data_path)
+    # Memory-mappable copies for fast serving (MODEL_FORMAT=compiled): the
+    # forest as flat .npy arrays and the encoders as JSON manifests
+    save_compiled_forest(compile_forest(model), os.path.join(artifact_dir, "forest"))
+    save_encoder(encoder, os.path.join(artifact_dir, "encoder.json"))
+    save_encoder(lb, os.path.join(artifact_dir, "lb.json"))
+
+
+def publish_artifacts(model, encoder, lb, provenance, model_dir, version=None):
+    """
+    Save the artifacts to model_dir, or as a new version a running API picks up.
+
+    Args:
+        model: Trained RandomForestClassifier
+        encoder: Fitted OneHotEncoder
+        lb: Fitted LabelBinarizer
+        provenance: Records of the data the trees were fitted on, oldest first
+        model_dir: The API's model directory
+        version: Name of the version, or None to overwrite model_dir
+    """
+    if version is None:
+        save_artifacts(model, encoder, lb, model_dir, provenance)
+        return
+    # Write next to the final location, then rename, so a watching API
+    # never sees a half-written version
+    versions_dir = os.path.join(model_dir, "versions")
+    version_dir = os.path.join(versions_dir, version)
+    tmp_dir = os.path.join(versions_dir, f".tmp-{version}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_artifacts(model, encoder, lb, tmp_dir, provenance)
+    os.replace(tmp_dir, version_dir)
+    print(f"Saved model version {version} to {version_dir}")
+
+
+def retrain_incremental(batch_path, base_dir, cat_features, n_estimators=10, n_jobs=-1, sparse=False):
+    """
+    Add trees fitted on a new data batch to the model saved in base_dir.
+
+    Only the batch is read, encoded and fitted on, so retraining time depends
+    on the size of the batch rather than on all the data seen so far.
+
+    Args:
+        batch_path: CSV file with the census.csv schema, including the label
+        base_dir: Directory with the model.pkl, encoder.pkl and lb.pkl to extend
+        cat_features: Categorical features
+        n_estimators: Trees fitted on the batch
+        n_jobs: joblib workers used to fit them
+        sparse: Encode the batch as a sparse CSR matrix
+
+    Returns:
+        tuple: (model, encoder, lb, provenance records including the batch)
+    """
+    model = load_model(os.path.join(base_dir, "model.pkl"))
+    encoder = load_encoder(os.path.join(base_dir, "encoder.pkl"))
+    lb = load_encoder(os.path.join(base_dir, "lb.pkl"))
+    batch = read_census(batch_path)
+
+    model, encoder, record = train_increment(
+        model, encoder, lb, batch, cat_features, label="salary", n_estimators=n_estimators,
+        n_jobs=n_jobs, sparse=sparse
+    )
+    record = provenance_record(
+        source=os.path.normpath(batch_path), digest=file_digest(batch_path), **record
+    )
+    return model, encoder, lb, load_provenance(base_dir) + [record]
+
+
+def search_params(args, X_train, y_train, X_test, y_test):
+    """
+    Pick forest hyperparameters by successive-halving search.
+
+    Args:
+        args: Parsed command-line arguments with the search options
+        X_train, y_train: Encoded training data and labels, cross-validated
+        X_test, y_test: Encoded held-out data and labels, used to score the finalists
+
+    Returns:
+        dict: Hyperparameters of the best finalist within the latency budget
+    """
+    space = parse_search_space(args.search_space) if args.search_space else None
+    search = search_forest(
+        X_train, y_train, space, n_candidates=args.search_candidates, cv=args.cv,
+        factor=args.search_factor, n_jobs=args.n_jobs
+    )
+    results = search_results(search)
+    print(f"Cross-validated {len(results)} candidates in {search.n_iterations_} rounds; "
+          f"refitting the best {min(args.search_top_k, len(last_round(results)))} of the last round...")
+    finalists = evaluate_finalists(
+        results, X_train, y_train, X_test, y_test, top_k=args.search_top_k, n_jobs=args.n_jobs,
+        latency_format=args.latency_format
+    )
+    print(format_results(finalists))
+    if args.search_output:
+        with open(args.search_output, "w") as f:
+            json.dump({"candidates": results_to_records(results), "finalists": results_to_records(finalists)},
+                      f, indent=2)
+        print(f"Search results saved to {args.search_output}")
+    return choose_params(finalists, max_us_per_row=args.max_latency_us)
+
+
+def main(argv=None):
+    """Main function to train and evaluate the model."""
     
-    # Split the data into train and test sets
-    train, test = train_test_split(data, test_size=0.20, random_state=42)
+    parser = argparse.ArgumentParser(description="Train the census income model.")
+    parser.add_argument(
+        "--cache-dir",
+        default=os.path.join(os.path.dirname(__file__), "..", ".cache", "features"),
+        help="Directory of the encoded feature cache"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always re-encode the data")
+    parser.add_argument(
+        "--sparse", action="store_true", help="Keep the one-hot features as a sparse CSR matrix"
+    )
+    parser.add_argument(
+        "--n-jobs", type=int, default=-1,
+        help="joblib workers used to fit the forest (default: -1, all CPUs); "
+             "the API overrides the model's setting for serving"
+    )
+    parser.add_argument(
+        "--version",
+        help="Save the artifacts as model/versions/VERSION, picked up by a running API "
+             "without a restart (default: overwrite model/)"
+    )
+    parser.add_argument(
+        "--slices",
+        help="Comma-separated slices for the report; cross features with ' x ' or '*' "
+             "(default: every categorical feature)"
+    )
+    parser.add_argument(
+        "--min-support", type=int, default=1, help="Leave slices with fewer test samples out of the report"
+    )
+    parser.add_argument("--slice-table", help="Also write the slice metrics as CSV, or JSON for a .json path")
+    parser.add_argument(
+        "--search", action="store_true",
+        help="Pick the forest hyperparameters by cross-validated successive-halving search"
+    )
+    parser.add_argument(
+        "--search-space",
+        help="Searched values, e.g. 'n_estimators=50,100,200;max_depth=8,10,None' "
+             "(default: ml.search.DEFAULT_SPACE)"
+    )
+    parser.add_argument(
+        "--search-candidates", type=int, help="Sample this many random configurations instead of the full grid"
+    )
+    parser.add_argument(
+        "--search-factor", type=int, default=3,
+        help="Each halving round keeps 1/factor of the candidates on factor times the rows (default: 3)"
+    )
+    parser.add_argument("--cv", type=int, default=3, help="Cross-validation folds of the search (default: 3)")
+    parser.add_argument(
+        "--search-top-k", type=int, default=5,
+        help="Best last-round candidates refit on all training rows to measure test F1 and latency (default: 5)"
+    )
+    parser.add_argument(
+        "--max-latency-us", type=float,
+        help="Serving budget: pick the best CV F1 among finalists scoring one row within this many microseconds"
+    )
+    parser.add_argument(
+        "--latency-format", choices=LATENCY_FORMATS, default="pickle",
+        help="Model format the latency is measured with (default: pickle)"
+    )
+    parser.add_argument("--search-output", help="Write every candidate's results as JSON to this file")
+    parser.add_argument(
+        "--increment",
+        help="Instead of training from scratch, add trees fitted on this labeled CSV batch to the saved model"
+    )
+    parser.add_argument(
+        "--trees-per-batch", type=int, default=10, help="Trees fitted on an --increment batch (default: 10)"
+    )
+    parser.add_argument(
+        "--base", help="Directory of the model extended by --increment (default: model/)"
+    )
+    args = parser.parse_args(argv)
+    model_dir = os.path.join(os.path.dirname(__file__), "..", "model")
+    if args.version is not None and os.path.exists(os.path.join(model_dir, "versions", args.version)):
+        parser.error(f"model version {args.version!r} already exists")
     
-    # Define categorical features
-    cat_features = [
-        "workclass",
-        "education",
-        "marital-status",
-        "occupation",
-        "relationship",
-        "race",
-        "sex",
-        "native-country",
-    ]
+    try:
+        slice_specs = parse_slice_specs(args.slices.split(",") if args.slices else CATEGORICAL_FEATURES)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.search_space:
+        try:
+            parse_search_space(args.search_space)
+        except ValueError as exc:
+            parser.error(str(exc))
     
-    # Process the training data
-    X_train, y_train, encoder, lb = process_data(
-        train, categorical_features=cat_features, label="salary", training=True
-    )
+    if args.increment is not None:
+        print(f"Adding {args.trees_per_batch} trees fitted on {args.increment}...")
+        model, encoder, lb, provenance = retrain_incremental(
+            args.increment,
+            args.base or model_dir,
+            CATEGORICAL_FEATURES,
+            n_estimators=args.trees_per_batch,
+            n_jobs=args.n_jobs,
+            sparse=args.sparse
+        )
+        record = provenance[-1]
+        for feature, values in record["new_categories"].items():
+            print(f"  New {feature} categories: {', '.join(values)}")
+        print("Previous model on the batch:")
+        print(f"  Precision: {record['prior_metrics']['precision']:.4f}")
+        print(f"  Recall: {record['prior_metrics']['recall']:.4f}")
+        print(f"  F1 Score: {record['prior_metrics']['fbeta']:.4f}")
+        print(f"Fitted {record['rows']} rows in {record['seconds']:.2f}s; the model now has {len(model.estimators_)} trees")
+        publish_artifacts(model, encoder, lb, provenance, model_dir, args.version)
+        print("Training complete!")
+        return
     
-    # Process the test data with the trained encoder and label binarizer
-    X_test, y_test, _, _ = process_data(
-        test, 
-        categorical_features=cat_features, 
-        label="salary", 
-        training=False,
-        encoder=encoder,
-        lb=lb
+    # Load, split and encode the data, or reuse the cached matrices when the
+    # data file and preprocessing parameters are unchanged
+    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "census.csv")
+    split = load_encoded_split(
+        data_path,
+        CATEGORICAL_FEATURES,
+        label="salary",
+        test_size=0.20,
+        random_state=42,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        sparse=args.sparse
     )
+    print(f"Encoded features {'loaded from cache' if split.hit else 'computed'} (key {split.key})")
+    X_train, y_train, X_test, y_test = split.X_train, split.y_train, split.X_test, split.y_test
+    encoder, lb, test = split.encoder, split.lb, split.test
     
-    # Train the model
-    print("Training model...")
-    model = train_model(X_train, y_train)
+    # Train the model, with searched hyperparameters if requested
+    params = dict(DEFAULT_PARAMS)
+    if args.search:
+        print("Searching hyperparameters...")
+        params = search_params(args, X_train, y_train, X_test, y_test)
+    print(f"Training model with {params}...")
+    model = train_model(X_train, y_train, n_jobs=args.n_jobs, **params)
     
     # Evaluate on test set
     print("Evaluating model on test set...")
@@ -69,65 +303,22 @@ def main():
     print(f"  F1 Score: {fbeta:.4f}")
     
     # Save the model and encoders
-    model_dir = os.path.join(os.path.dirname(__file__), "..", "model")
-    os.makedirs(model_dir, exist_ok=True)
-    
-    model_path = os.path.join(model_dir, "model.pkl")
-    encoder_path = os.path.join(model_dir, "encoder.pkl")
-    lb_path = os.path.join(model_dir, "lb.pkl")
-    
     print("Saving model and encoders...")
-    save_model(model, model_path)
-    save_encoder(encoder, encoder_path)
-    save_encoder(lb, lb_path)
+    provenance = [provenance_record(
+        "full", X_train.shape[0], [0, len(model.estimators_)],
+        source=os.path.normpath(data_path), digest=file_digest(data_path), params=params
+    )]
+    publish_artifacts(model, encoder, lb, provenance, model_dir, args.version)
     
-    # Compute performance on slices of data
+    # Compute performance on slices of data, reusing the test-set predictions
     print("\nComputing performance on data slices...")
     output_file = os.path.join(os.path.dirname(__file__), "..", "slice_output.txt")
-    
-    with open(output_file, 'w') as f:
-        f.write("Model Performance on Data Slices\n")
-        f.write("=" * 80 + "\n\n")
-        
-        # Compute slices for each categorical feature
-        for feature in cat_features:
-            f.write(f"\nSlice Performance for Feature: {feature}\n")
-            f.write("-" * 80 + "\n")
-            
-            unique_values = test[feature].unique()
-            
-            for value in sorted(unique_values):
-                # Get slice of test data
-                slice_mask = test[feature] == value
-                test_slice = test[slice_mask].copy()
-                
-                if len(test_slice) == 0:
-                    continue
-                
-                # Process the slice
-                X_slice, y_slice, _, _ = process_data(
-                    test_slice,
-                    categorical_features=cat_features,
-                    label="salary",
-                    training=False,
-                    encoder=encoder,
-                    lb=lb
-                )
-                
-                # Make predictions
-                preds_slice = inference(model, X_slice)
-                
-                # Compute metrics
-                precision_slice, recall_slice, fbeta_slice = compute_model_metrics(
-                    y_slice, preds_slice
-                )
-                
-                f.write(f"  {feature}={value}\n")
-                f.write(f"    Samples: {len(test_slice)}\n")
-                f.write(f"    Precision: {precision_slice:.4f}\n")
-                f.write(f"    Recall: {recall_slice:.4f}\n")
-                f.write(f"    F1 Score: {fbeta_slice:.4f}\n")
-                f.write("\n")
+    slice_metrics = slice_metrics_from_counts(
+        compute_crossed_slice_counts(test, y_test, preds, slice_specs), min_support=args.min_support
+    )
+    write_slice_report(slice_metrics, [slice_name(spec) for spec in slice_specs], output_file)
+    if args.slice_table:
+        write_slice_table(slice_metrics, args.slice_table)
     
     print(f"Slice performance saved to {output_file}")
     print("Training complete!")
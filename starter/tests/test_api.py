@@ -2,12 +2,14 @@
 Unit tests for the FastAPI application.
 """
 
+import pytest
 from fastapi.testclient import TestClient
 import sys
 import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+import main
 from main import app
 
 # Create test client
@@ -140,3 +142,318 @@ def test_get_openapi_docs():
     assert "openapi" in openapi_json, \
         "Response should be valid OpenAPI schema"
 
+
+LOW_INCOME_RECORD = {
+    "age": 25,
+    "workclass": "Private",
+    "fnlgt": 226802,
+    "education": "11th",
+    "education-num": 7,
+    "marital-status": "Never-married",
+    "occupation": "Machine-op-inspct",
+    "relationship": "Own-child",
+    "race": "Black",
+    "sex": "Male",
+    "capital-gain": 0,
+    "capital-loss": 0,
+    "hours-per-week": 40,
+    "native-country": "United-States"
+}
+
+HIGH_INCOME_RECORD = {
+    "age": 52,
+    "workclass": "Self-emp-inc",
+    "fnlgt": 287927,
+    "education": "HS-grad",
+    "education-num": 9,
+    "marital-status": "Married-civ-spouse",
+    "occupation": "Exec-managerial",
+    "relationship": "Wife",
+    "race": "White",
+    "sex": "Female",
+    "capital-gain": 15024,
+    "capital-loss": 0,
+    "hours-per-week": 40,
+    "native-country": "United-States"
+}
+
+
+def test_post_predict_batch_records_match_single():
+    """
+    Test that batch predictions on records match single-row predictions, in order.
+    """
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD, LOW_INCOME_RECORD]
+    response = client.post("/predict/batch", json={"records": records})
+    
+    assert response.status_code == 200, \
+        f"Expected status code 200, got {response.status_code}"
+    
+    expected = [client.post("/predict", json=r).json()["prediction"] for r in records]
+    assert response.json()["predictions"] == expected, \
+        "Batch predictions should match single predictions in input order"
+
+
+def test_post_predict_batch_columns_match_records():
+    """
+    Test that the columnar payload gives the same predictions as records.
+    """
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD]
+    columns = {key: [r[key] for r in records] for key in LOW_INCOME_RECORD}
+    
+    by_columns = client.post("/predict/batch", json={"columns": columns})
+    by_records = client.post("/predict/batch", json={"records": records})
+    
+    assert by_columns.status_code == 200, \
+        f"Expected status code 200, got {by_columns.status_code}"
+    assert by_columns.json() == by_records.json(), \
+        "Columnar and record payloads should give identical predictions"
+
+
+def test_post_predict_batch_validation():
+    """
+    Test that batch payloads are validated.
+    """
+    columns = {key: [value] for key, value in LOW_INCOME_RECORD.items()}
+    columns["age"] = [25, 30]
+    
+    invalid_payloads = [
+        {},
+        {"records": []},
+        {"records": [LOW_INCOME_RECORD], "columns": columns},
+        {"columns": columns},
+    ]
+    for payload in invalid_payloads:
+        response = client.post("/predict/batch", json=payload)
+        assert response.status_code == 422, \
+            f"Should return 422 for invalid batch payload {payload}"
+
+
+def test_post_predict_batch_size_limit(monkeypatch):
+    """
+    Test that batches larger than MAX_BATCH_SIZE are rejected.
+    """
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2)
+    
+    response = client.post("/predict/batch", json={"records": [LOW_INCOME_RECORD] * 3})
+    
+    assert response.status_code == 413, \
+        "Should return 413 for batches above the size limit"
+
+
+def test_post_predict_uses_cache():
+    """
+    Test that repeated records are served from the prediction cache.
+    """
+    before = client.get("/cache/stats").json()
+    if not before["enabled"]:
+        pytest.skip("Prediction cache disabled")
+    
+    first = client.post("/predict", json=HIGH_INCOME_RECORD)
+    second = client.post("/predict", json=HIGH_INCOME_RECORD)
+    after = client.get("/cache/stats").json()
+    
+    assert first.json() == second.json(), "Cached prediction should match"
+    assert after["hits"] > before["hits"], "Repeated record should be a cache hit"
+
+
+def test_post_predict_returns_probability():
+    """
+    Test that return_proba adds a probability consistent with the label.
+    """
+    response = client.post("/predict?return_proba=true", json=HIGH_INCOME_RECORD)
+    
+    assert response.status_code == 200, \
+        f"Expected status code 200, got {response.status_code}"
+    response_json = response.json()
+    assert 0.0 <= response_json["probability"] <= 1.0, \
+        "Probability should be between 0 and 1"
+    assert (response_json["prediction"] == ">50K") == (response_json["probability"] > 0.5), \
+        "Default label should be the most probable class"
+    
+    plain = client.post("/predict", json=HIGH_INCOME_RECORD).json()
+    assert "probability" not in plain, \
+        "Probability should only be returned on request"
+
+
+def test_post_predict_threshold():
+    """
+    Test that the decision threshold controls the label.
+    """
+    low = client.post("/predict?threshold=0.0", json=LOW_INCOME_RECORD)
+    high = client.post("/predict?threshold=1.0&return_proba=true", json=HIGH_INCOME_RECORD)
+    invalid = client.post("/predict?threshold=1.5", json=LOW_INCOME_RECORD)
+    
+    assert low.json()["prediction"] == ">50K", \
+        "Threshold 0 should always predict '>50K'"
+    if high.json()["probability"] < 1.0:
+        assert high.json()["prediction"] == "<=50K", \
+            "Threshold 1 should predict '<=50K' unless the probability is 1"
+    assert invalid.status_code == 422, \
+        "Thresholds outside [0, 1] should be rejected"
+
+
+def test_post_predict_batch_probabilities():
+    """
+    Test that batch probabilities match single-row probabilities.
+    """
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD]
+    columns = {key: [r[key] for r in records] for key in LOW_INCOME_RECORD}
+    
+    by_records = client.post("/predict/batch?return_proba=true", json={"records": records}).json()
+    by_columns = client.post("/predict/batch?return_proba=true", json={"columns": columns}).json()
+    single = [
+        client.post("/predict?return_proba=true", json=r).json()["probability"] for r in records
+    ]
+    
+    assert by_records["probabilities"] == single, \
+        "Batch probabilities should match single-row probabilities"
+    assert by_columns["probabilities"] == single, \
+        "Columnar probabilities should match single-row probabilities"
+
+
+def test_get_admin_model_status():
+    """Test that the admin endpoint reports the active model version."""
+    response = client.get("/admin/model")
+
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    status = response.json()
+    assert status["active"] == main.registry.version, "Should report the active version"
+    assert status["active"] in status["loaded"], "The active version should be loaded"
+
+
+def test_post_admin_model_rollback_unknown_version():
+    """Test that rolling back to an unknown version returns 404."""
+    response = client.post("/admin/model/rollback", params={"version": "does-not-exist"})
+
+    assert response.status_code == 404, f"Expected status 404, got {response.status_code}"
+
+
+def test_admin_endpoints_require_token(monkeypatch):
+    """Test that ADMIN_TOKEN protects the admin endpoints."""
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+
+    assert client.get("/admin/model").status_code == 403, "Missing token should be rejected"
+    response = client.get("/admin/model", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200, "Valid token should be accepted"
+
+
+def test_get_metrics():
+    """Test that /metrics counts requests and reports stage latencies."""
+    client.post("/predict", json=LOW_INCOME_RECORD)
+    response = client.get("/metrics")
+
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    assert response.headers["content-type"].startswith("text/plain"), "Should use the text format"
+    text = response.text
+    assert 'census_http_requests_total{method="POST",path="/predict",status="200"}' in text, \
+        "Requests should be counted by route and status"
+    assert 'census_http_request_duration_seconds_bucket{method="POST",path="/predict",le="+Inf"}' in text, \
+        "Request latency should be a histogram"
+    assert 'census_stage_duration_seconds_count{stage="parse"}' in text, \
+        "Stage latencies should be reported"
+
+
+def test_post_predict_server_timing_header():
+    """Test that X-Server-Timing asks for a per-stage breakdown."""
+    plain = client.post("/predict", json=HIGH_INCOME_RECORD)
+    timed = client.post("/predict/batch", json={"records": [HIGH_INCOME_RECORD, LOW_INCOME_RECORD]},
+                        headers={"X-Server-Timing": "1"})
+
+    assert "server-timing" not in plain.headers, "Timing should be opt-in"
+    stages = [entry.split(";")[0] for entry in timed.headers["server-timing"].split(", ")]
+    assert {"parse", "respond", "total"} <= set(stages), f"Unexpected stages {stages}"
+
+
+def test_post_predict_batch_msgpack_round_trip():
+    """Test MessagePack request and response bodies on /predict/batch."""
+    msgpack = pytest.importorskip("msgpack")
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD]
+    columns = {key: [r[key] for r in records] for key in LOW_INCOME_RECORD}
+    
+    expected = client.post("/predict/batch?return_proba=true", json={"records": records}).json()
+    response = client.post(
+        "/predict/batch?return_proba=true",
+        content=msgpack.packb({"columns": columns}),
+        headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+    )
+    
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    assert response.headers["content-type"] == "application/msgpack", "Should honour Accept"
+    assert msgpack.unpackb(response.content) == expected, "MessagePack results should match JSON"
+
+
+def test_post_predict_batch_arrow_round_trip():
+    """Test Arrow IPC request and response bodies on /predict/batch."""
+    pa = pytest.importorskip("pyarrow")
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD]
+    table = pa.table({key: [r[key] for r in records] for key in LOW_INCOME_RECORD})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    
+    expected = client.post("/predict/batch", json={"records": records}).json()
+    response = client.post(
+        "/predict/batch",
+        content=sink.getvalue().to_pybytes(),
+        headers={"Content-Type": "application/vnd.apache.arrow.stream",
+                 "Accept": "application/vnd.apache.arrow.stream"}
+    )
+    
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    result = pa.ipc.open_stream(response.content).read_all().to_pydict()
+    assert result == expected, "Arrow results should match JSON"
+
+
+def test_post_predict_batch_rejects_unknown_content_type():
+    """Test that unsupported request body types return 415."""
+    response = client.post(
+        "/predict/batch", content=b"age,workclass", headers={"Content-Type": "text/csv"}
+    )
+    
+    assert response.status_code == 415, f"Expected status 415, got {response.status_code}"
+
+
+def test_post_predict_batch_compression():
+    """Test gzip request bodies and negotiated response compression."""
+    import gzip
+    import json
+    
+    records = [LOW_INCOME_RECORD, HIGH_INCOME_RECORD] * 150
+    expected = client.post("/predict/batch", json={"records": records}, headers={"Accept-Encoding": "identity"})
+    response = client.post(
+        "/predict/batch",
+        content=gzip.compress(json.dumps({"records": records}).encode()),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip", "Accept-Encoding": "gzip"}
+    )
+    single = client.post("/predict", json=LOW_INCOME_RECORD, headers={"Accept-Encoding": "gzip"})
+    
+    assert "content-encoding" not in expected.headers, "Identity should not be compressed"
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    assert response.headers["content-encoding"] == "gzip", "Large responses should be compressed"
+    assert response.json() == expected.json(), "Compression should not change the results"
+    assert "content-encoding" not in single.headers, "Responses below the threshold stay uncompressed"
+
+
+def test_post_predict_rejects_unsupported_content_encoding():
+    """Test that unknown or corrupt request encodings are rejected."""
+    unknown = client.post("/predict", content=b"{}", headers={"Content-Encoding": "br"})
+    corrupt = client.post("/predict", content=b"not gzip", headers={"Content-Encoding": "gzip"})
+    
+    assert unknown.status_code == 415, f"Expected status 415, got {unknown.status_code}"
+    assert corrupt.status_code == 400, f"Expected status 400, got {corrupt.status_code}"
+
+
+def test_get_health_ready_after_startup():
+    """Test that a worker only reports ready once its lifespan has warmed it up."""
+    assert client.get("/health/ready").status_code == 503, \
+        "A worker that has not started up should not be ready"
+    
+    with TestClient(app) as started:
+        response = started.get("/health/ready")
+        live = started.get("/health").json()
+    
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    status = response.json()
+    assert status["pid"] == os.getpid(), "Should identify the answering process"
+    assert status["model_version"] == main.registry.version, "Should report the active model"
+    assert live["ready"], "Liveness should include readiness"
@@ -0,0 +1,73 @@
+"""
+Unit tests for the API benchmark script.
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
+
+import pytest
+
+import bench_api
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'census.csv')
+
+
+def test_benchmark_in_process_reports_every_kind():
+    """Test that an in-process run scores every payload kind without errors."""
+    rows = bench_api.load_rows(DATA_PATH, nrows=100)
+    mix = bench_api.parse_mix("predict=2,records,columns")
+
+    report = asyncio.run(bench_api.benchmark(
+        rows=rows, mix=mix, n_requests=30, concurrency=4, batch_size=5, warmup=2
+    ))
+    results = report["results"]
+
+    assert set(results) == {"predict", "records", "columns", "all"}, f"Unexpected kinds {set(results)}"
+    assert results["all"]["requests"] == 30, "Only measured requests should be counted"
+    assert results["all"]["errors"] == 0, "No request should fail"
+    assert results["all"]["p50_ms"] <= results["all"]["p99_ms"], "Percentiles should be ordered"
+    assert bench_api.check_regressions(report) == [], "A clean run should pass the gate"
+    assert report["prediction_cache"] == {"enabled": False}, "The cache should be off by default"
+
+
+def test_benchmark_in_process_runs_lifespan_and_reports_cache_hits(monkeypatch):
+    """Test that the app is started for the run and cache hits are reported when the cache is kept."""
+    import main
+    started = []
+    original = main.app.router.lifespan_context
+
+    def lifespan(app):
+        started.append(app)
+        return original(app)
+
+    monkeypatch.setattr(main.app.router, "lifespan_context", lifespan)
+    rows = bench_api.load_rows(DATA_PATH, nrows=3)
+    report = asyncio.run(bench_api.benchmark(rows=rows, n_requests=20, concurrency=2, warmup=3,
+                                             prediction_cache=True))
+
+    assert started == [main.app], "The app's lifespan should run around the load"
+    assert main.cache is not None, "The app's cache should be restored"
+    cache = report["prediction_cache"]
+    assert cache["enabled"] and cache["hits"] + cache["misses"] == 20
+    assert cache["hit_ratio"] > 0.5, "Repeated payloads should mostly hit the cache"
+
+
+def test_check_regressions_against_baseline():
+    """Test that slower p99 latency or lower throughput fails the gate."""
+    baseline = {"results": {"predict": {"requests": 10, "errors": 0, "p99_ms": 10.0, "requests_per_sec": 100.0}}}
+    slower = {"results": {"predict": {"requests": 10, "errors": 0, "p99_ms": 12.0, "requests_per_sec": 80.0}}}
+
+    assert len(bench_api.check_regressions(slower, baseline, max_regression=0.1)) == 2, \
+        "Both the latency and the throughput regression should be reported"
+    assert bench_api.check_regressions(slower, baseline, max_regression=0.5) == [], \
+        "Changes within the tolerance should pass"
+    assert bench_api.check_regressions(slower, max_p99_ms=11.0), "Absolute p99 limit should apply"
+
+
+def test_parse_mix_rejects_unknown_kind():
+    """Test that the payload mix only accepts known kinds."""
+    with pytest.raises(ValueError):
+        bench_api.parse_mix("predict=1,stream=1")
@@ -0,0 +1,46 @@
+"""
+Unit tests for the ml library benchmark script.
+
+Set BENCH_ML_SIZES (e.g. "1,10000,1000000") to run the benchmark at other
+batch sizes through pytest; the results are printed with `pytest -s`.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
+
+import bench_ml
+
+SIZES = [int(size) for size in os.environ.get("BENCH_ML_SIZES", "1,300").split(",")]
+
+
+def test_synthesize_resamples_census_rows():
+    """Test that synthetic data has the requested size and only census values."""
+    data = bench_ml.read_census(bench_ml.DEFAULT_DATA_PATH, nrows=50)
+
+    sample = bench_ml.synthesize(data, 500, seed=1)
+
+    assert len(sample) == 500, "Sample should have the requested number of rows"
+    assert list(sample.columns) == list(data.columns), "Schema should be unchanged"
+    assert set(sample["workclass"]) <= set(data["workclass"]), "Values should come from the source rows"
+    assert sample.equals(bench_ml.synthesize(data, 500, seed=1)), "Sampling should be reproducible"
+
+
+def test_run_benchmarks_covers_every_function():
+    """Test that both modes measure every library function at every size."""
+    report = bench_ml.run_benchmarks(SIZES, repeat=1, progress=sys.stdout)
+    measured = {(r["function"], r["mode"], r["variant"], r["rows"]) for r in report["results"]}
+
+    for rows in SIZES:
+        for function, mode, variant in [
+            ("process_data", "training", "dense"),
+            ("process_data", "training", "sparse"),
+            ("process_data", "inference", "sparse"),
+            ("inference", "inference", "pickle"),
+            ("inference", "inference", "compiled"),
+            ("compute_model_metrics", "inference", "-"),
+        ]:
+            assert (function, mode, variant, rows) in measured, f"Missing {function}/{mode}/{variant} at {rows} rows"
+    assert all(r["seconds"] > 0 and r["peak_mib"] >= 0 for r in report["results"]), \
+        "Time and peak memory should be measured"
@@ -0,0 +1,81 @@
+"""
+Unit tests for the chunked slice evaluation script.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
+
+import json
+
+import pandas as pd
+import pytest
+
+import evaluate_slices
+from ml.data import process_data
+from ml.dataset import CATEGORICAL_FEATURES
+from ml.model import inference
+from ml.slices import compute_crossed_slice_counts, parse_slice_specs, slice_metrics_from_counts
+from serving.predictor import Predictor
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'census.csv')
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
+
+
+@pytest.fixture
+def census_sample(tmp_path):
+    """Write the first 250 census rows to a temporary CSV."""
+    path = tmp_path / "sample.csv"
+    pd.read_csv(DATA_PATH, nrows=250).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_evaluate_file_matches_single_pass(census_sample, workers):
+    """Test that chunked, parallel slice metrics equal evaluating all rows at once."""
+    slices = ["race", "sex", "race x sex"]
+
+    metrics = evaluate_slices.evaluate_file(
+        census_sample, MODEL_DIR, slices, chunksize=60, workers=workers, min_support=5
+    )
+
+    data = pd.read_csv(census_sample, skipinitialspace=True)
+    predictor = Predictor.from_dir(MODEL_DIR, CATEGORICAL_FEATURES)
+    X, y, _, _ = process_data(
+        data, CATEGORICAL_FEATURES, label="salary", training=False,
+        encoder=predictor.encoder, lb=predictor.lb
+    )
+    expected = slice_metrics_from_counts(
+        compute_crossed_slice_counts(data, y, inference(predictor.model, X), parse_slice_specs(slices)),
+        min_support=5,
+    )
+
+    key = ["feature", "value"]
+    pd.testing.assert_frame_equal(
+        metrics.sort_values(key).reset_index(drop=True), expected.sort_values(key).reset_index(drop=True)
+    )
+    assert (metrics["n_samples"] >= 5).all()
+
+
+def test_main_writes_report_and_table(census_sample, tmp_path):
+    """Test the text report and JSON table written by the script."""
+    report = tmp_path / "slices.txt"
+    table = tmp_path / "slices.json"
+
+    evaluate_slices.main([
+        census_sample, "--slices", "sex,race*sex", "--output", str(report), "--table", str(table)
+    ])
+
+    text = report.read_text()
+    assert "Slice Performance for Feature: race x sex" in text
+    assert "  sex=Female\n" in text
+    records = json.loads(table.read_text())
+    assert {record["feature"] for record in records} == {"sex", "race x sex"}
+    assert sum(record["n_samples"] for record in records if record["feature"] == "sex") == 250
+
+
+def test_main_requires_output(census_sample):
+    """Test that the script does not fall back to overwriting slice_output.txt."""
+    with pytest.raises(SystemExit):
+        evaluate_slices.main([census_sample, "--slices", "sex"])
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
 import pytest
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import OneHotEncoder, LabelBinarizer
 import tempfile
@@ -17,13 +18,36 @@ import tempfile
 from ml.model import (
     train_model,
     compute_model_metrics,
+    compute_model_metrics_on_slices,
     inference,
     save_model,
     load_model,
     save_encoder,
-    load_encoder
+    load_encoder,
+    with_n_jobs
 )
-from ml.data import process_data
+from ml.data import CompiledEncoder, process_data
+from ml.dataset import CATEGORICAL_FEATURES, read_census
+from ml.feature_cache import load_encoded_split
+from ml.forest import compile_forest, load_compiled_forest, save_compiled_forest
+from ml.compress import compare_models, compress_forest, prune_tree, select_trees
+from ml.incremental import add_trees, load_provenance, provenance_record, save_provenance, train_increment
+from ml.search import (
+    choose_params,
+    evaluate_finalists,
+    parse_search_space,
+    search_forest,
+    search_results
+)
+from ml.slices import (
+    compute_crossed_slice_counts,
+    merge_slice_counts,
+    parse_slice_specs,
+    slice_metrics_from_counts,
+    write_slice_table
+)
+
+CENSUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'census.csv')
 
 
 @pytest.fixture
@@ -54,16 +78,7 @@ def sample_data():
 @pytest.fixture
 def processed_data(sample_data):
     """Process sample data for testing."""
-    cat_features = [
-        "workclass",
-        "education",
-        "marital-status",
-        "occupation",
-        "relationship",
-        "race",
-        "sex",
-        "native-country",
-    ]
+    cat_features = CATEGORICAL_FEATURES
     
     X, y, encoder, lb = process_data(
         sample_data,
@@ -101,6 +116,22 @@ def test_train_model_can_fit(processed_data):
         "Number of predictions should match number of samples"
 
 
+def test_with_n_jobs_overrides_parallelism(processed_data):
+    """Test that with_n_jobs changes n_jobs on a copy sharing the fitted trees."""
+    X, y, _, _ = processed_data
+    model = train_model(X, y, n_jobs=2)
+    sequential = with_n_jobs(model, 1)
+    
+    assert model.n_jobs == 2, "The original model should keep its setting"
+    assert sequential.n_jobs == 1, "The copy should use the new setting"
+    assert sequential.estimators_ is model.estimators_, "The fitted trees should be shared"
+    assert np.array_equal(inference(sequential, X), inference(model, X)), \
+        "Predictions should not depend on n_jobs"
+    assert with_n_jobs(model, None) is model, "None should keep the model as is"
+    assert with_n_jobs(compile_forest(model), 1).n_estimators == model.n_estimators, \
+        "Models without n_jobs should be returned unchanged"
+
+
 def test_inference_returns_correct_shape(processed_data):
     """Test that inference returns predictions with correct shape."""
     X, y, _, _ = processed_data
@@ -246,3 +277,484 @@ def test_process_data_inference_mode(sample_data):
     assert X_test.shape[1] == X_train.shape[1], \
         "Feature dimensions should match between train and test"
 
+
+def test_compiled_encoder_matches_process_data(sample_data):
+    """Test that CompiledEncoder output is bit-for-bit identical to process_data."""
+    cat_features = CATEGORICAL_FEATURES
+    features = sample_data.drop(columns=["salary"])
+    cont_features = [c for c in features.columns if c not in cat_features]
+    _, _, encoder, lb = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=True
+    )
+
+    # Include a category the encoder has never seen
+    unseen = features.copy()
+    unseen.loc[0, "workclass"] = "Never-seen"
+
+    for frame in (features, unseen):
+        expected, _, _, _ = process_data(
+            frame, categorical_features=cat_features, training=False, encoder=encoder, lb=lb
+        )
+        compiled = CompiledEncoder(encoder, cat_features, cont_features)
+
+        from_records = compiled.transform(frame.to_dict(orient="records"))
+        from_columns = compiled.transform_columns(frame.to_dict(orient="list"))
+
+        assert from_records.dtype == expected.dtype, "dtype should match process_data"
+        np.testing.assert_array_equal(from_records, expected)
+        np.testing.assert_array_equal(from_columns, expected)
+
+
+def test_inference_probabilities_match_predict(processed_data):
+    """Test that labels from the probability pass match model.predict."""
+    X, y, _, _ = processed_data
+    model = train_model(X, y)
+
+    # The sample only contains '<=50K', so the positive class is never seen
+
+    preds, scores = inference(model, X, return_proba=True)
+
+    np.testing.assert_array_equal(preds, inference(model, X))
+    np.testing.assert_array_equal(scores, np.zeros(len(y)))
+    np.testing.assert_array_equal(
+        inference(model, X, threshold=0.0), np.ones(len(y), dtype=preds.dtype)
+    )
+
+
+def test_inference_probabilities_two_classes(processed_data):
+    """Test probabilities and thresholds on a model that saw both classes."""
+    X, _, _, _ = processed_data
+    y = np.array([0, 1, 0, 1, 1])
+    model = train_model(X, y)
+
+    preds, scores = inference(model, X, return_proba=True)
+
+    np.testing.assert_array_equal(preds, model.predict(X))
+    np.testing.assert_array_equal(scores, model.predict_proba(X)[:, 1])
+    np.testing.assert_array_equal(inference(model, X, threshold=0.5), (scores >= 0.5).astype(int))
+
+
+def test_compiled_forest_matches_predict_proba(processed_data):
+    """Test that the compiled forest reproduces predict_proba exactly."""
+    X, _, _, _ = processed_data
+    y = np.array([0, 1, 0, 1, 1])
+    model = train_model(X, y)
+    model.n_jobs = 1
+
+    forest = compile_forest(model)
+
+    np.testing.assert_array_equal(forest.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+    np.testing.assert_array_equal(inference(forest, X), inference(model, X))
+
+
+def test_save_and_load_compiled_forest(processed_data, tmp_path):
+    """Test that a compiled forest survives a save/load round trip."""
+    X, _, _, _ = processed_data
+    model = train_model(X, np.array([0, 1, 0, 1, 1]))
+    forest = compile_forest(model)
+
+    save_compiled_forest(forest, str(tmp_path / "forest"))
+    loaded = load_compiled_forest(str(tmp_path / "forest"))
+
+    assert loaded.n_estimators == model.n_estimators, "Tree count should be preserved"
+    np.testing.assert_array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+
+
+def test_load_model_memory_maps_compiled_forest(processed_data, tmp_path):
+    """Test that load_model memory-maps a compiled forest directory."""
+    X, _, _, _ = processed_data
+    model = train_model(X, np.array([0, 1, 0, 1, 1]))
+    model.n_jobs = 1
+    save_compiled_forest(compile_forest(model), str(tmp_path / "forest"))
+
+    loaded = load_model(str(tmp_path / "forest"))
+
+    assert isinstance(loaded.value.base, np.memmap), "Node arrays should be memory-mapped"
+    assert not loaded.value.flags.writeable, "Mapped arrays should be read-only"
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+
+
+def test_saving_a_forest_leaves_mapped_forests_unchanged(processed_data, tmp_path):
+    """Test that overwriting a forest directory does not change a forest mapped from it."""
+    X, _, _, _ = processed_data
+    path = str(tmp_path / "forest")
+    save_compiled_forest(compile_forest(train_model(X, np.array([0, 1, 0, 1, 1]))), path)
+    serving = load_model(path)
+    before = serving.predict_proba(X)
+
+    retrained = compile_forest(train_model(X, np.array([1, 0, 1, 0, 0]), n_estimators=3))
+    save_compiled_forest(retrained, path)
+
+    np.testing.assert_array_equal(serving.predict_proba(X), before)
+    np.testing.assert_array_equal(load_model(path).predict_proba(X), retrained.predict_proba(X))
+    assert not [name for name in os.listdir(path) if ".tmp-" in name], "No temporary files should be left"
+
+
+def test_save_and_load_encoder_json(sample_data, tmp_path):
+    """Test that encoders saved as JSON manifests transform like the originals."""
+    cat_features = CATEGORICAL_FEATURES
+    X, y, encoder, lb = process_data(
+        sample_data, categorical_features=cat_features, label='salary', training=True
+    )
+    save_encoder(encoder, str(tmp_path / "encoder.json"))
+    save_encoder(lb, str(tmp_path / "lb.json"))
+
+    loaded_encoder = load_encoder(str(tmp_path / "encoder.json"))
+    loaded_lb = load_encoder(str(tmp_path / "lb.json"))
+    X_loaded, y_loaded, _, _ = process_data(
+        sample_data, categorical_features=cat_features, label='salary',
+        training=False, encoder=loaded_encoder, lb=loaded_lb
+    )
+
+    np.testing.assert_array_equal(X_loaded, X)
+    np.testing.assert_array_equal(y_loaded, y)
+    np.testing.assert_array_equal(loaded_lb.classes_, lb.classes_)
+
+
+def test_compute_model_metrics_on_slices(processed_data, sample_data):
+    """Test the per-feature slice helper on a trained model."""
+    X, y, encoder, _ = processed_data
+    model = train_model(X, y)
+    features = sample_data.drop(columns=["salary"])
+
+    cat_features = CATEGORICAL_FEATURES
+
+    slice_metrics = compute_model_metrics_on_slices(
+        model, features, pd.Series(y), "race", cat_features, encoder
+    )
+
+    assert set(slice_metrics) == {"White", "Black"}, "Each race value should be a slice"
+    assert sum(m["n_samples"] for m in slice_metrics.values()) == len(features), \
+        "Slices should cover every row"
+
+
+def test_parse_slice_specs():
+    """Test that single and crossed slice specifications are normalized."""
+    assert parse_slice_specs(["race", "race x sex", "race*sex", ("sex", "race")]) == [
+        ("race",), ("race", "sex"), ("race", "sex"), ("sex", "race")
+    ]
+    with pytest.raises(ValueError):
+        parse_slice_specs(["race x "])
+
+
+def test_crossed_slice_counts_match_masks(sample_data):
+    """Test that single and crossed slices count exactly the rows with every value."""
+    y = np.array([1, 0, 1, 1, 0])
+    preds = np.array([1, 1, 0, 1, 0])
+    specs = parse_slice_specs(["workclass", "race", "sex", "race x sex"])
+
+    metrics = slice_metrics_from_counts(compute_crossed_slice_counts(sample_data, y, preds, specs))
+
+    crossed = metrics[metrics["feature"] == "race x sex"]
+    assert set(crossed["value"]) == {"White x Male", "Black x Male", "Black x Female"}
+    assert len(metrics) == len(crossed) + sum(sample_data[f].nunique() for f in ["workclass", "race", "sex"]), \
+        "Every observed value of every spec should be reported"
+    for row in metrics.itertuples(index=False):
+        mask = np.ones(len(sample_data), dtype=bool)
+        for feature, value in zip(row.feature.split(" x "), row.value.split(" x ")):
+            mask &= (sample_data[feature] == value).to_numpy()
+        assert row.n_samples == mask.sum(), "Slice size should match"
+        assert (row.precision, row.recall, row.fbeta) == compute_model_metrics(y[mask], preds[mask]), \
+            f"Metrics for {row.value} should match compute_model_metrics"
+
+
+def test_merged_chunk_counts_match_single_pass(sample_data):
+    """Test that counts from disjoint chunks add up to the counts of all rows."""
+    y = np.array([1, 0, 1, 1, 0])
+    preds = np.array([1, 1, 0, 1, 0])
+    specs = parse_slice_specs(["race", "sex", "race x sex"])
+
+    whole = compute_crossed_slice_counts(sample_data, y, preds, specs)
+    merged = merge_slice_counts([
+        compute_crossed_slice_counts(sample_data.iloc[rows], y[rows], preds[rows], specs)
+        for rows in (slice(0, 2), slice(2, 5))
+    ])
+
+    key = ["feature", "value"]
+    pd.testing.assert_frame_equal(
+        merged.sort_values(key).reset_index(drop=True), whole.sort_values(key).reset_index(drop=True)
+    )
+    supported = slice_metrics_from_counts(merged, min_support=2)
+    assert (supported["n_samples"] >= 2).all(), "Slices below min_support should be dropped"
+    assert "Black x Female" not in set(supported["value"])
+
+
+def test_write_slice_table(sample_data, tmp_path):
+    """Test the CSV and JSON slice tables."""
+    y = np.array([1, 0, 1, 1, 0])
+    metrics = slice_metrics_from_counts(
+        compute_crossed_slice_counts(sample_data, y, y, parse_slice_specs(["race x sex"]))
+    )
+
+    write_slice_table(metrics, str(tmp_path / "slices.csv"))
+    write_slice_table(metrics, str(tmp_path / "slices.json"))
+
+    from_csv = pd.read_csv(tmp_path / "slices.csv")
+    from_json = pd.read_json(tmp_path / "slices.json", orient="records")
+    assert list(from_csv.columns) == list(metrics.columns)
+    assert from_csv["n_samples"].tolist() == metrics["n_samples"].tolist()
+    assert from_json["value"].tolist() == metrics["value"].tolist()
+
+
+def test_train_increment_adds_trees_and_new_categories():
+    """Test that an increment keeps the old trees' predictions and learns new categories."""
+    cat_features = CATEGORICAL_FEATURES
+    data = pd.read_csv(CENSUS_PATH, skipinitialspace=True, nrows=3000)
+    old = data.iloc[:2000]
+    old = old[old["race"] != "Other"]
+    batch = data.iloc[2000:]
+    X, y, encoder, lb = process_data(old, categorical_features=cat_features, label="salary", training=True)
+    model = train_model(X, y, n_jobs=1)
+
+    updated, extended, record = train_increment(
+        model, encoder, lb, batch, cat_features, n_estimators=5, n_jobs=1
+    )
+
+    assert len(model.estimators_) == 100, "The original model should be left unchanged"
+    assert len(updated.estimators_) == 105
+    assert record["trees"] == [100, 105] and record["rows"] == len(batch)
+    assert record["new_categories"]["race"] == ["Other"]
+    race = cat_features.index("race")
+    assert extended.categories_[race].tolist() == encoder.categories_[race].tolist() + ["Other"], \
+        "New categories should be appended after the known ones"
+
+    X_old, _, _, _ = process_data(old, cat_features, label="salary", training=False, encoder=encoder, lb=lb)
+    X_new, _, _, _ = process_data(old, cat_features, label="salary", training=False, encoder=extended, lb=lb)
+    for before, after in zip(model.estimators_, updated.estimators_[:100]):
+        np.testing.assert_array_equal(after.predict_proba(X_new), before.predict_proba(X_old))
+    assert inference(updated, X_new).shape == (len(old),)
+
+
+def test_add_trees_requires_every_class(processed_data):
+    """Test that a batch with a single class is rejected."""
+    X, y, _, _ = processed_data
+    model = RandomForestClassifier(n_estimators=2, random_state=0).fit(X, np.array([0, 1, 0, 1, 0]))
+
+    with pytest.raises(ValueError):
+        add_trees(model, X, y, n_estimators=2)
+
+
+def test_provenance_round_trip(tmp_path):
+    """Test that provenance records are saved next to the model and appended to."""
+    assert load_provenance(str(tmp_path)) == []
+    records = [provenance_record("full", 100, [0, 10], source="census.csv", digest="abc")]
+    save_provenance(records, str(tmp_path))
+    records = load_provenance(str(tmp_path)) + [provenance_record("increment", 20, [10, 12], new_categories={})]
+    save_provenance(records, str(tmp_path))
+
+    loaded = load_provenance(str(tmp_path))
+    assert [record["kind"] for record in loaded] == ["full", "increment"]
+    assert loaded[0]["digest"] == "abc" and loaded[1]["trees"] == [10, 12]
+
+
+def test_parse_search_space():
+    """Test the command-line form of the search space."""
+    space = parse_search_space("n_estimators=10,20; max_depth=4,None ;max_features=sqrt,0.5")
+
+    assert space == {"n_estimators": [10, 20], "max_depth": [4, None], "max_features": ["sqrt", 0.5]}
+    with pytest.raises(ValueError):
+        parse_search_space("n_jobs=1,2")
+    with pytest.raises(ValueError):
+        parse_search_space("max_depth")
+
+
+def test_search_prunes_candidates_and_reports_latency():
+    """Test that successive halving drops candidates and finalists get F1 and latency."""
+    cat_features = CATEGORICAL_FEATURES
+    data = pd.read_csv(CENSUS_PATH, skipinitialspace=True, nrows=1500)
+    X, y, encoder, lb = process_data(data.iloc[:1200], cat_features, label="salary", training=True)
+    X_test, y_test, _, _ = process_data(
+        data.iloc[1200:], cat_features, label="salary", training=False, encoder=encoder, lb=lb
+    )
+
+    search = search_forest(X, y, {"n_estimators": [5, 10], "max_depth": [2, 4, 8]}, cv=2, factor=3, n_jobs=2)
+    results = search_results(search)
+
+    assert len(results) == 6
+    assert results["rounds"].max() == 2 and (results["rounds"] == 2).sum() == 2, \
+        "Only the best third should reach the second round"
+    finalists = evaluate_finalists(results, X, y, X_test, y_test, top_k=2, n_jobs=1)
+    assert (finalists["single_us_per_row"] > 0).all() and (finalists["batch_us_per_row"] > 0).all()
+    assert finalists["test_f1"].between(0, 1).all()
+
+    slowest = finalists["single_us_per_row"].max()
+    assert choose_params(finalists, max_us_per_row=slowest) == dict(finalists.loc[finalists["f1"].idxmax(), "params"])
+    with pytest.raises(ValueError):
+        choose_params(finalists, max_us_per_row=0)
+
+    # A candidate dropped after the first round, scored on fewer rows, is never chosen
+    early = finalists.iloc[[0]].assign(rounds=1, f1=1.0, params=[{"max_depth": 1}])
+    assert choose_params(pd.concat([finalists, early], ignore_index=True)) == choose_params(finalists)
+
+
+@pytest.fixture(scope="module")
+def census_forest():
+    """A small forest trained on census rows, with encoded train/test rows."""
+    cat_features = CATEGORICAL_FEATURES
+    data = pd.read_csv(CENSUS_PATH, skipinitialspace=True, nrows=2000)
+    train, test = data.iloc[:1500], data.iloc[1500:].reset_index(drop=True)
+    X, y, encoder, lb = process_data(train, cat_features, label="salary", training=True)
+    X_test, y_test, _, _ = process_data(test, cat_features, label="salary", training=False, encoder=encoder, lb=lb)
+    model = train_model(X, y, n_jobs=1, n_estimators=20, max_depth=None)
+    return model, X, X_test, y_test, test, cat_features
+
+
+def test_prune_tree_caps_depth_and_merges_leaves(census_forest):
+    """Test that pruning is exact without limits and shrinks trees with them."""
+    model, X, X_test, _, _, _ = census_forest
+    estimator = model.estimators_[0]
+
+    unchanged = prune_tree(estimator.tree_)
+    capped = prune_tree(estimator.tree_, max_depth=3)
+    merged = prune_tree(estimator.tree_, merge_tolerance=1.0)
+
+    X_test = X_test.astype(np.float32)
+    np.testing.assert_array_equal(unchanged.predict(X_test), estimator.tree_.predict(X_test))
+    assert capped.max_depth == 3 and capped.node_count < estimator.tree_.node_count
+    assert merged.node_count == 1, "With the largest tolerance every split should be merged away"
+    np.testing.assert_allclose(merged.predict(X_test[:1])[0], estimator.tree_.value[0, 0])
+    assert estimator.tree_.node_count > 1, "The original tree should be left unchanged"
+
+
+def test_compress_forest_reports_drift_and_size(census_forest):
+    """Test tree selection, compilation of the compact forest and the comparison report."""
+    model, X, X_test, y_test, test, cat_features = census_forest
+
+    indices = select_trees(model, X, 5)
+    compact = compress_forest(model, X, n_trees=5, max_depth=6, merge_tolerance=0.01)
+    report = compare_models(model, compact, X_test, y_test, test, parse_slice_specs(["sex", "race"]))
+
+    assert len(indices) == 5 and len(set(indices.tolist())) == 5
+    assert len(compact.estimators_) == 5 and len(model.estimators_) == 20
+    np.testing.assert_allclose(
+        compile_forest(compact).predict_proba(X_test), compact.predict_proba(X_test), rtol=0, atol=1e-12
+    )
+    assert report["compact"]["n_nodes"] < report["original"]["n_nodes"]
+    assert report["compact"]["pickle_bytes"] < report["original"]["pickle_bytes"]
+    assert report["fbeta_drift"] == report["compact"]["fbeta"] - report["original"]["fbeta"]
+    assert report["max_slice_drift"] == max(abs(row["drift"]) for row in report["slices"])
+    assert {row["feature"] for row in report["slices"]} == {"sex", "race"}
+
+
+def test_load_encoded_split_uses_cache(sample_data, tmp_path):
+    """Test that a second load of the same data is served from the cache."""
+    data = pd.concat([sample_data] * 4, ignore_index=True)
+    data_path = tmp_path / "data.csv"
+    data.to_csv(data_path, index=False)
+    cache_dir = str(tmp_path / "cache")
+    cat_features = CATEGORICAL_FEATURES
+
+    first = load_encoded_split(str(data_path), cat_features, cache_dir=cache_dir)
+    second = load_encoded_split(str(data_path), cat_features, cache_dir=cache_dir)
+
+    assert not first.hit and second.hit, "Second load should be a cache hit"
+    for name in ("X_train", "y_train", "X_test", "y_test"):
+        np.testing.assert_array_equal(getattr(first, name), getattr(second, name))
+    pd.testing.assert_frame_equal(first.test, second.test)
+    assert list(second.encoder.categories_[0]) == list(first.encoder.categories_[0]), \
+        "Cached encoder should match the fitted one"
+
+    data.loc[0, "age"] = 99
+    data.to_csv(data_path, index=False)
+    changed = load_encoded_split(str(data_path), cat_features, cache_dir=cache_dir)
+
+    assert not changed.hit and changed.key != first.key, \
+        "Changing the data should invalidate the cache"
+
+
+def test_process_data_sparse_matches_dense(sample_data):
+    """Test that sparse mode returns the dense matrix as CSR."""
+    cat_features = CATEGORICAL_FEATURES
+
+    X_dense, y_dense, _, _ = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=True
+    )
+    X_sparse, y_sparse, encoder, lb = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=True, sparse=True
+    )
+    X_test, _, _, _ = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=False,
+        encoder=encoder, lb=lb, sparse=True
+    )
+
+    assert sp.isspmatrix_csr(X_sparse), "Sparse mode should return a CSR matrix"
+    np.testing.assert_array_equal(X_sparse.toarray(), X_dense)
+    np.testing.assert_array_equal(X_test.toarray(), X_dense)
+    np.testing.assert_array_equal(y_sparse, y_dense)
+
+    # A sparse-fitted encoder still produces dense output by default
+    X_from_sparse_encoder, _, _, _ = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=False,
+        encoder=encoder, lb=lb
+    )
+    np.testing.assert_array_equal(X_from_sparse_encoder, X_dense)
+
+
+def test_train_and_inference_on_sparse_data(sample_data):
+    """Test that the model trains and predicts on sparse matrices."""
+    cat_features = CATEGORICAL_FEATURES
+    X, _, _, _ = process_data(
+        sample_data, categorical_features=cat_features, label="salary", training=True, sparse=True
+    )
+    y = np.array([0, 1, 0, 1, 1])
+
+    model = train_model(X, y)
+    model.n_jobs = 1
+    preds = inference(model, X)
+
+    np.testing.assert_array_equal(preds, model.predict(X.toarray()))
+    np.testing.assert_array_equal(compile_forest(model).predict_proba(X), model.predict_proba(X))
+
+
+def test_read_census_declared_types(tmp_path):
+    """Test that census files load with compact dtypes and stripped categories."""
+    path = tmp_path / "batch.csv"
+    pd.read_csv(CENSUS_PATH, nrows=20).to_csv(path, index=False)
+    with open(path, "a") as f:
+        f.write("40, Private,1000, Bachelors,13, Divorced, Sales, Unmarried, White,Male,0,0,40,  Cuba ,>50K\n")
+
+    data = read_census(path)
+
+    assert data["age"].dtype == np.int32, "Numeric columns should be int32"
+    assert all(isinstance(data[f].dtype, pd.CategoricalDtype) for f in CATEGORICAL_FEATURES + ["salary"])
+    assert list(data["sex"].cat.categories) == ["Female", "Male"], "Padded values should merge into one category"
+    assert data["native-country"].iloc[-1] == "Cuba"
+    chunks = list(read_census(path, chunksize=8))
+    assert [len(chunk) for chunk in chunks] == [8, 8, 5]
+    assert (pd.concat(chunks)["workclass"].astype(str) == data["workclass"].astype(str)).all()
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_process_data_typed_matches_object_columns(sparse):
+    """Test that category columns encode exactly like the same data as strings."""
+    typed = read_census(CENSUS_PATH, nrows=3000)
+    raw = pd.read_csv(CENSUS_PATH, nrows=3000, skipinitialspace=True)
+    dense = lambda X: X.toarray() if sp.issparse(X) else X  # noqa: E731
+
+    X_raw, y_raw, encoder, lb = process_data(raw[:2000], CATEGORICAL_FEATURES, "salary", True, sparse=sparse)
+    X_typed, y_typed, typed_encoder, typed_lb = process_data(
+        typed[:2000], CATEGORICAL_FEATURES, "salary", True, sparse=sparse
+    )
+    assert sp.issparse(X_typed) == sparse
+    np.testing.assert_array_equal(dense(X_typed), dense(X_raw))
+    np.testing.assert_array_equal(y_typed, y_raw)
+    for typed_categories, categories in zip(typed_encoder.categories_, encoder.categories_):
+        assert typed_categories.tolist() == categories.tolist()
+    assert typed_lb.classes_.tolist() == lb.classes_.tolist()
+
+    # Unseen categories encode as all zeros, like OneHotEncoder(handle_unknown="ignore")
+    raw_test, typed_test = raw[2000:].copy(), typed[2000:].copy()
+    raw_test.loc[raw_test.index[0], "workclass"] = "Atlantis"
+    typed_test["workclass"] = typed_test["workclass"].cat.add_categories("Atlantis")
+    typed_test.loc[typed_test.index[0], "workclass"] = "Atlantis"
+    X_raw, y_raw, _, _ = process_data(raw_test, CATEGORICAL_FEATURES, "salary", False, encoder, lb, sparse=sparse)
+    X_typed, y_typed, _, _ = process_data(
+        typed_test, CATEGORICAL_FEATURES, "salary", False, encoder, lb, sparse=sparse
+    )
+    np.testing.assert_array_equal(dense(X_typed), dense(X_raw))
+    np.testing.assert_array_equal(y_typed, y_raw)
+
+    strict = OneHotEncoder(handle_unknown="error", sparse_output=sparse).fit(raw[CATEGORICAL_FEATURES].values)
+    with pytest.raises(ValueError):
+        process_data(typed_test, CATEGORICAL_FEATURES, "salary", False, strict, lb, sparse=sparse)
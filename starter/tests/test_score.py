@@ -0,0 +1,56 @@
+"""
+Unit tests for the streaming scoring script.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
+
+import pandas as pd
+import pytest
+
+import score
+from ml.dataset import CATEGORICAL_FEATURES
+from serving.predictor import Predictor
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'census.csv')
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
+
+
+@pytest.fixture
+def census_sample(tmp_path):
+    """Write the first 250 census rows to a temporary CSV."""
+    path = tmp_path / "sample.csv"
+    pd.read_csv(DATA_PATH, nrows=250).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_score_file_matches_in_memory_scoring(census_sample, tmp_path, workers):
+    """Test that chunked scoring matches scoring the whole file at once."""
+    output = str(tmp_path / "scores.csv")
+
+    n_rows = score.score_file(
+        census_sample, output, MODEL_DIR, chunksize=60, workers=workers, progress=None
+    )
+
+    data = pd.read_csv(census_sample).drop(columns=["salary"])
+    predictor = Predictor.from_dir(MODEL_DIR, CATEGORICAL_FEATURES)
+    labels, scores = predictor.score_frame(data)
+    result = pd.read_csv(output)
+
+    assert n_rows == len(data), "Every input row should be scored"
+    assert result["row"].tolist() == list(range(len(data))), "Input order should be preserved"
+    assert result["prediction"].tolist() == list(labels), "Predictions should match"
+    assert result["probability"].tolist() == pytest.approx(list(scores)), "Probabilities should match"
+
+
+def test_score_file_applies_threshold(census_sample, tmp_path):
+    """Test that the threshold option controls the labels."""
+    output = str(tmp_path / "scores.csv")
+
+    score.score_file(census_sample, output, MODEL_DIR, chunksize=100, threshold=0.0, progress=None)
+
+    assert set(pd.read_csv(output)["prediction"]) == {">50K"}, \
+        "Threshold 0 should predict '>50K' for every row"
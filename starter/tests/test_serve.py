@@ -0,0 +1,63 @@
+"""
+Unit tests for the multi-worker entry point.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+import serve
+
+
+def test_plan_workers_splits_cpus():
+    """Test that threads per worker never oversubscribe the CPUs."""
+    assert serve.plan_workers(8) == (8, 1), "Default should be one single-threaded worker per CPU"
+    assert serve.plan_workers(8, workers=2) == (2, 4), "Fewer workers should get more threads"
+    assert serve.plan_workers(2, workers=4) == (4, 1), "Threads should never drop below one"
+    with pytest.raises(ValueError):
+        serve.plan_workers(4, workers=-1)
+
+
+def test_pin_threads_keeps_explicit_settings():
+    """Test that thread limits are set without overriding the environment."""
+    environ = {"OMP_NUM_THREADS": "3"}
+
+    serve.pin_threads(2, environ)
+
+    assert environ["OMP_NUM_THREADS"] == "3", "Explicit settings should be kept"
+    assert environ["LOKY_MAX_CPU_COUNT"] == "2", "joblib should be capped to the worker's CPUs"
+    assert environ["INFERENCE_WORKERS"] == "2", "The inference pool should match the worker's CPUs"
+
+
+def test_available_cpus_is_positive():
+    """Test that the CPU count is usable for sizing."""
+    assert 1 <= serve.available_cpus() <= (os.cpu_count() or 1), "CPU count should be within the host's"
+
+
+def test_restart_limiter_backs_off_and_caps_restarts():
+    """Test that restarts back off exponentially and are capped within the window."""
+    now = [0.0]
+    limiter = serve.RestartLimiter(max_restarts=3, window=10.0, backoff=1.0, max_backoff=3.0, clock=lambda: now[0])
+
+    assert [limiter.next_delay() for _ in range(3)] == [1.0, 2.0, 3.0], "Delays should double up to the maximum"
+    assert limiter.next_delay() is None, "The restart after the cap should be refused"
+
+    now[0] = 10.0
+    assert limiter.next_delay() == 1.0, "Restarts older than the window should no longer count"
+    with pytest.raises(ValueError):
+        serve.RestartLimiter(window=0)
+
+
+def test_serve_exits_non_zero_when_workers_keep_crashing(monkeypatch):
+    """Test that a crash-looping worker stops the server instead of restarting forever."""
+    def crash(app, sock, index, log_level):
+        os._exit(3)
+
+    monkeypatch.setattr(serve, "_run_worker", crash)
+    limiter = serve.RestartLimiter(max_restarts=4, window=60.0, backoff=0.01, max_backoff=0.02)
+
+    assert serve.serve(None, "127.0.0.1", 0, workers=2, limiter=limiter) == 1, "Hitting the cap should fail"
+    assert limiter.next_delay() is None, "Every allowed restart should have been used"
@@ -0,0 +1,516 @@
+"""
+Unit tests for the serving helpers used by the FastAPI application.
+"""
+
+import asyncio
+import json
+import shutil
+import sys
+import os
+import threading
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'starter'))
+
+import numpy as np
+import pytest
+
+import main
+from ml.dataset import CATEGORICAL_FEATURES, CONTINUOUS_FEATURES
+from serving.batching import MicroBatcher
+from serving.cache import PredictionCache, artifact_fingerprint, record_key
+from serving.codecs import ARROW, JSON, MSGPACK, media_type, negotiate
+from serving.compression import CompressionMiddleware, choose_encoding, response_encodings
+from serving.executor import ExecutorSaturated, InferenceExecutor
+from serving.metrics import Counter, Histogram, MetricsRegistry, StageTimer
+from serving.predictor import Predictor, write_variant_source
+from serving.registry import ModelRegistry
+from tests import test_api
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
+
+
+def copy_model_version(root, name):
+    """Copy the trained artifacts into root/versions/name."""
+    path = os.path.join(str(root), "versions", name)
+    shutil.copytree(MODEL_DIR, path, ignore=shutil.ignore_patterns("versions"))
+    return path
+
+
+def make_registry(root, on_swap=None):
+    """Registry over `root` that validates versions with the API's smoke record."""
+    return ModelRegistry(
+        str(root),
+        load_fn=lambda path: Predictor.from_dir(path, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES),
+        smoke_records=[main.SMOKE_RECORD],
+        on_swap=on_swap
+    )
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    """Test that concurrent submissions are processed in a single batch."""
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=16, window_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    results = asyncio.run(run())
+
+    assert results == [0, 2, 4, 6, 8], "Each caller should get its own result"
+    assert calls == [[0, 1, 2, 3, 4]], "Concurrent requests should share one batch"
+
+
+def test_micro_batcher_respects_max_batch_size():
+    """Test that batches never exceed max_batch_size."""
+    calls = []
+
+    def batch_fn(items):
+        calls.append(len(items))
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=3, window_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    results = asyncio.run(run())
+
+    assert results == list(range(7)), "Results should be returned in submission order"
+    assert max(calls) <= 3, "Batches should not exceed max_batch_size"
+    assert sum(calls) == 7, "Every item should be processed exactly once"
+
+
+def test_micro_batcher_propagates_errors():
+    """Test that a failing batch raises in every waiting caller."""
+    def batch_fn(items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, window_ms=1)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(2)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, RuntimeError) for r in results), \
+        "Every caller should receive the batch error"
+
+
+def test_micro_batcher_rejects_invalid_configuration():
+    """Test that invalid batch sizes and windows are rejected."""
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch_size=0)
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, window_ms=-1)
+
+
+class SlowPredictor:
+    """Minimal stand-in for Predictor whose calls block on an event."""
+
+    model_dir = None
+    categorical_features = []
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def echo(self, value):
+        self.release.wait(timeout=5)
+        return value
+
+
+def test_inference_executor_runs_in_thread_pool():
+    """Test that the thread backend returns the predictor's result."""
+    predictor = SlowPredictor()
+    predictor.release.set()
+    executor = InferenceExecutor(predictor, backend="thread", max_workers=2)
+
+    try:
+        result = asyncio.run(executor.call("echo", 42))
+    finally:
+        executor.shutdown()
+
+    assert result == 42, "Thread backend should return the method's result"
+    assert executor.pending == 0, "No call should remain pending"
+
+
+def test_inference_executor_rejects_when_saturated():
+    """Test that calls beyond max_pending raise ExecutorSaturated."""
+    predictor = SlowPredictor()
+    executor = InferenceExecutor(predictor, backend="thread", max_workers=1, max_pending=2)
+
+    async def run():
+        first = asyncio.ensure_future(executor.call("echo", 1))
+        second = asyncio.ensure_future(executor.call("echo", 2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await executor.call("echo", 3)
+        predictor.release.set()
+        return await asyncio.gather(first, second)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert results == [1, 2], "Accepted calls should still complete"
+
+
+def test_inference_executor_process_backend_loads_model():
+    """Test that the process backend scores with its own copy of the model."""
+    model_dir = os.path.join(os.path.dirname(__file__), '..', 'model')
+    predictor = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES)
+    executor = InferenceExecutor(predictor, backend="process", max_workers=1)
+    record = {**test_api.LOW_INCOME_RECORD}
+
+    try:
+        result = asyncio.run(executor.call("predict_records", [record]))
+    finally:
+        executor.shutdown()
+
+    assert list(result) == list(predictor.predict_records([record])), \
+        "Process backend should match in-process predictions"
+
+
+def test_inference_executor_rejects_unknown_backend():
+    """Test that invalid backends are rejected."""
+    with pytest.raises(ValueError):
+        InferenceExecutor(SlowPredictor(), backend="gpu")
+
+
+def test_record_key_is_canonical():
+    """Test that record keys ignore key order but not values."""
+    record = dict(test_api.LOW_INCOME_RECORD)
+    reordered = dict(reversed(list(record.items())))
+    changed = {**record, "age": 26}
+
+    assert record_key(record) == record_key(reordered), "Key order should not matter"
+    assert record_key(record) != record_key(changed), "Different values should differ"
+
+
+def test_prediction_cache_evicts_least_recently_used():
+    """Test LRU eviction and the hit/miss/eviction counters."""
+    cache = PredictionCache(maxsize=2)
+    cache.set("a", "<=50K")
+    cache.set("b", ">50K")
+    assert cache.get("a")[0] == "<=50K", "Stored value should be returned"
+    cache.set("c", "<=50K")
+
+    assert cache.get("b")[0] is None, "Least recently used entry should be evicted"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1), \
+        f"Unexpected counters {stats}"
+
+
+def test_prediction_cache_expires_entries():
+    """Test that entries expire after the TTL."""
+    cache = PredictionCache(maxsize=10, ttl=0.01)
+    cache.set("a", "<=50K")
+    time.sleep(0.02)
+
+    assert cache.get("a")[0] is None, "Expired entries should be misses"
+
+
+def test_prediction_cache_invalidates_on_artifact_change():
+    """Test that changing the artifact fingerprint clears the cache."""
+    fingerprint = ["v1"]
+    cache = PredictionCache(maxsize=10, fingerprint_fn=lambda: fingerprint[0], check_interval=0)
+    cache.set("a", "<=50K")
+    fingerprint[0] = "v2"
+
+    assert cache.get("a")[0] is None, "Entries should be dropped when artifacts change"
+    assert cache.stats()["invalidations"] == 1, "Invalidation should be counted"
+
+
+def test_prediction_cache_skips_values_from_previous_model():
+    """Test that a value computed before a model swap is not cached under the new version."""
+    fingerprint = ["v1"]
+    cache = PredictionCache(maxsize=10, fingerprint_fn=lambda: fingerprint[0], check_interval=0)
+    value, seen = cache.get("a")
+    assert value is None and seen == "v1"
+
+    fingerprint[0] = "v2"  # swapped while the miss was being scored
+    assert not cache.set("a", "<=50K", seen), "A value from the previous model should not be stored"
+    assert cache.get("a")[0] is None, "The new version should not serve it"
+
+    value, seen = cache.get("a")
+    assert cache.set("a", ">50K", seen), "A value from the active model should be stored"
+    assert cache.get("a")[0] == ">50K"
+
+
+def test_artifact_fingerprint_tracks_files(tmp_path):
+    """Test that rewriting an artifact changes the fingerprint."""
+    artifact = tmp_path / "model.pkl"
+    artifact.write_bytes(b"one")
+    before = artifact_fingerprint(str(tmp_path))
+    artifact.write_bytes(b"three")
+
+    assert artifact_fingerprint(str(tmp_path)) != before, "Fingerprint should change"
+
+
+def test_metrics_registry_renders_text_format():
+    """Test counters and cumulative histogram buckets in the exposition format."""
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("hits_total", "Hits", ("path",)))
+    histogram = registry.register(Histogram("size", "Sizes", buckets=(1.0, 10.0)))
+    counter.inc("/a")
+    counter.inc("/a", amount=2)
+    for value in (0.5, 5.0, 50.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert 'hits_total{path="/a"} 3.0' in lines, "Counter increments should add up"
+    assert lines[-5:] == [
+        'size_bucket{le="1.0"} 1',
+        'size_bucket{le="10.0"} 2',
+        'size_bucket{le="+Inf"} 3',
+        'size_sum 55.5',
+        'size_count 3',
+    ], "Histogram buckets should be cumulative"
+
+
+def test_stage_timer_records_predictor_stages():
+    """Test that a timer passed to the predictor receives every pipeline stage."""
+    predictor = Predictor.from_dir(MODEL_DIR, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES)
+    timer = StageTimer()
+    predictor.score_records([main.SMOKE_RECORD], timer=timer)
+
+    assert {"encode", "model", "decode"} <= set(timer.durations), f"Missing stages in {timer.durations}"
+    assert timer.server_timing().count("dur=") == len(timer.durations), \
+        "Every stage should appear in the Server-Timing value"
+
+
+def test_predictor_parallelism_depends_on_batch_size():
+    """Test that small and large calls use separately configured n_jobs."""
+    predictor = Predictor.from_dir(MODEL_DIR, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES)
+    expected = predictor.score_records([main.SMOKE_RECORD] * 3)
+
+    predictor.set_parallelism(n_jobs=1, batch_n_jobs=2, batch_min_rows=3)
+
+    assert predictor.model_for(1).n_jobs == 1, "Small calls should use n_jobs"
+    assert predictor.model_for(3).n_jobs == 2, "Large calls should use batch_n_jobs"
+    labels, scores = predictor.score_records([main.SMOKE_RECORD] * 3)
+    assert list(labels) == list(expected[0]), "Labels should not depend on n_jobs"
+    assert np.allclose(scores, expected[1]), "Scores should not depend on n_jobs"
+
+
+def test_predictor_compiled_format_matches_pickle():
+    """Test that the compiled model gives the same scores as the pickle."""
+    model_dir = os.path.join(os.path.dirname(__file__), '..', 'model')
+    rows = [test_api.LOW_INCOME_RECORD, test_api.HIGH_INCOME_RECORD]
+    pickled = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, "pickle")
+    compiled = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, "compiled")
+
+    labels, scores = pickled.score_records(rows)
+    compiled_labels, compiled_scores = compiled.score_records(rows)
+
+    np.testing.assert_array_equal(compiled_labels, labels)
+    np.testing.assert_allclose(compiled_scores, scores, rtol=0, atol=1e-12)
+
+
+def test_predictor_compact_variant(tmp_path):
+    """Test that the compact variant loads model_compact.pkl and forest_compact/ in both formats."""
+    from ml.compress import compress_forest
+    from ml.forest import compile_forest, save_compiled_forest
+    from ml.model import save_model
+
+    model_dir = copy_model_version(tmp_path, "v1")
+    full = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES)
+    compact_model = compress_forest(full.model, None, max_depth=4)
+    save_model(compact_model, os.path.join(model_dir, "model_compact.pkl"))
+    save_compiled_forest(compile_forest(compact_model), os.path.join(model_dir, "forest_compact"))
+    write_variant_source(model_dir, "compact")
+    rows = [test_api.LOW_INCOME_RECORD, test_api.HIGH_INCOME_RECORD]
+
+    pickled = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, "pickle", "compact")
+    compiled = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, "compiled", "compact")
+
+    assert pickled.model_variant == "compact"
+    assert max(estimator.tree_.max_depth for estimator in pickled.model.estimators_) <= 4
+    assert compiled.model.max_depth <= 4
+    np.testing.assert_allclose(compiled.score_records(rows)[1], pickled.score_records(rows)[1], rtol=0, atol=1e-12)
+    with pytest.raises(ValueError):
+        Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, variant="tiny")
+
+    # Retraining replaces model.pkl, which makes the compact model stale
+    save_model(compress_forest(full.model, None, max_depth=6), os.path.join(model_dir, "model.pkl"))
+    fallback = Predictor.from_dir(model_dir, CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, "compiled", "compact")
+    assert fallback.model_variant == "full", "A stale compact model should not be served"
+    plain_dir = copy_model_version(tmp_path, "v2")
+    assert Predictor.from_dir(plain_dir, CATEGORICAL_FEATURES, variant="compact").model_variant == "full", \
+        "A directory without a compact model should serve the full one"
+
+
+def test_inference_executor_swap_process_backend(tmp_path):
+    """Test that swapping predictors restarts the process pool on the new artifacts."""
+    predictor = Predictor.from_dir(MODEL_DIR, CATEGORICAL_FEATURES)
+    other = Predictor.from_dir(copy_model_version(tmp_path, "v2"), CATEGORICAL_FEATURES)
+    executor = InferenceExecutor(predictor, backend="process", max_workers=1)
+    record = {**test_api.LOW_INCOME_RECORD}
+
+    try:
+        before = asyncio.run(executor.call("predict_records", [record]))
+        executor.swap(other)
+        after = asyncio.run(executor.call("predict_records", [record]))
+    finally:
+        executor.shutdown()
+
+    assert executor.predictor is other, "New calls should use the new predictor"
+    assert list(after) == list(before), "Both versions hold the same model"
+
+
+def test_model_registry_swaps_in_stable_new_version(tmp_path):
+    """Test that a new version is activated once stable, and can be rolled back."""
+    copy_model_version(tmp_path, "v1")
+    swapped = []
+    registry = make_registry(tmp_path, on_swap=swapped.append)
+    registry.load_latest()
+    first = registry.version
+
+    copy_model_version(tmp_path, "v2")
+
+    assert not registry.refresh(), "A version seen only once may still be written"
+    assert registry.refresh(), "A stable new version should be activated"
+    assert registry.active.name == "v2", "The newest version should be active"
+    assert swapped[-1] is registry.predictor, "on_swap should get the new predictor"
+
+    previous = registry.rollback()
+
+    assert previous.version == first, "Rollback should re-activate the previous version"
+    assert not registry.refresh(), "A rolled-back version should not be re-activated"
+    assert registry.status()["available"] == ["v1", "v2"]
+
+
+def test_model_registry_tracks_compact_variant(tmp_path):
+    """Test that rewriting the compact model in place makes a new version."""
+    from ml.compress import compress_forest
+    from ml.model import save_model
+
+    path = copy_model_version(tmp_path, "v1")
+    registry = make_registry(tmp_path)
+    registry.load_latest()
+    first = registry.version
+    model = registry.predictor.model
+
+    save_model(compress_forest(model, None, max_depth=4), os.path.join(path, "model_compact.pkl"))
+    assert not registry.refresh()
+    assert registry.refresh(), "A new compact model should be picked up"
+    second = registry.version
+
+    save_model(compress_forest(model, None, max_depth=3), os.path.join(path, "model_compact.pkl"))
+    registry.refresh()
+    assert registry.refresh(), "Rewriting the compact model should be picked up"
+    assert len({first, second, registry.version}) == 3, "Each rewrite should change the version"
+
+
+def test_model_registry_keeps_active_version_on_failed_load(tmp_path):
+    """Test that a broken version is rejected and the active one kept."""
+    copy_model_version(tmp_path, "v1")
+    registry = make_registry(tmp_path)
+    registry.load_latest()
+    broken = copy_model_version(tmp_path, "v2")
+    with open(os.path.join(broken, "model.pkl"), "wb") as f:
+        f.write(b"not a pickle")
+
+    registry.refresh()
+
+    assert not registry.refresh(), "A broken version should not be activated"
+    assert registry.active.name == "v1", "The previous version should stay active"
+    assert any(version.startswith("v2@") for version in registry.failed), "The failure should be recorded"
+
+
+def test_negotiate_prefers_highest_quality_known_type():
+    """Test Accept header negotiation of the response format."""
+    assert negotiate(None) == JSON, "No Accept header should select JSON"
+    assert negotiate("text/html, application/msgpack") == MSGPACK, "Unknown types should be skipped"
+    assert negotiate("application/json;q=0.5, application/vnd.apache.arrow.stream") == ARROW, \
+        "The highest q-value should win"
+    assert media_type("application/json; charset=utf-8") == JSON, "Parameters should be ignored"
+    assert media_type("text/csv") is None, "Unknown request types should be reported"
+
+
+def test_choose_encoding_follows_accept_encoding():
+    """Test response encoding negotiation."""
+    preferred = "zstd" if "zstd" in response_encodings() else "gzip"
+
+    assert choose_encoding(None) is None, "No header should disable compression"
+    assert choose_encoding("identity") is None, "Identity should disable compression"
+    assert choose_encoding("gzip;q=0.5, br") == "gzip", "Unsupported encodings should be skipped"
+    assert choose_encoding("gzip, zstd") == preferred, "zstd should win ties when available"
+    assert choose_encoding("*, gzip;q=0") == ("zstd" if preferred == "zstd" else None), \
+        "q=0 should exclude an encoding"
+
+
+def test_compression_middleware_decompresses_zstd_bodies():
+    """Test zstd request bodies and responses when zstandard is installed."""
+    zstandard = pytest.importorskip("zstandard")
+    records = [test_api.LOW_INCOME_RECORD] * 300
+    body = zstandard.ZstdCompressor().compress(json.dumps({"records": records}).encode())
+
+    response = test_api.client.post(
+        "/predict/batch",
+        content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "zstd", "Accept-Encoding": "zstd"}
+    )
+
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}"
+    assert response.headers["content-encoding"] == "zstd", "zstd should be negotiated"
+    assert len(response.json()["predictions"]) == 300, "Every row should be scored"
+
+
+def post_to_middleware(middleware, body, encoding):
+    """Send one compressed request through an ASGI middleware; return its status and peak traced memory."""
+    messages = [{"type": "http.request", "body": body[i:i + 65536], "more_body": i + 65536 < len(body)}
+                for i in range(0, len(body), 65536)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-encoding", encoding.encode())]}
+    tracemalloc.start()
+    try:
+        asyncio.run(middleware(scope, receive, send))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return sent[0]["status"], peak
+
+
+def expanding_body(encoding, size=256 * 2 ** 20):
+    """A body of `size` zero bytes, compressed a megabyte at a time."""
+    if encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    block = bytes(2 ** 20)
+    return b"".join(compressor.compress(block) for _ in range(size // len(block))) + compressor.flush()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compression_middleware_bounds_decompression(encoding):
+    """Test that a small body expanding far beyond the limit is rejected without being expanded."""
+    async def app(scope, receive, send):
+        raise AssertionError("The body should be rejected before reaching the app")
+
+    body = expanding_body(encoding)
+    status, peak = post_to_middleware(CompressionMiddleware(app, max_body_size=2 ** 20), body, encoding)
+
+    assert len(body) < 2 ** 20, "The compressed body itself should fit the limit"
+    assert status == 413, f"Expected status 413, got {status}"
+    assert peak < 16 * 2 ** 20, f"Decompression should stop near the limit, peaked at {peak} bytes"